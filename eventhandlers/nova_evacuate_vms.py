@@ -23,13 +23,30 @@
 #
 
 import argparse
+import fcntl
+import json
+import os
 import sys
 import syslog
 from datetime import datetime
 from datetime import timedelta
 import time
+from novaclient import exceptions as nova_exceptions
 from novaclient.v1_1 import client as nclient
 
+# Shared helpers live with the plugins: ../plugins in the source tree, and
+# .. once installed in the nagios plugins directory.
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.extend([os.path.join(_here, '..', 'plugins'),
+                 os.path.join(_here, '..')])
+import httptrace
+import placement
+from evacuation_journal import EvacuationJournal
+from evacuation_journal import JournalBusy
+from inventory import InventoryStore
+from inventory import Record
+from utils import ensure_dir
+
 syslog.openlog('nagios-nova-evacuate', 0, syslog.LOG_USER)
 
 
@@ -38,101 +55,226 @@ UP = 0
 DOWN = 1
 UNREACHABLE = 2
 
+HOST_ATTR = 'OS-EXT-SRV-ATTR:hypervisor_hostname'
 
-# Argument parsing, as given by Nagios
-parser = argparse.ArgumentParser(description='Evacuate VMs from compute node')
-parser.add_argument('--auth_url', metavar='URL', type=str, required=True,
-                    help='Endpoint to the keystone service')
-parser.add_argument('--username', metavar='username', type=str, required=True,
-                    help='username to use for authentication')
-parser.add_argument('--password', metavar='password', type=str, required=True,
-                    help='password to use for authentication')
-parser.add_argument('--tenant', metavar='tenant', type=str, required=True,
-                    help='tenant name to use for authentication')
-parser.add_argument('--region_name', metavar='region_name', type=str,
-                    required=True, help='Region to select for authentication')
-parser.add_argument('--ca-cert', metavar='ca_cert', type=str,
-                    help='Location of CA validation cert')
-parser.add_argument('--insecure', action='store_true', default=False,
-                    help='Do not perform certificate validation')
-parser.add_argument('--unreachable-is-down', action='store_true',
-                    default=False,
-                    help='True if we trigger evacuate on node unreachable')
-parser.add_argument('--wait-timeout', metavar='wait_timeout', default=10,
-                    help='Time (in seconds) to wait for a successful '
-                    'evacuation before reporting failure')
-parser.add_argument('compute_host', metavar='compute_host', type=str,
-                    help='Hostname of the compute node to evacuate')
-parser.add_argument('state', metavar='state', type=str,
-                    help='Current state of probe (UP, DOWN, UNREACHEABLE)')
-parser.add_argument('state_type', metavar='state_type', type=str,
-                    help='Current state type of probe (HARD, SOFT)')
-
-args = parser.parse_args()
-
-# By default unreachable does not trigger evacuate, but it's configurable
-down_states = [DOWN]
-if args.unreachable_is_down:
-    down_states.append(UNREACHABLE)
-
-
-# Is the state DOWN, and the state type HARD? Otherwise we do nothing for now.
-if args.state_type != 'HARD' and args.state not in down_states:
-    syslog.syslog("%s down, but probe not in HARD state yet (not running)" %
-                  args.compute_host)
-    sys.exit(0)
-
-syslog.syslog("%s DOWN and probe in HARD state, evacuating VMs" %
-              args.compute_host)
-
-# Get a nova client object (it takes care of keystone auth too)
-try:
-    nova = nclient.Client(args.username, args.password, args.tenant,
-                          auth_url=args.auth_url, insecure=args.insecure,
-                          region_name=args.region_name)
-except Exception as e:
-    syslog.syslog(syslog.LOG_ERR, "Failed to authenticate to keystone: %s" %
-                  str(e))
-    sys.exit(-1)
-
-# Check nova-compute is marked down for the compute host
-for binary in ['nova-compute']:
+
+def collect_args():
+    # Argument parsing, as given by Nagios
+    parser = argparse.ArgumentParser(
+        description='Evacuate VMs from compute node')
+    parser.add_argument('--auth_url', metavar='URL', type=str, required=True,
+                        help='Endpoint to the keystone service')
+    parser.add_argument('--username', metavar='username', type=str,
+                        required=True,
+                        help='username to use for authentication')
+    parser.add_argument('--password', metavar='password', type=str,
+                        required=True,
+                        help='password to use for authentication')
+    parser.add_argument('--tenant', metavar='tenant', type=str, required=True,
+                        help='tenant name to use for authentication')
+    parser.add_argument('--region_name', metavar='region_name', type=str,
+                        required=True,
+                        help='Region to select for authentication')
+    parser.add_argument('--ca-cert', metavar='ca_cert', type=str,
+                        help='Location of CA validation cert')
+    parser.add_argument('--insecure', action='store_true', default=False,
+                        help='Do not perform certificate validation')
+    parser.add_argument('--unreachable-is-down', action='store_true',
+                        default=False,
+                        help='True if we trigger evacuate on node unreachable')
+    parser.add_argument('--wait-timeout', metavar='wait_timeout', type=int,
+                        default=10,
+                        help='Time (in seconds) to wait for a successful '
+                        'evacuation before reporting failure')
+    parser.add_argument('--plan-dir', metavar='plan_dir', type=str,
+                        help='Directory of the evacuation plans kept by '
+                        'nova_evacuation_planner.py')
+    parser.add_argument('--plan-max-age', metavar='seconds', type=int,
+                        default=3600,
+                        help='Ignore plans older than this (default 3600)')
+    parser.add_argument('--inventory', metavar='path', type=str,
+                        help='SQLite inventory of the cloud (see '
+                        'plugins/inventory.py), refreshed incrementally '
+                        'instead of listing every server for each VM')
+    parser.add_argument('--journal-dir', metavar='path', type=str,
+                        help='Directory to journal evacuations in, so a '
+                        're-run resumes instead of starting over')
+    parser.add_argument('--journal-max-age', metavar='seconds', type=int,
+                        default=86400,
+                        help='Start a new journal when the last one is '
+                        'older than this (default 86400)')
+    parser.add_argument('--detach', action='store_true', default=False,
+                        help='Return straight away, leaving the evacuation '
+                        'to a background process (needs --journal-dir, '
+                        'see check_nova_evacuation.py)')
+    parser.add_argument('--coalesce-dir', metavar='path', type=str,
+                        help='Directory shared by the handlers of all hosts. '
+                        'Failures within --coalesce-window of each other '
+                        'are evacuated together, by a single handler, with '
+                        'one plan')
+    parser.add_argument('--coalesce-window', metavar='seconds', type=int,
+                        default=10,
+                        help='Time to wait for other hosts to fail before '
+                        'planning (default 10)')
+    parser.add_argument('--cpu-ratio', metavar='ratio', type=float,
+                        default=16.0,
+                        help='vCPU overcommit ratio used when planning '
+                        'several hosts at once, and checking precomputed '
+                        'plans (default 16)')
+    parser.add_argument('--ram-ratio', metavar='ratio', type=float,
+                        default=1.5,
+                        help='RAM overcommit ratio used when planning '
+                        'several hosts at once, and checking precomputed '
+                        'plans (default 1.5)')
+    httptrace.add_argument(parser)
+    parser.add_argument('compute_host', metavar='compute_host', type=str,
+                        help='Hostname of the compute node to evacuate')
+    parser.add_argument('state', metavar='state', type=str,
+                        help='Current state of probe (UP, DOWN, UNREACHEABLE)')
+    parser.add_argument('state_type', metavar='state_type', type=str,
+                        help='Current state type of probe (HARD, SOFT)')
+    return parser
+
+
+def check_service_down(nova, compute_host):
+    """True if nova-compute is marked down for the compute host."""
+    for binary in ['nova-compute']:
+        try:
+            service_state = nova.services.list(host=compute_host,
+                                               binary=binary)
+
+            if len(service_state) != 1:
+                syslog.syslog(syslog.LOG_ERR, "Got more than one %s on host %s"
+                              % (binary, compute_host))
+                return False
+            if service_state.pop().state != 'down':
+                syslog.syslog(syslog.LOG_ERR, "Nagios says down, but %s is "
+                              "still up in %s when querying nova" %
+                              (binary, compute_host))
+                return False
+        except Exception as e:
+            syslog.syslog(syslog.LOG_ERR, "Failed to list services %s "
+                          "for host %s :: %s" % (binary, compute_host, e))
+            return False
+    return True
+
+
+def down_compute_hosts(nova, hosts):
+    """Those of hosts whose nova-compute is marked down, in one listing."""
+    down = set()
+    for service in nova.services.list(binary='nova-compute'):
+        if service.host in hosts and service.state == 'down':
+            down.add(service.host)
+    for host in hosts:
+        if host not in down:
+            syslog.syslog(syslog.LOG_ERR, "Nagios says down, but nova-compute "
+                          "is not down in %s when querying nova" % host)
+    return [host for host in hosts if host in down]
+
+
+def coalesced_failures(coalesce_dir, compute_host, window):
+    """Yields the batches of failed hosts this handler has to evacuate.
+
+    Every handler registers its host in <coalesce_dir>/pending. Whichever
+    holds the lock waits window seconds for more failures to come in, then
+    takes every registered host; the others leave their host to it and
+    yield nothing. Hosts registered while the lock was held are looked for
+    again once it is released, so none is left behind.
+    """
+    pending = os.path.join(coalesce_dir, 'pending')
+    ensure_dir(pending)
+    open(os.path.join(pending, compute_host), 'a').close()
+
+    lock = open(os.path.join(coalesce_dir, 'lock'), 'a')
     try:
-        service_state = nova.services.list(host=args.compute_host,
-                                           binary=binary)
+        while True:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                syslog.syslog("Evacuation of %s left to the handler already "
+                              "running" % compute_host)
+                return
+            try:
+                time.sleep(window)
+                hosts = []
+                for host in os.listdir(pending):
+                    os.unlink(os.path.join(pending, host))
+                    hosts.append(host)
+                if hosts:
+                    yield sorted(hosts)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            if not os.listdir(pending):
+                return
+    finally:
+        lock.close()
 
-        if len(service_state) != 1:
-            syslog.syslog(syslog.LOG_ERR, "Got more than one %s on host %s" %
-                          (binary, args.compute_host))
-            sys.exit(-1)
-        if service_state.pop().state != 'down':
-            syslog.syslog(syslog.LOG_ERR, "Nagios says down, but %s is still "
-                          "up in %s when querying nova" %
-                          (binary, args.compute_host))
-            sys.exit(-1)
-    except Exception as e:
-        syslog.syslog(syslog.LOG_ERR, "Failed to list services %s "
-                      "for host %s :: %s" % (binary, args.compute_host, e))
-        sys.exit(-1)
+
+def plan_path(plan_dir, compute_host):
+    return os.path.join(plan_dir, '%s.json' % compute_host)
+
+
+def load_plan(plan_dir, compute_host, max_age):
+    """Returns the precomputed {vm id: target} for compute_host, if fresh."""
+    try:
+        with open(plan_path(plan_dir, compute_host)) as f:
+            plan = json.load(f)
+    except (IOError, ValueError) as e:
+        syslog.syslog(syslog.LOG_WARNING, "No usable evacuation plan for %s "
+                      ":: %s" % (compute_host, e))
+        return {}
+    age = time.time() - plan['generated']
+    if age > max_age:
+        syslog.syslog(syslog.LOG_WARNING, "Evacuation plan for %s is %ds old, "
+                      "ignoring it" % (compute_host, age))
+        return {}
+    return plan['targets']
 
 
-# List VMs associated to that compute node which to be evacuated
-try:
-    vms = nova.servers.list(search_opts={'host': args.compute_host})
-except Exception as e:
-    syslog.syslog(syslog.LOG_ERR, "Failed to list VMs for host %s :: %s" %
-                  (args.compute_host, e))
-    sys.exit(-1)
+def validate_plan(nova, targets, vms, cpu_ratio, ram_ratio):
+    """Drops the planned targets which are no longer usable.
 
+    A target must still be up and enabled, and have room left for the VMs
+    planned onto it, since the plan was made from older usage. Only the
+    planned VMs among vms, those still to evacuate, are checked; those
+    without a flavor (resumed from the journal) are looked up, and dropped
+    if they were deleted meanwhile.
+    """
+    free = {}
+    for host in nova.hypervisors.list():
+        # Without a state or status we can't tell, so don't risk it
+        if getattr(host, 'state', None) == 'up' and \
+                getattr(host, 'status', None) == 'enabled':
+            free[host.hypervisor_hostname] = [
+                host.vcpus * cpu_ratio - host.vcpus_used,
+                host.memory_mb * ram_ratio - host.memory_mb_used]
 
-# Get flavor info
-flavors_list = nova.flavors.list()
-flavors = {}
-for flavor in flavors_list:
-    flavors[flavor.id] = flavor
+    flavors = {}
+    valid = {}
+    for vm in sorted(vms, key=lambda vm: vm.id):
+        target = targets.get(vm.id)
+        if target not in free:
+            continue
+        if not getattr(vm, 'flavor', None):
+            try:
+                vm = nova.servers.get(vm.id)
+            except nova_exceptions.NotFound:
+                continue
+        flavor_id = vm.flavor['id']
+        if flavor_id not in flavors:
+            flavors[flavor_id] = nova.flavors.get(flavor_id)
+        flavor = flavors[flavor_id]
+        room = free[target]
+        if room[0] < flavor.vcpus or room[1] < flavor.ram:
+            continue
+        room[0] -= flavor.vcpus
+        room[1] -= flavor.ram
+        valid[vm.id] = target
+    return valid
 
 
-def _get_target_host(vm):
+def _get_target_host(nova, vm, flavors, compute_host, inventory=None,
+                     moved=None):
     """Two steps to get an available host:
     1. Check if the host is alive
     2. Check the vcpu and memory (act as scheduler)
@@ -142,16 +284,29 @@ def _get_target_host(vm):
     https://blueprints.launchpad.net/nova/+spec/instance-group-api-extension
     [2] From Juno, Nova evacuate can use nova scheduler to get host. see:
     github.com/openstack/nova/commit/d5a70de4793a1e44056c55121505edc63fd36969
+
+    Given an InventoryStore, servers, hypervisors and server groups are
+    looked up there rather than listed from nova. moved maps the VMs sent
+    elsewhere earlier in this run to their target, which the inventory
+    doesn't know yet.
     """
+    moved = moved or {}
     try:
-        host_attr = 'OS-EXT-SRV-ATTR:hypervisor_hostname'
+        host_attr = HOST_ATTR
 
-        vms = {}
-        for i in nova.servers.list():
-            vms[i.id] = i
+        if inventory is not None:
+            vms = inventory
+            hypervisors = inventory.hypervisors()
+            groups = inventory.server_groups_of(vm.id)
+        else:
+            vms = {}
+            for i in nova.servers.list():
+                vms[i.id] = i
+            hypervisors = nova.hypervisors.list()
+            groups = nova.server_groups.list()
 
         targets = {}
-        for host in nova.hypervisors.list():
+        for host in hypervisors:
             # 1. Make sure it's alive
             if host.state != 'up':
                 continue
@@ -162,7 +317,7 @@ def _get_target_host(vm):
             else:
                 targets[host.hypervisor_hostname] = host
         # 3. Make sure it respects the affinity/anti-affinity rule
-        for group in nova.server_groups.list():
+        for group in groups:
             if vm.id not in group.members:
                 continue
             else:
@@ -176,7 +331,8 @@ def _get_target_host(vm):
                     vcpus = 0
                     memory = 0
                     for m in group.members:
-                        hostname = vms[m].__dict__[host_attr]
+                        hostname = moved[m] if m in moved else \
+                            vms[m].__dict__[host_attr]
                         current_host_group.add(hostname)
                         vcpus += flavors[vms[m].flavor['id']].vcpus
                         memory += flavors[vms[m].flavor['id']].ram
@@ -185,7 +341,7 @@ def _get_target_host(vm):
                         # This means at least one VM has been evacuated from
                         # the broken host to a new host.
                         return (current_host_group -
-                                set([args.compute_host])).pop()
+                                set([compute_host])).pop()
                     elif len(current_host_group) == 1:
                         # This is the first VM of the server group being
                         # evacuate to other host. In other words, all the
@@ -198,13 +354,14 @@ def _get_target_host(vm):
                     # members
                     anti_affinity_host_group = []
                     for m in group.members:
-                        hostname = vms[m].__dict__[host_attr]
+                        hostname = moved[m] if m in moved else \
+                            vms[m].__dict__[host_attr]
                         anti_affinity_host_group.append(hostname)
 
                     for hypervisor_name, _ in targets.iteritems():
                         if hypervisor_name not in anti_affinity_host_group:
                             return hypervisor_name
-                   
+
                     return None
                 break
     except Exception as e:
@@ -213,42 +370,414 @@ def _get_target_host(vm):
         return None
 
     # If no affinity associated with the VM, just return the first host
-    return None if not targets else targets.keys()[0] 
-
-
-# Trigger evacuation for each VM
-# We collect the results to build a final report
-results = {'success': [], 'failures': []}
-for vm in vms:
-    target = _get_target_host(vm)
-    if not target:
-        results['failures'].append((vm.name, 'Failed to get a host.'))
-        syslog.syslog("Failed to get a host for '%s'" % vm.name)
-        continue
-    syslog.syslog("Evacuating '%s' to compute host '%s'" % (vm.name, target))
-    try:
-        success = False
-        vm.evacuate(target, True)
-        # wait for ACTIVE, or give up after 30 seconds
-        start = datetime.now()
+    return None if not targets else targets.keys()[0]
+
+
+def wait_active(nova, vm, wait_timeout):
+    """Polls vm until it is ACTIVE or wait_timeout seconds have passed.
+
+    Returns the status it was last seen in.
+    """
+    start = datetime.now()
+    cvm = nova.servers.list(search_opts={'name': vm.name})
+    while datetime.now() < (start + timedelta(seconds=wait_timeout)):
+        if cvm[0].status == 'ACTIVE':
+            break
+        time.sleep(3)
         cvm = nova.servers.list(search_opts={'name': vm.name})
-        while datetime.now() < (start + timedelta(seconds=args.wait_timeout)):
-            if cvm[0].status == 'ACTIVE':
+    return cvm[0].status
+
+
+def evacuate_vms(nova, vms, get_target, wait_timeout, journal=None,
+                 on_active=None):
+    """Evacuates each VM to get_target(vm), waiting for it to be ACTIVE.
+
+    We collect the results to build a final report. Given an
+    EvacuationJournal, every step is recorded in it, and the VMs it has
+    already seen ACTIVE are skipped; those evacuate was already called for
+    are only waited for. on_active(vm, target) is called for each VM seen
+    ACTIVE on its target.
+    """
+    results = {'success': [], 'failures': []}
+    for vm in vms:
+        if journal is not None and journal.done(vm.id):
+            results['success'].append((vm.name, journal.vms[vm.id]['target']))
+            continue
+        try:
+            if journal is not None and journal.in_flight(vm.id):
+                target = journal.vms[vm.id]['target']
+                syslog.syslog("'%s' already being evacuated to compute host "
+                              "'%s'" % (vm.name, target))
+            else:
+                target = get_target(vm)
+                if not target:
+                    results['failures'].append((vm.name,
+                                                'Failed to get a host.'))
+                    syslog.syslog("Failed to get a host for '%s'" % vm.name)
+                    if journal is not None:
+                        journal.record(vm.id, name=vm.name, target=None,
+                                       error='Failed to get a host.')
+                        journal.write_status()
+                    continue
+                syslog.syslog("Evacuating '%s' to compute host '%s'" %
+                              (vm.name, target))
+                if journal is not None:
+                    journal.record(vm.id, name=vm.name, target=target)
+                nova.servers.evacuate(vm, target, True)
+                if journal is not None:
+                    journal.record(vm.id, issued=time.time())
+            # wait for ACTIVE, or give up after wait_timeout seconds
+            status = wait_active(nova, vm, wait_timeout)
+            if journal is not None:
+                journal.record(vm.id, status=status, checked=time.time())
+            if status == 'ACTIVE':
                 results['success'].append((vm.name, target))
-                break
-            time.sleep(3)
-            cvm = nova.servers.list(search_opts={'name': vm.name})
-        if cvm[0].status != 'ACTIVE':
-            results['failures'].append((vm.name, "VM is in ERROR or UNKNOWN "
-                                        "status, needs manual migration"))
+                if on_active is not None:
+                    on_active(vm, target)
+            else:
+                results['failures'].append((vm.name, "VM is in ERROR or "
+                                            "UNKNOWN status, needs manual "
+                                            "migration"))
+        except Exception as e:
+            results['failures'].append((vm.name, str(e)))
+            syslog.syslog(syslog.LOG_ERR, "Failed to evacuate vm '%s' :: %s" %
+                          (vm.name, e))
+            if journal is not None:
+                journal.record(vm.id, error=str(e))
+        if journal is not None:
+            journal.write_status()
+    if journal is not None:
+        journal.write_status(finished=True)
+    return results
+
+
+def absolute_paths(args):
+    """Makes the paths given on the command line absolute, as detach()
+    moves to / and the tracer only writes at exit."""
+    for option in ('plan_dir', 'inventory', 'journal_dir', 'coalesce_dir',
+                   'trace'):
+        path = getattr(args, option)
+        if path and path != 'syslog':
+            setattr(args, option, os.path.abspath(path))
+
+
+def detach():
+    """Carries on in a daemon, the calling process exiting straight away.
+
+    Forking twice (with a new session in between) means nagios neither
+    waits for the evacuation, nor has to reap the process doing it.
+    """
+    pid = os.fork()
+    if pid > 0:
+        os.waitpid(pid, 0)
+        os._exit(0)
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+    os.chdir('/')
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+
+
+def open_inventory(nova, args):
+    """The refreshed InventoryStore given by --inventory, if any."""
+    if not args.inventory:
+        return None
+    try:
+        inventory = InventoryStore(args.inventory)
+        changed = inventory.refresh(nova)
+        syslog.syslog("Refreshed inventory %s (%d servers changed)" %
+                      (args.inventory, changed))
+        return inventory
+    except Exception as e:
+        syslog.syslog(syslog.LOG_ERR, "Failed to refresh inventory %s, "
+                      "querying nova instead :: %s" % (args.inventory, e))
+        return None
+
+
+def report(hosts, results):
+    syslog.syslog(syslog.LOG_ERR, "Evacuation of %s :: Successes (%d, %s) :: "
+                  "Failures (%d, %s)" % (", ".join(hosts),
+                                         len(results['success']),
+                                         results['success'],
+                                         len(results['failures']),
+                                         results['failures']))
+
+
+def record_vms(journal, vms, targets):
+    """Records the VMs on the host in its journal, before evacuating them.
+
+    Those the journal saw evacuated are back on the host since, and are
+    recorded as pending again.
+    """
+    for vm in vms:
+        if vm.id not in journal.vms:
+            journal.record(vm.id, name=vm.name, target=targets.get(vm.id))
+        elif journal.done(vm.id):
+            journal.record(vm.id, target=targets.get(vm.id), issued=None,
+                           status=None, error=None)
+
+
+def open_journal(compute_host, args):
+    """The EvacuationJournal of compute_host, if --journal-dir is given.
+
+    Raises JournalBusy if another run is evacuating compute_host.
+    """
+    if not args.journal_dir:
+        return None
+    try:
+        return EvacuationJournal.open(args.journal_dir, compute_host,
+                                      args.journal_max_age)
+    except (IOError, OSError) as e:
+        syslog.syslog(syslog.LOG_ERR, "Failed to open the journal of %s :: %s"
+                      % (compute_host, e))
+        return None
+
+
+def evacuate_host(nova, compute_host, args):
+    """Evacuates a single failed host, returns False if it couldn't."""
+    try:
+        journal = open_journal(compute_host, args)
+    except JournalBusy as e:
+        syslog.syslog(syslog.LOG_WARNING, "%s by another run, leaving it be"
+                      % e)
+        return True
+    try:
+        return _evacuate_host(nova, compute_host, args, journal)
+    finally:
+        if journal is not None:
+            journal.close()
+
+
+def _evacuate_host(nova, compute_host, args, journal):
+    # Check nova-compute is marked down for the compute host
+    if not check_service_down(nova, compute_host):
+        return False
+
+    # List VMs associated to that compute node which to be evacuated, even
+    # with a journal: VMs may have landed on the host since it was written,
+    # or the host failed again after it was evacuated
+    try:
+        vms = nova.servers.list(search_opts={'host': compute_host})
+    except Exception as e:
+        syslog.syslog(syslog.LOG_ERR, "Failed to list VMs for host %s :: "
+                      "%s" % (compute_host, e))
+        return False
+
+    planned = {}
+    if journal is not None and journal.vms:
+        # VMs of the journal no longer on the host are in flight, and only
+        # need waiting for
+        on_host = set(vm.id for vm in vms)
+        left = [vm_id for vm_id in journal.pending() if vm_id not in on_host]
+        if not vms and not left:
+            syslog.syslog("%s already evacuated at %s" % (
+                compute_host, time.ctime(journal.started)))
+            return True
+        syslog.syslog("Resuming evacuation of %s, %d VMs left" %
+                      (compute_host, len(vms) + len(left)))
+        planned = dict((vm.id, journal.vms[vm.id]['target']) for vm in vms
+                       if journal.vms.get(vm.id, {}).get('target') and
+                       not journal.done(vm.id) and
+                       not journal.in_flight(vm.id))
+        vms = vms + [Record(id=vm_id, name=journal.vms[vm_id].get('name'))
+                     for vm_id in left]
+    elif args.plan_dir:
+        # Use the precomputed plan where it still holds, so we can start
+        # evacuating straight away
+        planned = load_plan(args.plan_dir, compute_host, args.plan_max_age)
+    # The status lists every VM left before the first one is evacuated
+    if journal is not None:
+        record_vms(journal, vms, planned)
+        journal.write_status()
+
+    if planned:
+        try:
+            planned = validate_plan(nova, planned, vms, args.cpu_ratio,
+                                    args.ram_ratio)
+        except Exception as e:
+            syslog.syslog(syslog.LOG_ERR, "Failed to validate plan for "
+                          "%s :: %s" % (compute_host, e))
+            planned = {}
+
+    # Get flavor info, and the inventory, only needed for VMs the plan
+    # doesn't cover
+    flavors = {}
+    loaded = {}
+    moved = {}
+
+    def get_target(vm):
+        if vm.id in planned:
+            moved[vm.id] = planned[vm.id]
+            return planned[vm.id]
+        if not loaded:
+            loaded['inventory'] = open_inventory(nova, args)
+        inventory = loaded['inventory']
+        if not flavors:
+            if inventory is not None:
+                flavors.update(inventory.flavors())
+            else:
+                for flavor in nova.flavors.list():
+                    flavors[flavor.id] = flavor
+        target = _get_target_host(nova, vm, flavors, compute_host,
+                                  inventory, moved)
+        if target:
+            # So the rest of its server group follows it
+            moved[vm.id] = target
+        return target
+
+    def evacuated(vm, target):
+        # The inventory only learns of moves nova has carried out
+        if loaded.get('inventory') is not None:
+            loaded['inventory'].move_server(vm.id, target)
+
+    results = evacuate_vms(nova, vms, get_target, args.wait_timeout,
+                           journal, evacuated)
+    report([compute_host], results)
+    return True
+
+
+def evacuate_hosts(nova, hosts, args):
+    """Evacuates several failed hosts at once, with a single plan.
+
+    Planning each host on its own would send their VMs to the same free
+    hypervisors, and list the whole cloud once per host.
+    """
+    try:
+        hosts = down_compute_hosts(nova, hosts)
     except Exception as e:
-        results['failures'].append((vm.name, str(e)))
-        syslog.syslog(syslog.LOG_ERR, "Failed to evacuate vm '%s' :: %s" %
-                      (vm.name, e))
-
-syslog.syslog(syslog.LOG_ERR, "Evacuation of %s :: Successes (%d, %s) :: "
-              "Failures (%d, %s)" % (args.compute_host,
-                                     len(results['success']),
-                                     results['success'],
-                                     len(results['failures']),
-                                     results['failures']))
+        syslog.syslog(syslog.LOG_ERR, "Failed to list services :: %s" % e)
+        return False
+    if len(hosts) <= 1:
+        return all(evacuate_host(nova, host, args) for host in hosts)
+
+    # Hosts another run is already evacuating are left out of the plan
+    journals = {}
+    for host in list(hosts):
+        try:
+            journals[host] = open_journal(host, args)
+        except JournalBusy as e:
+            syslog.syslog(syslog.LOG_WARNING, "%s by another run, leaving "
+                          "it be" % e)
+            hosts.remove(host)
+    if not hosts:
+        return True
+    try:
+        return _evacuate_hosts(nova, hosts, args, journals)
+    finally:
+        for journal in journals.itervalues():
+            if journal is not None:
+                journal.close()
+
+
+def _evacuate_hosts(nova, hosts, args, journals):
+    try:
+        inventory = open_inventory(nova, args)
+        if inventory is not None:
+            cloud = inventory.load_cloud(args.cpu_ratio, args.ram_ratio)
+        else:
+            cloud = placement.load_cloud(nova, args.cpu_ratio, args.ram_ratio)
+    except Exception as e:
+        syslog.syslog(syslog.LOG_ERR, "Failed to load cloud state :: %s" % e)
+        return False
+
+    # A host missing from the hypervisor listing can't be planned with the
+    # others, but its VMs still need evacuating
+    missing = [host for host in hosts if host not in cloud.host_index]
+    for host in missing:
+        syslog.syslog(syslog.LOG_WARNING, "%s is not in the hypervisor "
+                      "listing, evacuating it on its own" % host)
+    hosts = [host for host in hosts if host in cloud.host_index]
+    failed = [cloud.host_index[host] for host in hosts]
+    placements, stranded = placement.plan_evacuation(cloud, failed)
+    if failed:
+        syslog.syslog("Planned evacuation of %s: %d VMs placed, %d stranded"
+                      % (", ".join(hosts), len(placements), len(stranded)))
+
+    targets = dict((cloud.vms[vm], cloud.hosts[target])
+                   for vm, target in placements.iteritems())
+
+    def evacuated(vm, target):
+        # The inventory only learns of moves nova has carried out
+        if inventory is not None:
+            inventory.move_server(vm.id, target)
+
+    # Each status lists every VM of its host before the first is evacuated
+    host_vms = {}
+    for host in failed:
+        host_vms[host] = [Record(id=cloud.vms[vm], name=cloud.vm_names[vm])
+                          for vm in cloud.host_vms[host]]
+        journal = journals[cloud.hosts[host]]
+        if journal is not None:
+            record_vms(journal, host_vms[host], targets)
+            journal.write_status()
+
+    results = {'success': [], 'failures': []}
+    for host in failed:
+        host_results = evacuate_vms(nova, host_vms[host],
+                                    lambda vm: targets.get(vm.id),
+                                    args.wait_timeout,
+                                    journals[cloud.hosts[host]], evacuated)
+        for key in results:
+            results[key].extend(host_results[key])
+    if failed:
+        report(hosts, results)
+
+    # After the planned hosts, so their VMs' targets are already taken
+    succeeded = True
+    for host in missing:
+        if not _evacuate_host(nova, host, args, journals[host]):
+            succeeded = False
+    return succeeded
+
+
+def main(args):
+    # By default unreachable does not trigger evacuate, but it's configurable
+    down_states = [DOWN]
+    if args.unreachable_is_down:
+        down_states.append(UNREACHABLE)
+
+    # Is the state DOWN, and the state type HARD? Otherwise we do nothing for
+    # now.
+    if args.state_type != 'HARD' and args.state not in down_states:
+        syslog.syslog("%s down, but probe not in HARD state yet "
+                      "(not running)" % args.compute_host)
+        sys.exit(0)
+
+    syslog.syslog("%s DOWN and probe in HARD state, evacuating VMs" %
+                  args.compute_host)
+
+    if args.detach:
+        detach()
+
+    # Get a nova client object (it takes care of keystone auth too)
+    try:
+        nova = nclient.Client(args.username, args.password, args.tenant,
+                              auth_url=args.auth_url, insecure=args.insecure,
+                              region_name=args.region_name)
+    except Exception as e:
+        syslog.syslog(syslog.LOG_ERR, "Failed to authenticate to keystone: %s"
+                      % str(e))
+        sys.exit(-1)
+
+    if not args.coalesce_dir:
+        if not evacuate_host(nova, args.compute_host, args):
+            sys.exit(-1)
+        return
+
+    # Several hosts failing together (a rack, a switch) get one plan
+    for hosts in coalesced_failures(args.coalesce_dir, args.compute_host,
+                                    args.coalesce_window):
+        evacuate_hosts(nova, hosts, args)
+
+
+if __name__ == '__main__':
+    parser = collect_args()
+    args = parser.parse_args()
+    if args.detach and not args.journal_dir:
+        parser.error('--detach needs --journal-dir')
+    absolute_paths(args)
+    httptrace.setup('nova_evacuate_vms', args.trace)
+    main(args)
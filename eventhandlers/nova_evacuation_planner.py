@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Precomputes an evacuation plan for every compute host, for
+# nova_evacuate_vms.py to use when a host goes down.
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Meant to run from cron every few minutes, e.g.:
+#
+#   */5 * * * * nagios nova_evacuation_planner.py --auth_url ... \
+#       --plan-dir /var/lib/nagios/evacuation-plans
+#
+# and nova_evacuate_vms.py given the same --plan-dir. Each host gets its own
+# <plan-dir>/<hypervisor_hostname>.json, holding the target of every VM on
+# it should that host fail alone.
+#
+
+import argparse
+import json
+import os
+import sys
+import syslog
+import time
+from novaclient.v1_1 import client as nclient
+
+# Shared helpers live with the plugins: ../plugins in the source tree, and
+# .. once installed in the nagios plugins directory.
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.extend([os.path.join(_here, '..', 'plugins'),
+                 os.path.join(_here, '..')])
+import httptrace
+import placement
+from utils import ensure_dir
+from utils import write_atomic
+
+syslog.openlog('nagios-nova-evacuation-planner', 0, syslog.LOG_USER)
+
+
+def collect_args():
+    parser = argparse.ArgumentParser(
+        description='Precompute VM evacuation plans for every compute node')
+    parser.add_argument('--auth_url', metavar='URL', type=str, required=True,
+                        help='Endpoint to the keystone service')
+    parser.add_argument('--username', metavar='username', type=str,
+                        required=True,
+                        help='username to use for authentication')
+    parser.add_argument('--password', metavar='password', type=str,
+                        required=True,
+                        help='password to use for authentication')
+    parser.add_argument('--tenant', metavar='tenant', type=str, required=True,
+                        help='tenant name to use for authentication')
+    parser.add_argument('--region_name', metavar='region_name', type=str,
+                        required=True,
+                        help='Region to select for authentication')
+    parser.add_argument('--ca-cert', metavar='ca_cert', type=str,
+                        help='Location of CA validation cert')
+    parser.add_argument('--insecure', action='store_true', default=False,
+                        help='Do not perform certificate validation')
+    parser.add_argument('--plan-dir', metavar='plan_dir', type=str,
+                        required=True,
+                        help='Directory to write the plans to')
+    parser.add_argument('--cpu-ratio', metavar='ratio', type=float,
+                        default=16.0,
+                        help='vCPU overcommit ratio, as nova\'s '
+                        'cpu_allocation_ratio (default 16)')
+    parser.add_argument('--ram-ratio', metavar='ratio', type=float,
+                        default=1.5,
+                        help='RAM overcommit ratio, as nova\'s '
+                        'ram_allocation_ratio (default 1.5)')
+    httptrace.add_argument(parser)
+    return parser
+
+
+def make_plans(cloud):
+    """Yields (host, plan) for every host running VMs."""
+    generated = time.time()
+    heap = placement.host_heap(cloud)
+    for host in xrange(len(cloud.hosts)):
+        if not cloud.host_vms[host]:
+            continue
+        placements, stranded = placement.plan_evacuation(cloud, [host],
+                                                         heap=list(heap))
+        targets = {}
+        for vm, target in placements.iteritems():
+            targets[cloud.vms[vm]] = cloud.hosts[target]
+        yield cloud.hosts[host], {'generated': generated,
+                                  'host': cloud.hosts[host],
+                                  'targets': targets,
+                                  'stranded': [cloud.vms[vm]
+                                               for vm in stranded]}
+
+
+def main(args):
+    start = time.time()
+    try:
+        nova = nclient.Client(args.username, args.password, args.tenant,
+                              auth_url=args.auth_url, insecure=args.insecure,
+                              cacert=args.ca_cert,
+                              region_name=args.region_name)
+        cloud = placement.load_cloud(nova, args.cpu_ratio, args.ram_ratio)
+    except Exception as e:
+        syslog.syslog(syslog.LOG_ERR, "Failed to load cloud state :: %s" % e)
+        return 1
+
+    ensure_dir(args.plan_dir)
+
+    hosts = 0
+    stranded = 0
+    for host, plan in make_plans(cloud):
+        write_atomic(os.path.join(args.plan_dir, '%s.json' % host),
+                     json.dumps(plan))
+        hosts += 1
+        stranded += len(plan['stranded'])
+        if plan['stranded']:
+            syslog.syslog(syslog.LOG_WARNING, "%d VMs of %s could not be "
+                          "placed" % (len(plan['stranded']), host))
+
+    syslog.syslog("Planned evacuation of %d hosts (%d VMs stranded) in "
+                  "%.1fs" % (hosts, stranded, time.time() - start))
+    return 0
+
+
+if __name__ == '__main__':
+    args = collect_args().parse_args()
+    httptrace.setup('nova_evacuation_planner', args.trace)
+    sys.exit(main(args))
@@ -0,0 +1,273 @@
+#
+# Learned latency baselines for the plugins.
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# With --baseline-dir, every request a plugin makes (as seen by httptrace)
+# is compared with the latencies learned for the same endpoint and call,
+# then added to them. Requests slower than --baseline-warning times the
+# learned p95, or --baseline-critical times the p99, raise the plugin's
+# state, so a glance listing is judged against glance listings and not
+# against a threshold which also has to suit keystone.
+#
+# Each (endpoint, call) keeps a histogram of log spaced buckets, 20% wide
+# from 1ms to ~100s, whose weights halve every --baseline-half-life, so old
+# behaviour fades out. A plugin's histograms are a small json file, and
+# learning a call costs the same however long its history is. With
+# --baseline-periods the day is split in that many periods, each learnt
+# separately.
+#
+
+import atexit
+import fcntl
+import json
+import math
+import os
+import time
+
+import httptrace
+from utils import EnvDefault
+from utils import ensure_dir
+from utils import plugin_output
+from utils import write_atomic
+
+BASELINE_DIR_ENVVAR = 'OS_PLUGIN_BASELINE_DIR'
+
+STATE_OK = 0
+STATE_WARNING = 1
+STATE_CRITICAL = 2
+
+# Bucket i holds latencies up to MIN_LATENCY * GROWTH ** i
+MIN_LATENCY = 0.001
+GROWTH = 1.2
+BUCKETS = 64
+
+# Weights decayed below this are dropped
+MIN_WEIGHT = 0.01
+
+# Slow calls named in the output
+EXAMPLES = 3
+
+
+class LatencyHistogram(object):
+    """Latencies in log spaced buckets, with exponentially decaying
+    weights."""
+
+    def __init__(self, buckets=None, updated=None):
+        self.buckets = buckets or {}
+        self.updated = updated
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(dict((int(i), w) for i, w in data['buckets'].iteritems()),
+                   data['updated'])
+
+    def to_dict(self):
+        return {'buckets': self.buckets, 'updated': self.updated}
+
+    @staticmethod
+    def bucket(latency):
+        if latency <= MIN_LATENCY:
+            return 0
+        return min(int(math.ceil(math.log(latency / MIN_LATENCY, GROWTH))),
+                   BUCKETS - 1)
+
+    @staticmethod
+    def upper(bucket):
+        return MIN_LATENCY * GROWTH ** bucket
+
+    @property
+    def weight(self):
+        return sum(self.buckets.itervalues())
+
+    def decay(self, now, half_life):
+        if self.updated is not None and now > self.updated:
+            factor = 0.5 ** ((now - self.updated) / float(half_life))
+            self.buckets = dict((i, w * factor)
+                                for i, w in self.buckets.iteritems()
+                                if w * factor >= MIN_WEIGHT)
+        self.updated = now
+
+    def add(self, latency, now, half_life):
+        self.decay(now, half_life)
+        bucket = self.bucket(latency)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile q, None if empty."""
+        target = q * self.weight
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return self.upper(bucket)
+        return None
+
+
+def call_key(call, now, periods=1):
+    """The histogram a traced call belongs to."""
+    key = '%s %s %s' % (call['endpoint'], call['method'], call['path'])
+    if periods > 1:
+        key += ' @%d' % (time.localtime(now).tm_hour * periods // 24)
+    return key
+
+
+def evaluate(calls, histograms, args, now=None):
+    """Compares calls with their histograms, then adds them.
+
+    Returns (state, [slow calls], worst latency/p95 ratio or None).
+    """
+    now = now or time.time()
+    state = STATE_OK
+    slow = []
+    worst = None
+    for call in calls:
+        if call['status'] is None:
+            continue
+        key = call_key(call, now, args.baseline_periods)
+        if key in histograms:
+            histogram = LatencyHistogram.from_dict(histograms[key])
+        else:
+            histogram = LatencyHistogram()
+        histogram.decay(now, args.baseline_half_life)
+        latency = call['latency']
+        if histogram.weight >= args.baseline_min_samples:
+            p95 = histogram.quantile(0.95)
+            p99 = histogram.quantile(0.99)
+            if worst is None or latency / p95 > worst:
+                worst = latency / p95
+            call_state = STATE_OK
+            if latency >= args.baseline_min_latency:
+                if latency > args.baseline_critical * p99:
+                    call_state = STATE_CRITICAL
+                elif latency > args.baseline_warning * p95:
+                    call_state = STATE_WARNING
+            if call_state != STATE_OK:
+                state = max(state, call_state)
+                slow.append("%s %s took %.3fs (p95 %.3fs)" % (
+                    call['method'], call['path'], latency, p95))
+        histogram.add(latency, now, args.baseline_half_life)
+        histograms[key] = histogram.to_dict()
+    return state, slow, worst
+
+
+def update(path, calls, args):
+    """Evaluates calls against the baseline in path, and learns them."""
+    lock = open(path + '.lock', 'a')
+    try:
+        fcntl.lockf(lock, fcntl.LOCK_EX)
+        try:
+            with open(path) as f:
+                histograms = json.load(f)
+        except (IOError, ValueError):
+            histograms = {}
+        result = evaluate(calls, histograms, args)
+        write_atomic(path, json.dumps(histograms, sort_keys=True))
+    finally:
+        lock.close()
+    return result
+
+
+def annotate(output, slow, worst, args):
+    """Adds the slow calls and latency perfdata to the first line."""
+    if not slow and worst is None:
+        return output
+    line, newline, rest = output.partition('\n')
+    text, bar, perfdata = line.partition('|')
+    if slow:
+        text = "%s, slower than usual: %s" % (text.rstrip(),
+                                              ", ".join(slow[:EXAMPLES]))
+    if worst is not None:
+        perfdata = "%s latency_ratio=%.2f;%s;;0;" % (
+            perfdata.strip(), worst, args.baseline_warning)
+    if perfdata.strip():
+        line = "%s | %s" % (text.rstrip(), perfdata.strip())
+    else:
+        line = text
+    return line + newline + rest
+
+
+def setup(name, args):
+    """Judges this run's requests against the baseline, if
+    args.baseline_dir is set.
+
+    They are judged once the plugin's status line is complete, which is
+    then annotated and written out straight away; requests made after it
+    are left out. The exit code is raised to match.
+    """
+    if not args.baseline_dir:
+        return None
+    ensure_dir(args.baseline_dir)
+    path = os.path.join(args.baseline_dir, name + '.baseline')
+    tracer = httptrace.install(name)
+    judged = []
+
+    def judge():
+        if not judged:
+            try:
+                judged.append(update(path, tracer.calls, args))
+            except Exception as e:
+                judged.append((STATE_OK, ["baseline failed (%s)" % e], None))
+        return judged[0]
+
+    def annotate_line(line):
+        state, slow, worst = judge()
+        return annotate(line, slow, worst, args)
+
+    def raise_code(code):
+        state, slow, worst = judge()
+        # Exit codes above critical (unknown) are left alone
+        if isinstance(code, (int, type(None))) and (code or 0) < state:
+            code = state
+        return code
+
+    output = plugin_output()
+    output.add_line_hook(annotate_line)
+    output.add_exit_hook(raise_code)
+    # Plugins printing nothing, or returning without sys.exit(), still learn
+    atexit.register(judge)
+    return tracer
+
+
+def add_argument(parser):
+    parser.add_argument('--baseline-dir', metavar='path', type=str,
+                        action=EnvDefault, envvar=BASELINE_DIR_ENVVAR,
+                        help='Learn request latencies in path, and alert '
+                        'on requests slower than usual')
+    parser.add_argument('--baseline-warning', metavar='factor', type=float,
+                        default=2.0,
+                        help='Warn on requests slower than this times their '
+                        'p95 (default %(default)s)')
+    parser.add_argument('--baseline-critical', metavar='factor', type=float,
+                        default=3.0,
+                        help='Critical on requests slower than this times '
+                        'their p99 (default %(default)s)')
+    parser.add_argument('--baseline-min-samples', metavar='count', type=int,
+                        default=30,
+                        help='Samples needed before alerting '
+                        '(default %(default)s)')
+    parser.add_argument('--baseline-min-latency', metavar='seconds',
+                        type=float, default=0.1,
+                        help='Never alert on requests faster than this '
+                        '(default %(default)s)')
+    parser.add_argument('--baseline-half-life', metavar='seconds', type=int,
+                        default=7 * 86400,
+                        help='Age at which samples count half '
+                        '(default %(default)s, a week)')
+    parser.add_argument('--baseline-periods', metavar='count', type=int,
+                        default=1,
+                        help='Learn this many periods of the day '
+                        'separately, e.g. 4 for 6 hour periods (default 1)')
@@ -27,6 +27,10 @@ import argparse
 
 from keystoneclient.v2_0 import client as ksclient
 import glanceclient as glance_client
+import baseline
+import httptrace
+import ratelimit
+import resultcache
 from utils import EnvDefault
 
 STATE_OK = 0
@@ -57,6 +61,10 @@ def collect_args():
                     action=EnvDefault, envvar='OS_CACERT', help='Location of the CA cert for validation')
   parser.add_argument('--insecure', action='store_true', default=False,
                     help='Do not verify certificates')
+  httptrace.add_argument(parser)
+  resultcache.add_argument(parser)
+  ratelimit.add_argument(parser)
+  baseline.add_argument(parser)
   return parser
 
 
@@ -112,6 +120,10 @@ def check_glance(c,args):
 
 if __name__ == '__main__':
   args = collect_args().parse_args()
+  httptrace.setup('check_glance', args.trace)
+  resultcache.setup('check_glance', args)
+  ratelimit.setup(args)
+  baseline.setup('check_glance', args)
   try:
     ks_client = ksclient.Client(username=args.username,
                                 password=args.password,
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+#
+# vim: tabstop=2 shiftwidth=2
+#
+# Copyright (C) 2014 Catalyst IT Limited.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; only version 2 of the License is applicable.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# About this plugin:
+#   This nagios plugin walks the whole glance catalog and reports on its
+#   health: how many images are in each status, the size of the active
+#   ones, and how many have been stuck in queued or saving for too long
+#   (uploads or snapshots that will never finish).
+#
+#   The catalog is listed a page at a time (--page-size, glance pages with
+#   markers) and only counters are kept, so memory use stays the same with
+#   tens of thousands of images.
+#
+# Example usage:
+#   ./check_glance_catalog.py --auth_url http://keystone:5000/v2.0 --username admin --password secret --tenant admin --stuck-age 7200 --stuck-critical 10
+#
+
+import argparse
+import sys
+from datetime import datetime
+
+from keystoneclient.v2_0 import client as ksclient
+import glanceclient as glance_client
+
+import baseline
+import httptrace
+import ratelimit
+import resultcache
+from utils import EnvDefault
+
+STATE_OK = 0
+STATE_WARNING = 1
+STATE_CRITICAL = 2
+STATE_UNKNOWN = 3
+
+# Statuses an image should only pass through
+TRANSIENT = ('queued', 'saving')
+STATUSES = ('active', 'queued', 'saving', 'killed', 'deleted',
+            'pending_delete')
+
+# Stuck images named in the output
+EXAMPLES = 5
+
+def collect_args():
+  """
+  Collects args passed in the cli.
+  """
+  parser = argparse.ArgumentParser(
+    description='Reports on the health of the whole glance catalog')
+  parser.add_argument('--auth_url', metavar='URL', type=str, required=True,
+    action=EnvDefault, envvar='OS_AUTH_URL', help='Keystone URL')
+  parser.add_argument('--username', metavar='username', type=str, required=True,
+    action=EnvDefault, envvar='OS_USERNAME', help='username to use for authentication')
+  parser.add_argument('--password', metavar='password', type=str, required=True,
+    action=EnvDefault, envvar='OS_PASSWORD', help='password to use for authentication')
+  parser.add_argument('--tenant', metavar='tenant', type=str, required=True,
+    action=EnvDefault, envvar='OS_TENANT_NAME', help='tenant name to use for authentication')
+  parser.add_argument('--region_name', metavar='region_name', type=str,
+    action=EnvDefault, envvar='OS_REGION_NAME', help='Region to select for authentication')
+  parser.add_argument('--ca-cert', metavar='ca_cert', type=str,
+    action=EnvDefault, envvar='OS_CACERT', help='Location of the CA cert for validation')
+  parser.add_argument('--insecure', action='store_true', default=False,
+    help='Do not verify certificates')
+  parser.add_argument('--public-only', dest='public_only', action='store_true',
+    default=False, help='Only look at public images')
+  parser.add_argument('--owner', dest='owner', type=str,
+    help='Only look at the images of this tenant id (the whole catalog is '
+    'still listed, glance v1 has no owner filter)')
+  parser.add_argument('--page-size', dest='page_size', type=int, default=1000,
+    help='Images fetched per request (default 1000, glance serves at most '
+    'its api_limit_max)')
+  parser.add_argument('--stuck-age', dest='stuck_age', type=int, default=3600,
+    help='Images queued or saving for longer than this are stuck '
+    '(seconds, default 3600)')
+  parser.add_argument('--stuck-warning', dest='stuck_warning', type=int,
+    default=1, help='Warn from this many stuck images (default 1)')
+  parser.add_argument('--stuck-critical', dest='stuck_critical', type=int,
+    help='Critical from this many stuck images')
+  parser.add_argument('--killed-warning', dest='killed_warning', type=int,
+    help='Warn from this many killed images')
+  parser.add_argument('--killed-critical', dest='killed_critical', type=int,
+    help='Critical from this many killed images')
+  parser.add_argument('--size-warning', dest='size_warning', type=float,
+    help='Warn when active images take more than this (GB)')
+  parser.add_argument('--size-critical', dest='size_critical', type=float,
+    help='Critical when active images take more than this (GB)')
+  httptrace.add_argument(parser)
+  resultcache.add_argument(parser)
+  ratelimit.add_argument(parser)
+  baseline.add_argument(parser)
+  return parser
+
+def age(timestamp, now):
+  """
+  Seconds since a glance timestamp, None if there isn't one.
+  """
+  if not timestamp:
+    return None
+  then = datetime.strptime(timestamp.replace('Z', '').split('.')[0],
+                           '%Y-%m-%dT%H:%M:%S')
+  delta = now - then
+  return delta.days * 86400 + delta.seconds
+
+def list_images(c, args):
+  """
+  Iterates over the catalog, a page at a time.
+
+  glanceclient takes a page shorter than page_size for the last one, but
+  glance cuts pages to its api_limit_max, which would end the listing
+  after the first page. Pages are walked here instead, until one comes
+  back shorter than the longest so far, or empty.
+  """
+  # glance only lists public (and our own) images unless told otherwise.
+  # Given as is_public, as glanceclient drops the filter along with owner
+  kwargs = {'page_size': args.page_size, 'limit': args.page_size,
+            'is_public': 'true' if args.public_only else 'none'}
+  longest = 0
+  while True:
+    page = list(c.images.list(**kwargs))
+    for image in page:
+      # glance v1 can't filter on the owner, glanceclient would do the same
+      if args.owner and getattr(image, 'owner', None) != args.owner:
+        continue
+      yield image
+    if not page or len(page) < longest:
+      return
+    longest = len(page)
+    kwargs['marker'] = page[-1].id
+
+def catalog_stats(images, stuck_age, now=None):
+  """
+  Aggregates an image iterable, keeping only counters.
+  """
+  now = now or datetime.utcnow()
+  stats = {'images': 0, 'size': 0, 'stuck': 0, 'stuck_names': [],
+           'oldest_stuck': 0, 'statuses': dict.fromkeys(STATUSES, 0)}
+  for image in images:
+    status = getattr(image, 'status', None)
+    stats['images'] += 1
+    stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+    if status == 'active':
+      stats['size'] += getattr(image, 'size', None) or 0
+    elif status in TRANSIENT:
+      image_age = age(getattr(image, 'updated_at', None), now)
+      if image_age is not None and image_age > stuck_age:
+        stats['stuck'] += 1
+        stats['oldest_stuck'] = max(stats['oldest_stuck'], image_age)
+        if len(stats['stuck_names']) < EXAMPLES:
+          stats['stuck_names'].append(getattr(image, 'name', None) or image.id)
+  return stats
+
+def threshold(value):
+  return '' if value is None else value
+
+def grade(value, warning, critical):
+  if critical is not None and value >= critical:
+    return STATE_CRITICAL
+  if warning is not None and value >= warning:
+    return STATE_WARNING
+  return STATE_OK
+
+def check_catalog(c, args):
+  stats = catalog_stats(list_images(c, args), args.stuck_age)
+  statuses = stats['statuses']
+  size_gb = stats['size'] / (1024.0 ** 3)
+
+  problems = []
+  state = STATE_OK
+  for value, warning, critical, what in (
+      (stats['stuck'], args.stuck_warning, args.stuck_critical,
+       "%d stuck in queued/saving" % stats['stuck']),
+      (statuses['killed'], args.killed_warning, args.killed_critical,
+       "%d killed" % statuses['killed']),
+      (size_gb, args.size_warning, args.size_critical,
+       "%.1f GB active" % size_gb)):
+    value_state = grade(value, warning, critical)
+    if value_state != STATE_OK:
+      problems.append(what)
+      state = max(state, value_state)
+
+  perfdata = ["images=%d;;;0;" % stats['images']]
+  for status in sorted(statuses):
+    if status == 'killed':
+      perfdata.append("killed=%d;%s;%s;0;" % (statuses['killed'],
+        threshold(args.killed_warning), threshold(args.killed_critical)))
+    else:
+      perfdata.append("%s=%d;;;0;" % (status, statuses[status]))
+  perfdata.append("size=%dB;%s;%s;0;" % (stats['size'],
+    threshold(args.size_warning and int(args.size_warning * 1024 ** 3)),
+    threshold(args.size_critical and int(args.size_critical * 1024 ** 3))))
+  perfdata.append("stuck=%d;%s;%s;0;" % (stats['stuck'],
+    threshold(args.stuck_warning), threshold(args.stuck_critical)))
+  perfdata.append("oldest_stuck=%ds;;;0;" % stats['oldest_stuck'])
+  perfdata = " ".join(perfdata)
+
+  if state == STATE_OK:
+    print "OK: %d images, %d active (%.1f GB) | %s" % (
+      stats['images'], statuses['active'], size_gb, perfdata)
+  else:
+    if stats['stuck_names']:
+      problems.append("stuck: %s" % ", ".join(stats['stuck_names']))
+    print "Failed: %d images, %s | %s" % (stats['images'],
+                                         ", ".join(problems), perfdata)
+  return state
+
+if __name__ == '__main__':
+  args = collect_args().parse_args()
+  httptrace.setup('check_glance_catalog', args.trace)
+  resultcache.setup('check_glance_catalog', args)
+  ratelimit.setup(args)
+  baseline.setup('check_glance_catalog', args)
+  try:
+    ks_client = ksclient.Client(username=args.username,
+                                password=args.password,
+                                tenant_name=args.tenant,
+                                auth_url=args.auth_url,
+                                region_name=args.region_name,
+                                cacert=args.ca_cert,
+                                insecure=args.insecure)
+    endpoint = ks_client.service_catalog.url_for(service_type='image')
+    c = glance_client.Client('1', endpoint, token=ks_client.auth_token,
+                             cacert=args.ca_cert, insecure=args.insecure)
+    sys.exit(check_catalog(c, args))
+  except Exception as e:
+    print "Failed: %s" % str(e)
+    sys.exit(STATE_CRITICAL)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+#
+# vim: tabstop=2 shiftwidth=2
+#
+# Copyright (C) 2014 Catalyst IT Limited.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; only version 2 of the License is applicable.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# About this plugin:
+#   This nagios plugin downloads an image from glance, to check its store
+#   can actually serve data, not just metadata. The image is streamed in
+#   --chunk-size pieces, so memory use doesn't depend on its size, and its
+#   MD5 computed on the way and compared with glance's checksum.
+#
+#   Time to first byte and throughput are reported, with thresholds. With
+#   --max-bytes only the start of the image is read (and the checksum
+#   can't be verified), to sample big images cheaply.
+#
+# Example usage:
+#   ./check_glance_download.py --auth_url http://keystone:5000/v2.0 --username admin --password secret --tenant admin --image cirros --max-bytes 104857600 --rate-warning 20
+#
+
+import argparse
+import hashlib
+import json
+import ssl
+import sys
+import time
+import urllib
+import urllib2
+
+from keystoneclient.v2_0 import client as ksclient
+
+import baseline
+import httptrace
+import ratelimit
+import resultcache
+from utils import EnvDefault
+
+STATE_OK = 0
+STATE_WARNING = 1
+STATE_CRITICAL = 2
+STATE_UNKNOWN = 3
+
+MB = 1024.0 * 1024
+
+def collect_args():
+  """
+  Collects args passed in the cli.
+  """
+  parser = argparse.ArgumentParser(
+    description='Checks an image can be downloaded from glance, and how fast')
+  parser.add_argument('--auth_url', metavar='URL', type=str, required=True,
+    action=EnvDefault, envvar='OS_AUTH_URL', help='Keystone URL')
+  parser.add_argument('--username', metavar='username', type=str, required=True,
+    action=EnvDefault, envvar='OS_USERNAME', help='username to use for authentication')
+  parser.add_argument('--password', metavar='password', type=str, required=True,
+    action=EnvDefault, envvar='OS_PASSWORD', help='password to use for authentication')
+  parser.add_argument('--tenant', metavar='tenant', type=str, required=True,
+    action=EnvDefault, envvar='OS_TENANT_NAME', help='tenant name to use for authentication')
+  parser.add_argument('--region_name', metavar='region_name', type=str,
+    action=EnvDefault, envvar='OS_REGION_NAME', help='Region to select for authentication')
+  parser.add_argument('--ca-cert', metavar='ca_cert', type=str,
+    action=EnvDefault, envvar='OS_CACERT', help='Location of the CA cert for validation')
+  parser.add_argument('--insecure', action='store_true', default=False,
+    help='Do not verify certificates')
+  parser.add_argument('--image', dest='image', type=str, required=True,
+    help='Id or name of the image to download')
+  parser.add_argument('--chunk-size', dest='chunk_size', type=int,
+    default=65536, help='Bytes read at a time (default 65536)')
+  parser.add_argument('--max-bytes', dest='max_bytes', type=int, default=0,
+    help='Stop after this many bytes, skipping the checksum (default: '
+    'download the whole image)')
+  parser.add_argument('--timeout', dest='timeout', type=int, default=30,
+    help='Socket timeout, in seconds (default 30)')
+  parser.add_argument('--ttfb-warning', dest='ttfb_warning', type=float,
+    help='Warn when the first byte takes longer than this (seconds)')
+  parser.add_argument('--ttfb-critical', dest='ttfb_critical', type=float,
+    help='Critical when the first byte takes longer than this (seconds)')
+  parser.add_argument('--rate-warning', dest='rate_warning', type=float,
+    help='Warn when the download is slower than this (MB/s)')
+  parser.add_argument('--rate-critical', dest='rate_critical', type=float,
+    help='Critical when the download is slower than this (MB/s)')
+  httptrace.add_argument(parser)
+  resultcache.add_argument(parser)
+  ratelimit.add_argument(parser)
+  baseline.add_argument(parser)
+  return parser
+
+def ssl_context(ca_cert, insecure):
+  if not hasattr(ssl, 'create_default_context'):
+    return None
+  if insecure:
+    return ssl._create_unverified_context()
+  return ssl.create_default_context(cafile=ca_cert)
+
+def urlopen(request, timeout, context):
+  if context is None:
+    return urllib2.urlopen(request, timeout=timeout)
+  return urllib2.urlopen(request, timeout=timeout, context=context)
+
+def images_url(endpoint):
+  """
+  The v1 images URL of a glance endpoint, with or without its version.
+  """
+  endpoint = endpoint.rstrip('/')
+  if endpoint.endswith('/v1'):
+    endpoint = endpoint[:-3]
+  return endpoint + '/v1/images'
+
+def find_image(url, token, image, timeout, context):
+  """
+  Returns the id of the image, given its id or its name.
+  """
+  request = urllib2.Request('%s/%s' % (url, urllib.quote(image)),
+                            headers={'X-Auth-Token': token})
+  request.get_method = lambda: 'HEAD'
+  try:
+    urlopen(request, timeout, context).close()
+    return image
+  except urllib2.HTTPError as e:
+    if e.code != 404:
+      raise
+  request = urllib2.Request('%s?%s' % (url, urllib.urlencode({'name': image})),
+                            headers={'X-Auth-Token': token})
+  images = json.load(urlopen(request, timeout, context))['images']
+  if not images:
+    raise Exception("No image %s" % image)
+  return images[0]['id']
+
+def download(url, token, chunk_size, max_bytes, timeout, context):
+  """
+  Streams an image, returns (headers, bytes read, md5 of them, time to
+  first byte, total time).
+  """
+  start = time.time()
+  response = urlopen(urllib2.Request(url, headers={'X-Auth-Token': token}),
+                     timeout, context)
+  md5 = hashlib.md5()
+  size = 0
+  ttfb = None
+  try:
+    while not max_bytes or size < max_bytes:
+      want = chunk_size
+      if max_bytes:
+        want = min(want, max_bytes - size)
+      chunk = response.read(want)
+      if not chunk:
+        break
+      if ttfb is None:
+        ttfb = time.time() - start
+      md5.update(chunk)
+      size += len(chunk)
+  finally:
+    response.close()
+  return (response.info(), size, md5.hexdigest(),
+          ttfb if ttfb is not None else time.time() - start,
+          time.time() - start)
+
+def threshold(value, below=False):
+  """
+  A perfdata threshold; below ones use the range syntax (alert under it).
+  """
+  if value is None:
+    return ''
+  return '%s:' % value if below else value
+
+def check_download(args, token, endpoint):
+  context = ssl_context(args.ca_cert, args.insecure)
+  url = images_url(endpoint)
+  image_id = find_image(url, token, args.image, args.timeout, context)
+  headers, size, md5, ttfb, elapsed = download(
+    '%s/%s' % (url, image_id), token, args.chunk_size, args.max_bytes,
+    args.timeout, context)
+
+  rate = size / MB / elapsed if elapsed > 0 else 0
+  perfdata = "ttfb=%.3fs;%s;%s;0; rate_MBps=%.2f;%s;%s;0; bytes=%dB;;;0;" % (
+    ttfb, threshold(args.ttfb_warning), threshold(args.ttfb_critical), rate,
+    threshold(args.rate_warning, True), threshold(args.rate_critical, True),
+    size)
+
+  problems = []
+  state = STATE_OK
+  expected_size = headers.getheader('x-image-meta-size')
+  checksum = headers.getheader('x-image-meta-checksum')
+  if args.max_bytes and size >= args.max_bytes:
+    checked = "sampled %d bytes" % size
+  else:
+    checked = "checksum not available"
+    if expected_size is not None and int(expected_size) != size:
+      problems.append("got %d bytes of %s" % (size, expected_size))
+      state = STATE_CRITICAL
+    if checksum:
+      checked = "checksum ok"
+      if checksum != md5:
+        problems.append("checksum %s, expected %s" % (md5, checksum))
+        state = STATE_CRITICAL
+
+  ttfb_state = STATE_OK
+  if args.ttfb_critical is not None and ttfb > args.ttfb_critical:
+    ttfb_state = STATE_CRITICAL
+  elif args.ttfb_warning is not None and ttfb > args.ttfb_warning:
+    ttfb_state = STATE_WARNING
+  if ttfb_state != STATE_OK:
+    problems.append("first byte after %.3fs" % ttfb)
+    state = max(state, ttfb_state)
+
+  rate_state = STATE_OK
+  if args.rate_critical is not None and rate < args.rate_critical:
+    rate_state = STATE_CRITICAL
+  elif args.rate_warning is not None and rate < args.rate_warning:
+    rate_state = STATE_WARNING
+  if rate_state != STATE_OK:
+    problems.append("%.2f MB/s" % rate)
+    state = max(state, rate_state)
+
+  if state == STATE_OK:
+    print "OK: image %s, %d bytes at %.2f MB/s, %s | %s" % (
+      image_id, size, rate, checked, perfdata)
+  else:
+    print "Failed: image %s, %s | %s" % (image_id, ", ".join(problems),
+                                        perfdata)
+  return state
+
+if __name__ == '__main__':
+  args = collect_args().parse_args()
+  httptrace.setup('check_glance_download', args.trace)
+  resultcache.setup('check_glance_download', args)
+  ratelimit.setup(args)
+  baseline.setup('check_glance_download', args)
+  try:
+    ks_client = ksclient.Client(username=args.username,
+                                password=args.password,
+                                tenant_name=args.tenant,
+                                auth_url=args.auth_url,
+                                region_name=args.region_name,
+                                cacert=args.ca_cert,
+                                insecure=args.insecure)
+    endpoint = ks_client.service_catalog.url_for(service_type='image')
+    sys.exit(check_download(args, ks_client.auth_token, endpoint))
+  except Exception as e:
+    print "Failed: %s" % str(e)
+    sys.exit(STATE_CRITICAL)
@@ -37,6 +37,11 @@ import sys
 import traceback
 import urllib2
 
+import baseline
+import httptrace
+import ratelimit
+import resultcache
+
 STATE_OK = 0
 STATE_WARNING = 1
 STATE_CRITICAL = 2
@@ -64,6 +69,10 @@ def collect_args():
       help='Return warn on failure (default is critical)')
   parser.add_argument('-v','--verbose', dest='verbose', action='store_true',
       help='Print some additional information')
+  httptrace.add_argument(parser)
+  resultcache.add_argument(parser)
+  ratelimit.add_argument(parser)
+  baseline.add_argument(parser)
   return parser
 
 def check_graphite(args):
@@ -92,6 +101,10 @@ def check_graphite(args):
 
 if __name__ == '__main__':
   args = collect_args().parse_args()
+  httptrace.setup('check_graphite', args.trace)
+  resultcache.setup('check_graphite', args)
+  ratelimit.setup(args)
+  baseline.setup('check_graphite', args)
   try:
     sys.exit(check_graphite(args))
   except Exception as e:
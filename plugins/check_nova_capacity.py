@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+#
+# vim: tabstop=2 shiftwidth=2
+#
+# Copyright (C) 2014 Catalyst IT Limited.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; only version 2 of the License is applicable.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# About this plugin:
+#   This nagios plugin checks the cluster has the headroom to survive losing
+#   k hypervisors (N+k): it simulates their failure and checks all their VMs
+#   could be evacuated to the remaining hosts, respecting server groups, the
+#   same way nova_evacuate_vms.py would place them.
+#
+#   By default the k hypervisors carrying the most VMs (by RAM) are failed.
+#   With --each, every hypervisor is failed in turn (along with the k-1
+#   largest others), and the worst case is reported.
+#
+# Example usage:
+#   ./check_nova_capacity.py --auth_url http://keystone:5000/v2.0 --username admin --password secret --tenant admin -k 2
+#
+
+import argparse
+import sys
+import time
+
+from novaclient.v1_1 import client
+
+import baseline
+import httptrace
+import ratelimit
+import resultcache
+import placement
+from utils import EnvDefault
+
+STATE_OK = 0
+STATE_WARNING = 1
+STATE_CRITICAL = 2
+STATE_UNKNOWN = 3
+
+def collect_args():
+  """
+  Collects args passed in the cli.
+  """
+  parser = argparse.ArgumentParser(
+    description='Checks the cluster can evacuate k failed hypervisors')
+  parser.add_argument('--auth_url', metavar='URL', type=str, required=True,
+    action=EnvDefault, envvar='OS_AUTH_URL', help='Keystone URL')
+  parser.add_argument('--username', metavar='username', type=str, required=True,
+    action=EnvDefault, envvar='OS_USERNAME', help='username to use for authentication')
+  parser.add_argument('--password', metavar='password', type=str, required=True,
+    action=EnvDefault, envvar='OS_PASSWORD', help='password to use for authentication')
+  parser.add_argument('--tenant', metavar='tenant', type=str, required=True,
+    action=EnvDefault, envvar='OS_TENANT_NAME', help='tenant name to use for authentication')
+  parser.add_argument('--region_name', metavar='region_name', type=str,
+    action=EnvDefault, envvar='OS_REGION_NAME', help='Region to select for authentication')
+  parser.add_argument('--ca-cert', metavar='ca_cert', type=str,
+    action=EnvDefault, envvar='OS_CACERT', help='Location of the CA cert for validation')
+  parser.add_argument('--insecure', action='store_true', default=False,
+    help='Do not verify certificates')
+  parser.add_argument('-k', '--failures', dest='failures', type=int, default=1,
+    help='Number of hypervisors to lose (default 1)')
+  parser.add_argument('--each', action='store_true', default=False,
+    help='Fail every hypervisor in turn, not just the largest ones')
+  parser.add_argument('--fail-host', dest='fail_hosts', action='append',
+    default=[], metavar='hostname',
+    help='Hypervisor to fail (repeatable), instead of the largest ones')
+  parser.add_argument('--cpu-ratio', dest='cpu_ratio', type=float, default=16.0,
+    help='vCPU overcommit ratio, as nova\'s cpu_allocation_ratio (default 16)')
+  parser.add_argument('--ram-ratio', dest='ram_ratio', type=float, default=1.5,
+    help='RAM overcommit ratio, as nova\'s ram_allocation_ratio (default 1.5)')
+  parser.add_argument('-w','--failiswarn', dest='failiswarn', action='store_true',
+    help='Return warn on failure (default is critical)')
+  httptrace.add_argument(parser)
+  resultcache.add_argument(parser)
+  ratelimit.add_argument(parser)
+  baseline.add_argument(parser)
+  return parser
+
+def scenarios(cloud, args):
+  """
+  Lists the sets of failed host indices to simulate.
+  """
+  if args.fail_hosts:
+    missing = [h for h in args.fail_hosts if h not in cloud.host_index]
+    if missing:
+      raise Exception("Unknown hypervisors %s" % ", ".join(missing))
+    return [[cloud.host_index[h] for h in args.fail_hosts]]
+
+  if not args.each:
+    return [placement.largest_hosts(cloud, args.failures)]
+
+  others = placement.largest_hosts(cloud, args.failures)
+  result = []
+  for host in xrange(len(cloud.hosts)):
+    if not cloud.usable[host]:
+      continue
+    failed = [host] + [h for h in others if h != host][:args.failures - 1]
+    result.append(failed)
+  return result
+
+def check_capacity(nova, args):
+  cloud = placement.load_cloud(nova, args.cpu_ratio, args.ram_ratio)
+
+  start = time.time()
+  worst = None
+  moved = 0
+  heap = placement.host_heap(cloud)
+  for failed in scenarios(cloud, args):
+    placements, stranded = placement.plan_evacuation(cloud, failed,
+                                                     heap=list(heap))
+    moved = max(moved, len(placements) + len(stranded))
+    if worst is None or len(stranded) > len(worst[1]):
+      worst = (failed, stranded)
+  plan_time = time.time() - start
+
+  usable = [h for h in xrange(len(cloud.hosts)) if cloud.usable[h]]
+  perfdata = "hosts=%d hosts_usable=%d vms=%d free_vcpus=%d free_ram_mb=%d " \
+    "vms_moved=%d stranded=%d plan_time=%.3fs" % (
+      len(cloud.hosts), len(usable), len(cloud.vms),
+      sum(max(0, cloud.free_vcpus[h]) for h in usable),
+      sum(max(0, cloud.free_ram[h]) for h in usable),
+      moved, len(worst[1]) if worst else 0, plan_time)
+
+  if worst is None:
+    print "Failed: no usable hypervisors | %s" % perfdata
+  elif not worst[1]:
+    print "OK: cluster can lose %d hypervisors (worst case %s) | %s" % (
+      len(worst[0]), ", ".join(cloud.hosts[h] for h in worst[0]), perfdata)
+    return STATE_OK
+  else:
+    print "Failed: losing %s strands %d VMs (%s) | %s" % (
+      ", ".join(cloud.hosts[h] for h in worst[0]), len(worst[1]),
+      ", ".join(cloud.vm_names[vm] for vm in worst[1][:10]), perfdata)
+
+  if args.failiswarn:
+    return STATE_WARNING
+  else:
+    return STATE_CRITICAL
+
+if __name__ == '__main__':
+  args = collect_args().parse_args()
+  httptrace.setup('check_nova_capacity', args.trace)
+  resultcache.setup('check_nova_capacity', args)
+  ratelimit.setup(args)
+  baseline.setup('check_nova_capacity', args)
+  try:
+    nova = client.Client(args.username, args.password, args.tenant,
+                         auth_url=args.auth_url,
+                         region_name=args.region_name,
+                         cacert=args.ca_cert, insecure=args.insecure,
+                         service_type="compute")
+    sys.exit(check_capacity(nova, args))
+  except Exception as e:
+    print "Failed: %s" % str(e)
+    sys.exit(STATE_CRITICAL)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+#
+# vim: tabstop=2 shiftwidth=2
+#
+# Copyright (C) 2014 Catalyst IT Limited.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; only version 2 of the License is applicable.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# About this plugin:
+#   This nagios plugin reports on the evacuations nova_evacuate_vms.py is
+#   running (or ran) in the background with --detach, from the status files
+#   it keeps in its --journal-dir. It makes no API calls.
+#
+#   An evacuation under way is a warning, one which left VMs behind (or
+#   whose process died) is critical.
+#
+# Example usage:
+#   ./check_nova_evacuation.py --journal-dir /var/lib/nagios/evacuations
+#
+
+import argparse
+import errno
+import glob
+import json
+import os
+import sys
+import time
+
+from evacuation_journal import status_path
+
+STATE_OK = 0
+STATE_WARNING = 1
+STATE_CRITICAL = 2
+STATE_UNKNOWN = 3
+
+def collect_args():
+  """
+  Collects args passed in the cli.
+  """
+  parser = argparse.ArgumentParser(
+    description='Reports the progress of background VM evacuations')
+  parser.add_argument('--journal-dir', dest='journal_dir', required=True,
+    help='--journal-dir given to nova_evacuate_vms.py')
+  parser.add_argument('--host', dest='hosts', action='append', default=[],
+    metavar='hostname',
+    help='Compute host to report on (repeatable, default all of them)')
+  parser.add_argument('--max-age', dest='max_age', type=int, default=86400,
+    help='Ignore evacuations finished more than this many seconds ago '
+    '(default 86400)')
+  return parser
+
+def running(pid):
+  """
+  Whether process pid is still alive.
+  """
+  try:
+    os.kill(pid, 0)
+  except OSError as e:
+    return e.errno == errno.EPERM
+  return True
+
+def load_statuses(journal_dir, hosts, max_age):
+  if hosts:
+    paths = [status_path(journal_dir, host) for host in hosts]
+  else:
+    paths = glob.glob(status_path(journal_dir, '*'))
+  statuses = []
+  for path in sorted(paths):
+    try:
+      with open(path) as f:
+        status = json.load(f)
+    except IOError:
+      continue
+    if status['finished'] and time.time() - status['finished'] > max_age:
+      continue
+    statuses.append(status)
+  return statuses
+
+def check_evacuation(args):
+  statuses = load_statuses(args.journal_dir, args.hosts, args.max_age)
+  if not statuses:
+    print "OK: no evacuation | vms=0 active=0 left=0 failed=0 rate=0 eta=0s"
+    return STATE_OK
+
+  state = STATE_OK
+  msgs = []
+  total = active = left = failed = 0
+  rate = 0.0
+  eta = 0
+  for status in statuses:
+    counts = status['counts']
+    host_left = counts['pending'] + counts['rebuilding']
+    host_failed = counts['error'] + counts['failed']
+    total += status['total']
+    active += counts['active']
+    left += host_left
+    failed += host_failed
+    msg = "%s %d/%d VMs back" % (status['host'], counts['active'],
+                                 status['total'])
+    if not status['finished']:
+      if running(status['pid']):
+        rate += status['rate']
+        eta = max(eta, status['eta'] or 0)
+        msg += ", %.2f VMs/s, ETA %ds" % (status['rate'], status['eta'] or 0)
+        state = max(state, STATE_WARNING)
+      else:
+        msg += ", worker %d died" % status['pid']
+        state = STATE_CRITICAL
+    elif host_failed or host_left:
+      msg += ", %d failed, %d unfinished" % (host_failed, host_left)
+      state = STATE_CRITICAL
+    else:
+      msg += ", done"
+    if host_failed and not status['finished']:
+      msg += ", %d failed" % host_failed
+      state = STATE_CRITICAL
+    msgs.append(msg)
+
+  perfdata = "vms=%d active=%d left=%d failed=%d rate=%.3f eta=%ds" % (
+    total, active, left, failed, rate, eta)
+  label = {STATE_OK: "OK", STATE_WARNING: "Evacuating",
+           STATE_CRITICAL: "Failed"}[state]
+  print "%s: %s | %s" % (label, "; ".join(msgs), perfdata)
+  return state
+
+if __name__ == '__main__':
+  args = collect_args().parse_args()
+  try:
+    sys.exit(check_evacuation(args))
+  except Exception as e:
+    print "Failed: %s" % str(e)
+    sys.exit(STATE_UNKNOWN)
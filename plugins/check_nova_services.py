@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+#
+# vim: tabstop=2 shiftwidth=2
+#
+# Copyright (C) 2014 Catalyst IT Limited.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; only version 2 of the License is applicable.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# About this plugin:
+#   This nagios plugin checks every nova service (compute, scheduler,
+#   conductor, ...) of the cloud with a single os-services listing: its
+#   state, whether it is enabled, and how long since its last heartbeat.
+#
+#   With --command-file, a passive result is also submitted for each host,
+#   to a service (--service-description) defined on the nagios host of the
+#   same name, e.g.:
+#
+#     define service {
+#       use                     passive-service
+#       host_name               compute-1
+#       service_description     nova-services
+#     }
+#
+#   so a thousand compute nodes cost one API call per check interval. The
+#   plugin's own result is a summary of the whole cloud.
+#
+# Example usage:
+#   ./check_nova_services.py --auth_url http://keystone:5000/v2.0 --username admin --password secret --tenant admin --command-file /var/lib/nagios3/rw/nagios.cmd
+#
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+from novaclient.v1_1 import client
+
+import baseline
+import httptrace
+import ratelimit
+from utils import EnvDefault
+
+STATE_OK = 0
+STATE_WARNING = 1
+STATE_CRITICAL = 2
+STATE_UNKNOWN = 3
+
+STATE_NAMES = {STATE_OK: 'OK', STATE_WARNING: 'WARNING',
+               STATE_CRITICAL: 'CRITICAL', STATE_UNKNOWN: 'UNKNOWN'}
+
+def collect_args():
+  """
+  Collects args passed in the cli.
+  """
+  parser = argparse.ArgumentParser(
+    description='Checks every nova service of the cloud in one API call')
+  parser.add_argument('--auth_url', metavar='URL', type=str, required=True,
+    action=EnvDefault, envvar='OS_AUTH_URL', help='Keystone URL')
+  parser.add_argument('--username', metavar='username', type=str, required=True,
+    action=EnvDefault, envvar='OS_USERNAME', help='username to use for authentication')
+  parser.add_argument('--password', metavar='password', type=str, required=True,
+    action=EnvDefault, envvar='OS_PASSWORD', help='password to use for authentication')
+  parser.add_argument('--tenant', metavar='tenant', type=str, required=True,
+    action=EnvDefault, envvar='OS_TENANT_NAME', help='tenant name to use for authentication')
+  parser.add_argument('--region_name', metavar='region_name', type=str,
+    action=EnvDefault, envvar='OS_REGION_NAME', help='Region to select for authentication')
+  parser.add_argument('--ca-cert', metavar='ca_cert', type=str,
+    action=EnvDefault, envvar='OS_CACERT', help='Location of the CA cert for validation')
+  parser.add_argument('--insecure', action='store_true', default=False,
+    help='Do not verify certificates')
+  parser.add_argument('--binary', dest='binaries', action='append', default=[],
+    metavar='binary',
+    help='Only check this service (repeatable, default all of them)')
+  parser.add_argument('--heartbeat-warning', dest='heartbeat_warning',
+    type=int, default=30,
+    help='Warn about services whose last heartbeat is older than this '
+    '(seconds, default 30)')
+  parser.add_argument('--heartbeat-critical', dest='heartbeat_critical',
+    type=int, default=60,
+    help='Services whose last heartbeat is older than this are critical '
+    '(seconds, default 60, nova\'s service_down_time)')
+  parser.add_argument('--disabled-is-warn', dest='disabled_is_warn',
+    action='store_true', default=False,
+    help='Warn about disabled services (default they are OK)')
+  parser.add_argument('-w', '--warning', dest='warning', type=int, default=1,
+    help='Warn when this many hosts have a problem (default 1)')
+  parser.add_argument('-c', '--critical', dest='critical', type=int, default=5,
+    help='Critical when this many hosts have a problem (default 5)')
+  parser.add_argument('--command-file', dest='command_file', metavar='path',
+    help='Nagios external command file to submit per host results to')
+  parser.add_argument('--service-description', dest='service_description',
+    default='nova-services',
+    help='Service the per host results are for (default nova-services)')
+  httptrace.add_argument(parser)
+  ratelimit.add_argument(parser)
+  baseline.add_argument(parser)
+  return parser
+
+def heartbeat_age(service, now):
+  """
+  Seconds since the service last reported, None if it never did.
+  """
+  updated = getattr(service, 'updated_at', None)
+  if not updated:
+    return None
+  updated = datetime.strptime(updated.replace('Z', '').split('.')[0],
+                              '%Y-%m-%dT%H:%M:%S')
+  delta = now - updated
+  return delta.days * 86400 + delta.seconds
+
+def service_state(service, age, args):
+  """
+  Returns (state, problem) for a single service.
+  """
+  if service.state != 'up':
+    return STATE_CRITICAL, "%s is down" % service.binary
+  if age is None:
+    return STATE_CRITICAL, "%s has never reported a heartbeat" % \
+      service.binary
+  if age > args.heartbeat_critical:
+    return STATE_CRITICAL, "%s last seen %ds ago" % (service.binary, age)
+  if age > args.heartbeat_warning:
+    return STATE_WARNING, "%s last seen %ds ago" % (service.binary, age)
+  if service.status != 'enabled':
+    reason = getattr(service, 'disabled_reason', None)
+    state = STATE_WARNING if args.disabled_is_warn else STATE_OK
+    return state, "%s disabled%s" % (service.binary,
+                                     " (%s)" % reason if reason else "")
+  return STATE_OK, None
+
+def evaluate(services, args, now=None):
+  """
+  Groups the services by host, returns {host: (state, [problems], count)}.
+  """
+  now = now or datetime.utcnow()
+  hosts = {}
+  for service in services:
+    state, problem = service_state(service, heartbeat_age(service, now), args)
+    host_state, problems, count = hosts.get(service.host, (STATE_OK, [], 0))
+    if problem:
+      problems.append(problem)
+    hosts[service.host] = (max(host_state, state), problems, count + 1)
+  return hosts
+
+def submit_results(command_file, service_description, hosts):
+  """
+  Writes a PROCESS_SERVICE_CHECK_RESULT for every host to the nagios
+  command file, one write per line so they aren't interleaved with others.
+  """
+  now = int(time.time())
+  fd = os.open(command_file, os.O_WRONLY | os.O_APPEND)
+  try:
+    for host, (state, problems, count) in sorted(hosts.iteritems()):
+      output = "%s: %s" % (STATE_NAMES[state], ", ".join(problems) or
+                           "%d services up" % count)
+      os.write(fd, "[%d] PROCESS_SERVICE_CHECK_RESULT;%s;%s;%d;%s\n" % (
+        now, host, service_description, state, output.replace(';', ',')))
+  finally:
+    os.close(fd)
+
+def check_services(nova, args):
+  # Only the services checked count, in the results and the perfdata alike
+  services = [s for s in nova.services.list()
+              if not args.binaries or s.binary in args.binaries]
+  now = datetime.utcnow()
+  hosts = evaluate(services, args, now)
+  if args.command_file:
+    submit_results(args.command_file, args.service_description, hosts)
+
+  ages = [heartbeat_age(s, now) for s in services]
+  failing = sorted(host for host, (state, _, _) in hosts.iteritems()
+                   if state != STATE_OK)
+  perfdata = "services=%d hosts=%d up=%d down=%d disabled=%d " \
+    "hosts_failing=%d;%d;%d;0;%d max_heartbeat_age=%ds;%d;%d;0;" % (
+      len(services), len(hosts),
+      len([s for s in services if s.state == 'up']),
+      len([s for s in services if s.state != 'up']),
+      len([s for s in services if s.status != 'enabled']),
+      len(failing), args.warning, args.critical, len(hosts),
+      max([a for a in ages if a is not None] or [0]),
+      args.heartbeat_warning, args.heartbeat_critical)
+
+  if len(failing) >= args.critical:
+    state = STATE_CRITICAL
+  elif len(failing) >= args.warning:
+    state = STATE_WARNING
+  else:
+    state = STATE_OK
+
+  if not failing:
+    print "OK: %d services up on %d hosts | %s" % (len(services), len(hosts),
+                                                  perfdata)
+  else:
+    print "%s: %d of %d hosts failing | %s" % (STATE_NAMES[state],
+      len(failing), len(hosts), perfdata)
+    # Long output, a line per failing host
+    for host in failing:
+      print "%s: %s" % (host, ", ".join(hosts[host][1]))
+  return state
+
+if __name__ == '__main__':
+  args = collect_args().parse_args()
+  httptrace.setup('check_nova_services', args.trace)
+  ratelimit.setup(args)
+  baseline.setup('check_nova_services', args)
+  try:
+    nova = client.Client(args.username, args.password, args.tenant,
+                         auth_url=args.auth_url,
+                         region_name=args.region_name,
+                         cacert=args.ca_cert, insecure=args.insecure,
+                         service_type="compute")
+    sys.exit(check_services(nova, args))
+  except Exception as e:
+    print "Failed: %s" % str(e)
+    sys.exit(STATE_CRITICAL)
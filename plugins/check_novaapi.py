@@ -29,6 +29,11 @@ import sys
 import argparse
 
 from novaclient.v1_1 import client
+import baseline
+import httptrace
+import ratelimit
+import resultcache
+from inventory import InventoryStore
 from utils import EnvDefault
 
 STATE_OK = 0
@@ -57,22 +62,40 @@ def collect_args():
         action=EnvDefault, envvar='OS_PASSWORD', help='password to use for authentication')
   parser.add_argument('--tenant', metavar='tenant', type=str, required=True,
         action=EnvDefault, envvar='OS_TENANT_NAME', help='tenant name to use for authentication')
+  parser.add_argument('--inventory', metavar='path', type=str,
+        help='SQLite inventory to keep up to date, so only the servers '
+        'changed since the last run are listed')
+  httptrace.add_argument(parser)
+  resultcache.add_argument(parser)
+  ratelimit.add_argument(parser)
+  baseline.add_argument(parser)
   return parser
 
-def check_novaapi(nt):
+def check_novaapi(nt, inventory=None):
 
   global RETURN_STATE
   global STATE_MESSAGE
   RETURN_STATE = STATE_OK
   STATE_MESSAGE = "Failed -"
 
+  #flavors and servers, from the inventory if there is one
+  perfdata = ""
+  if inventory is not None:
+    changed = inventory.refresh(nt, all_tenants=False)
+    flavors = inventory.count('flavors')
+    servers = inventory.count('servers')
+    perfdata = " | servers=%d changed=%d" % (servers, changed)
+  else:
+    flavors = len(nt.flavors.list(detailed=False))
+    servers = len(nt.servers.list())
+
   #flavors
-  if not len(nt.flavors.list(detailed=False)) >= 1:
+  if not flavors >= 1:
     STATE_MESSAGE +=" flavors.list >=1"
     return_state(STATE_WARNING)
 
   #servers
-  if not nt.servers.list():
+  if not servers:
     STATE_MESSAGE +=" servers.list==false"
     return_state(STATE_WARNING)
 
@@ -90,21 +113,28 @@ def check_novaapi(nt):
 
   if RETURN_STATE == STATE_WARNING:
     STATE_MESSAGE +=" does not work"
-    print STATE_MESSAGE
+    print STATE_MESSAGE + perfdata
   else:
-    print "OK - Nova-api Connection established"
+    print "OK - Nova-api Connection established" + perfdata
 
   return RETURN_STATE
 
 if __name__ == '__main__':
   args = collect_args().parse_args()
+  httptrace.setup('check_novaapi', args.trace)
+  resultcache.setup('check_novaapi', args)
+  ratelimit.setup(args)
+  baseline.setup('check_novaapi', args)
   try:
     nt = client.Client(args.username,
          args.password,
          args.tenant,
          args.auth_url,
          service_type="compute")
-    sys.exit(check_novaapi(nt))
+    inventory = None
+    if args.inventory:
+      inventory = InventoryStore(args.inventory)
+    sys.exit(check_novaapi(nt, inventory))
   except Exception as e:
   	print str(e)
   	sys.exit(STATE_CRITICAL)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+#
+# vim: tabstop=2 shiftwidth=2
+#
+# Copyright (C) 2014 Catalyst IT Limited.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; only version 2 of the License is applicable.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# About this plugin:
+#   This nagios plugin probes the swift container databases, which is
+#   where swift gets slow first: it HEADs the account and a designated
+#   (large) container, lists the container a page at a time following
+#   markers, then runs a delimiter and a prefix query against it.
+#
+#   It reports the latency of every kind of request, the listing
+#   throughput in objects/s, and whether the object count HEAD gives
+#   matches the listing (container servers with a backlog of updates
+#   disagree). At most --max-pages pages are listed, so the cost of a
+#   check stays bounded however large the container grows; the counts are
+#   only compared in full when the whole container was listed.
+#
+#   check_swift -l <container> runs this plugin.
+#
+# Example usage:
+#   ./check_swift_listing.py --auth_url http://keystone:5000/v2.0 --username admin --password secret --tenant admin --container probe --max-pages 20 --prefix logs/ --page-critical 5
+#
+
+import argparse
+import os
+import sys
+import time
+
+from swiftclient import client as swift_client
+
+import baseline
+import httptrace
+import ratelimit
+import resultcache
+from utils import EnvDefault
+
+STATE_OK = 0
+STATE_WARNING = 1
+STATE_CRITICAL = 2
+STATE_UNKNOWN = 3
+
+def collect_args():
+  """
+  Collects args passed in the cli.
+  """
+  parser = argparse.ArgumentParser(
+    description='Probes swift container listing and metadata latency')
+  parser.add_argument('--auth_url', metavar='URL', type=str, required=True,
+    action=EnvDefault, envvar='OS_AUTH_URL', help='Keystone URL')
+  parser.add_argument('--username', metavar='username', type=str, required=True,
+    action=EnvDefault, envvar='OS_USERNAME', help='username to use for authentication')
+  parser.add_argument('--password', metavar='password', type=str, required=True,
+    action=EnvDefault, envvar='OS_PASSWORD', help='password to use for authentication')
+  parser.add_argument('--tenant', metavar='tenant', type=str,
+    action=EnvDefault, envvar='OS_TENANT_NAME', help='tenant name to use for authentication')
+  parser.add_argument('--region_name', metavar='region_name', type=str,
+    action=EnvDefault, envvar='OS_REGION_NAME', help='Region to select for authentication')
+  parser.add_argument('--ca-cert', metavar='ca_cert', type=str,
+    action=EnvDefault, envvar='OS_CACERT', help='Location of the CA cert for validation')
+  parser.add_argument('--insecure', action='store_true', default=False,
+    help='Do not verify certificates')
+  parser.add_argument('--auth-version', dest='auth_version', type=str,
+    default=os.environ.get('ST_AUTH_VERSION', '2.0'),
+    help='Swift auth version, 1.0 for tempauth (default %(default)s)')
+  parser.add_argument('--container', dest='container', type=str,
+    required=True, help='Container to probe')
+  parser.add_argument('--page-size', dest='page_size', type=int, default=1000,
+    help='Objects listed per request (default 1000, swift allows 10000)')
+  parser.add_argument('--max-pages', dest='max_pages', type=int, default=10,
+    help='Pages listed at most (default 10)')
+  parser.add_argument('--prefix', dest='prefix', type=str,
+    help='Also time a listing of the objects under this prefix')
+  parser.add_argument('--delimiter', dest='delimiter', type=str, default='/',
+    help='Also time a listing of the top level pseudo directories, "" not '
+    'to (default /)')
+  parser.add_argument('--page-warning', dest='page_warning', type=float,
+    help='Warn when a listing request takes longer (seconds)')
+  parser.add_argument('--page-critical', dest='page_critical', type=float,
+    help='Critical when a listing request takes longer (seconds)')
+  parser.add_argument('--head-warning', dest='head_warning', type=float,
+    help='Warn when a HEAD takes longer (seconds)')
+  parser.add_argument('--head-critical', dest='head_critical', type=float,
+    help='Critical when a HEAD takes longer (seconds)')
+  parser.add_argument('--count-warning', dest='count_warning', type=int,
+    help='Warn when HEAD and the listing disagree by this many objects '
+    '(by default the difference is only reported as perfdata)')
+  parser.add_argument('--count-critical', dest='count_critical', type=int,
+    help='Critical when HEAD and the listing disagree by this many objects')
+  httptrace.add_argument(parser)
+  resultcache.add_argument(parser)
+  ratelimit.add_argument(parser)
+  baseline.add_argument(parser)
+  return parser
+
+def timed(function, *args, **kwargs):
+  """
+  Calls function, returns its result and the seconds it took, leaving out
+  any time queued by --rate-limit.
+  """
+  start = time.time() - ratelimit.queued()
+  result = function(*args, **kwargs)
+  return result, time.time() - ratelimit.queued() - start
+
+def walk(conn, container, page_size, max_pages, prefix=None, delimiter=None):
+  """
+  Lists container a page at a time, following markers, for at most
+  max_pages pages. Only counters and page latencies are kept.
+  """
+  stats = {'pages': 0, 'objects': 0, 'subdirs': 0, 'bytes': 0,
+           'latencies': [], 'complete': False}
+  marker = None
+  while stats['pages'] < max_pages:
+    (headers, listing), latency = timed(conn.get_container, container,
+      marker=marker, limit=page_size, prefix=prefix, delimiter=delimiter)
+    stats['pages'] += 1
+    stats['latencies'].append(latency)
+    for entry in listing:
+      if 'subdir' in entry:
+        stats['subdirs'] += 1
+      else:
+        stats['objects'] += 1
+        stats['bytes'] += entry.get('bytes') or 0
+    if len(listing) < page_size:
+      stats['complete'] = True
+      break
+    marker = listing[-1].get('name') or listing[-1].get('subdir')
+  return stats
+
+def count_difference(head_count, listing):
+  """
+  How many objects HEAD and the listing disagree by. A partial listing can
+  only be caught finding more objects than HEAD says there are.
+  """
+  if listing['complete']:
+    return abs(head_count - listing['objects'])
+  return max(listing['objects'] - head_count, 0)
+
+def threshold(value):
+  return '' if value is None else value
+
+def unknown(value):
+  return 'U' if value is None else value
+
+def grade(value, warning, critical):
+  if critical is not None and value >= critical:
+    return STATE_CRITICAL
+  if warning is not None and value >= warning:
+    return STATE_WARNING
+  return STATE_OK
+
+def check_listing(conn, args):
+  account, head_account = timed(conn.head_account)
+  container, head_container = timed(conn.head_container, args.container)
+  head_count = container.get('x-container-object-count')
+  if head_count is not None:
+    head_count = int(head_count)
+
+  listing = walk(conn, args.container, args.page_size, args.max_pages)
+  queries = []
+  if args.delimiter:
+    queries.append(('delimiter', walk(conn, args.container, args.page_size,
+                                      1, delimiter=args.delimiter)))
+  if args.prefix:
+    queries.append(('prefix', walk(conn, args.container, args.page_size, 1,
+                                   prefix=args.prefix)))
+
+  latencies = listing['latencies']
+  listing_time = sum(latencies)
+  slowest = max(latencies + [q['latencies'][0] for _, q in queries])
+  slowest_head = max(head_account, head_container)
+  difference = None
+  if head_count is not None:
+    difference = count_difference(head_count, listing)
+  rate = listing['objects'] / listing_time if listing_time else 0
+
+  checks = [(slowest, args.page_warning, args.page_critical,
+             "slowest listing took %.3fs" % slowest),
+            (slowest_head, args.head_warning, args.head_critical,
+             "slowest HEAD took %.3fs" % slowest_head)]
+  # Without the count header there is nothing to compare
+  if difference is not None:
+    checks.append((difference, args.count_warning, args.count_critical,
+                   "HEAD counts %d objects, listing found %d%s" % (
+                     head_count, listing['objects'],
+                     "" if listing['complete'] else " in the first pages")))
+  problems = []
+  state = STATE_OK
+  for value, warning, critical, what in checks:
+    value_state = grade(value, warning, critical)
+    if value_state != STATE_OK:
+      problems.append(what)
+      state = max(state, value_state)
+
+  perfdata = ["head_account=%.3fs;%s;%s;0;" % (head_account,
+                threshold(args.head_warning), threshold(args.head_critical)),
+              "head_container=%.3fs;%s;%s;0;" % (head_container,
+                threshold(args.head_warning), threshold(args.head_critical)),
+              "pages=%d;;;0;%d" % (listing['pages'], args.max_pages),
+              "objects=%d;;;0;" % listing['objects'],
+              "container_objects=%s;;;0;" % unknown(head_count),
+              "count_difference=%s;%s;%s;0;" % (unknown(difference),
+                threshold(args.count_warning), threshold(args.count_critical)),
+              "page_first=%.3fs;;;0;" % latencies[0],
+              "page_avg=%.3fs;;;0;" % (listing_time / len(latencies)),
+              "page_max=%.3fs;%s;%s;0;" % (max(latencies),
+                threshold(args.page_warning), threshold(args.page_critical)),
+              "objects_per_s=%.1f;;;0;" % rate]
+  for name, query in queries:
+    perfdata.append("%s_query=%.3fs;%s;%s;0;" % (name, query['latencies'][0],
+      threshold(args.page_warning), threshold(args.page_critical)))
+  perfdata = " ".join(perfdata)
+
+  summary = "%d objects listed in %d pages (%.0f objects/s)%s" % (
+    listing['objects'], listing['pages'], rate,
+    "" if listing['complete'] else ", page cap reached")
+  if state == STATE_OK:
+    print "OK: container %s, %s, slowest listing %.3fs | %s" % (
+      args.container, summary, slowest, perfdata)
+  else:
+    print "Failed: container %s, %s, %s | %s" % (
+      args.container, summary, ", ".join(problems), perfdata)
+  return state
+
+if __name__ == '__main__':
+  args = collect_args().parse_args()
+  httptrace.setup('check_swift_listing', args.trace)
+  resultcache.setup('check_swift_listing', args)
+  ratelimit.setup(args)
+  baseline.setup('check_swift_listing', args)
+  try:
+    conn = swift_client.Connection(authurl=args.auth_url,
+                                   user=args.username,
+                                   key=args.password,
+                                   tenant_name=args.tenant,
+                                   auth_version=args.auth_version,
+                                   os_options={'region_name':
+                                               args.region_name},
+                                   cacert=args.ca_cert,
+                                   insecure=args.insecure,
+                                   retries=0)
+    # Authenticate first, so the token isn't timed as part of a HEAD
+    conn.get_auth()
+    sys.exit(check_listing(conn, args))
+  except Exception as e:
+    print "Failed: %s" % str(e)
+    sys.exit(STATE_CRITICAL)
@@ -33,6 +33,11 @@ import nose
 import sys
 import traceback
 
+import baseline
+import httptrace
+import ratelimit
+import resultcache
+
 STATE_OK = 0
 STATE_WARNING = 1
 STATE_CRITICAL = 2
@@ -50,6 +55,10 @@ def collect_args():
       required=True, help='Do not verify certificates')
   parser.add_argument('-w','--failiswarn', dest='failiswarn', action='store_true',
       help='return warn on failure (default is critical)')
+  httptrace.add_argument(parser)
+  resultcache.add_argument(parser)
+  ratelimit.add_argument(parser)
+  baseline.add_argument(parser)
   return parser
 
 def check_tempest(args):
@@ -67,6 +76,10 @@ def check_tempest(args):
 
 if __name__ == '__main__':
   args = collect_args().parse_args()
+  httptrace.setup('check_tempest', args.trace)
+  resultcache.setup('check_tempest', args)
+  ratelimit.setup(args)
+  baseline.setup('check_tempest', args)
   try:
     check_tempest(args)
   except Exception as e:
@@ -0,0 +1,201 @@
+#
+# On-disk journal of the evacuation of a compute host.
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# nova_evacuate_vms.py records, for every VM of the host, the target it
+# was planned to, when evacuate was called and the status nova last
+# reported, so a re-run picks up where the last one stopped.
+#
+# <journal-dir>/<host>.journal holds one JSON object per line: a header
+# ({"host": ..., "started": ...}) followed by updates to single VMs
+# ({"id": ..., "target": ...}), which are replayed in order on load. Only
+# appending keeps each update cheap, and a line cut short by a crash is
+# simply ignored.
+#
+# <journal-dir>/<host>.status is a summary of the journal, rewritten after
+# each VM: the state of every VM, counts, throughput and an ETA, for
+# check_nova_evacuation.py to report on.
+#
+# Whoever opens the journal holds a flock on <journal-dir>/<host>.lock
+# until it is closed, so a second run for the same host (a re-notification,
+# another --detach child) can't evacuate its VMs a second time.
+#
+
+import errno
+import fcntl
+import json
+import os
+import time
+
+from utils import ensure_dir
+from utils import write_atomic
+
+ACTIVE = 'ACTIVE'
+
+# States of a VM in the status file
+STATES = ('pending', 'rebuilding', 'active', 'error', 'failed')
+
+
+def vm_state(entry):
+    """The state of a VM, from its journal entry."""
+    if entry.get('status') == ACTIVE:
+        return 'active'
+    if entry.get('issued'):
+        return 'error' if entry.get('status') == 'ERROR' else 'rebuilding'
+    if entry.get('error'):
+        return 'failed'
+    return 'pending'
+
+
+class JournalBusy(Exception):
+    """Another process has the journal open."""
+
+
+class EvacuationJournal(object):
+
+    def __init__(self, path, host, started=None):
+        self.path = path
+        self.host = host
+        self.started = started if started is not None else time.time()
+        self.vms = {}
+        self._file = None
+        self._lock = None
+
+    @classmethod
+    def read(cls, path):
+        """Replays the journal at path, None if there isn't a valid one."""
+        try:
+            f = open(path)
+        except IOError:
+            return None
+        with f:
+            journal = None
+            for line in f:
+                try:
+                    update = json.loads(line)
+                except ValueError:
+                    continue
+                if journal is None:
+                    if 'started' not in update:
+                        return None
+                    journal = cls(path, update['host'], update['started'])
+                elif 'id' in update:
+                    journal.vms.setdefault(update.pop('id'), {}).update(update)
+        return journal
+
+    @classmethod
+    def open(cls, journal_dir, host, max_age):
+        """The journal of host, a new one if it's missing or older than
+        max_age seconds.
+
+        It stays locked until closed; raises JournalBusy if another process
+        has it open.
+        """
+        ensure_dir(journal_dir)
+        lock = open(lock_path(journal_dir, host), 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as e:
+            lock.close()
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                raise JournalBusy("%s is already being evacuated" % host)
+            raise
+        path = journal_path(journal_dir, host)
+        journal = cls.read(path)
+        if journal is None or time.time() - journal.started > max_age:
+            journal = cls(path, host)
+            journal._append({'host': host, 'started': journal.started},
+                            mode='w')
+        journal._lock = lock
+        return journal
+
+    def _append(self, update, mode='a'):
+        if self._file is None or mode == 'w':
+            self._file = open(self.path, mode)
+        self._file.write(json.dumps(update) + '\n')
+        self._file.flush()
+
+    def record(self, vm_id, **kwargs):
+        """Updates what is known of a VM, e.g. record(id, status='ERROR')."""
+        self.vms.setdefault(vm_id, {}).update(kwargs)
+        kwargs['id'] = vm_id
+        self._append(kwargs)
+
+    def done(self, vm_id):
+        return self.vms.get(vm_id, {}).get('status') == ACTIVE
+
+    def in_flight(self, vm_id):
+        """Evacuate was called, but the VM isn't ACTIVE yet."""
+        entry = self.vms.get(vm_id, {})
+        return bool(entry.get('issued')) and entry.get('status') != ACTIVE
+
+    def complete(self):
+        """Every VM of the journal is ACTIVE again."""
+        return bool(self.vms) and all(self.done(vm_id) for vm_id in self.vms)
+
+    def pending(self):
+        """Ids of the VMs not ACTIVE yet."""
+        return sorted(vm_id for vm_id in self.vms if not self.done(vm_id))
+
+    def status(self, finished=None):
+        """Summary of the journal, as written to the status file."""
+        now = finished or time.time()
+        vms = {}
+        counts = dict.fromkeys(STATES, 0)
+        for vm_id, entry in self.vms.iteritems():
+            state = vm_state(entry)
+            counts[state] += 1
+            vms[vm_id] = {'name': entry.get('name'),
+                          'target': entry.get('target'), 'state': state}
+
+        # VMs brought back per second, since the evacuation started
+        rate = 0.0
+        if now > self.started:
+            rate = counts['active'] / (now - self.started)
+        left = counts['pending'] + counts['rebuilding']
+        eta = left / rate if rate and not finished else None
+        return {'host': self.host, 'started': self.started,
+                'finished': finished, 'updated': time.time(),
+                'pid': os.getpid(), 'total': len(self.vms),
+                'counts': counts, 'rate': rate, 'eta': eta, 'vms': vms}
+
+    def write_status(self, finished=False):
+        """Rewrites the status file, finished once the work is over."""
+        status = self.status(time.time() if finished else None)
+        write_atomic(status_path(os.path.dirname(self.path), self.host),
+                     json.dumps(status))
+
+    def close(self):
+        """Closes the journal, and lets other processes open it."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+
+def journal_path(journal_dir, host):
+    return os.path.join(journal_dir, '%s.journal' % host)
+
+
+def status_path(journal_dir, host):
+    return os.path.join(journal_dir, '%s.status' % host)
+
+
+def lock_path(journal_dir, host):
+    return os.path.join(journal_dir, '%s.lock' % host)
@@ -0,0 +1,176 @@
+#
+# HTTP request accounting for the plugins.
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# The OpenStack clients (through requests/urllib3) and urllib2 all end up
+# in httplib, so hooking HTTPConnection there sees every request a plugin
+# makes. When tracing is enabled a JSON summary of the run is appended to a
+# side file, or sent to syslog, at exit. Nagios output is left untouched.
+#
+
+import atexit
+import httplib
+import json
+import re
+import syslog
+import time
+
+from utils import EnvDefault
+
+TRACE_ENVVAR = 'OS_PLUGIN_TRACE'
+
+# Ids and tokens in paths are collapsed, so calls aggregate and tokens
+# never end up in trace files
+_ID_RE = re.compile(r'^([0-9a-fA-F-]{16,}|\d+|AUTH_\w+)$')
+
+_tracer = None
+
+
+def template(path):
+    """Returns path without its query string and with ids replaced by '*'."""
+    path = path.split('?', 1)[0]
+    return '/'.join(['*' if _ID_RE.match(part) else part
+                     for part in path.split('/')])
+
+
+class Tracer(object):
+    """Records every HTTP request made by this process."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.calls = []
+
+    def summary(self):
+        endpoints = {}
+        for call in self.calls:
+            per = endpoints.setdefault(call['endpoint'], {
+                'requests': 0, 'errors': 0, 'bytes_sent': 0,
+                'bytes_received': 0, 'latency': 0.0})
+            per['requests'] += 1
+            per['bytes_sent'] += call['bytes_sent']
+            per['bytes_received'] += call['bytes_received']
+            per['latency'] += call['latency']
+            if call['status'] is None or call['status'] >= 400:
+                per['errors'] += 1
+        return {'plugin': self.name,
+                'started': self.started,
+                'duration': time.time() - self.started,
+                'requests': len(self.calls),
+                'bytes_sent': sum(c['bytes_sent'] for c in self.calls),
+                'bytes_received': sum(c['bytes_received']
+                                      for c in self.calls),
+                'endpoints': endpoints,
+                'calls': self.calls}
+
+    def write(self, target):
+        """Appends the summary as one json line to target, or syslog."""
+        summary = json.dumps(self.summary(), sort_keys=True)
+        if target == 'syslog':
+            syslog.syslog(syslog.LOG_INFO, summary)
+        else:
+            with open(target, 'a') as f:
+                f.write(summary + '\n')
+
+
+def _traced_putrequest(putrequest):
+    def traced_putrequest(self, method, url, *args, **kwargs):
+        result = putrequest(self, method, url, *args, **kwargs)
+        # Timed from here, so the wait of a rate limiter installed before
+        # is left out
+        self._trace = {'method': method,
+                       'endpoint': '%s:%s' % (self.host, self.port),
+                       'path': template(url), 'status': None,
+                       'bytes_sent': 0, 'bytes_received': 0,
+                       'latency': 0.0, 'start': time.time()}
+        return result
+    return traced_putrequest
+
+
+def _traced_send(send):
+    def traced_send(self, data):
+        call = getattr(self, '_trace', None)
+        if call is not None and isinstance(data, basestring):
+            call['bytes_sent'] += len(data)
+        return send(self, data)
+    return traced_send
+
+
+def _traced_getresponse(getresponse):
+    def traced_getresponse(self, *args, **kwargs):
+        call = getattr(self, '_trace', None)
+        self._trace = None
+        if call is None or _tracer is None:
+            return getresponse(self, *args, **kwargs)
+        start = call.pop('start')
+        _tracer.calls.append(call)
+        try:
+            response = getresponse(self, *args, **kwargs)
+        except Exception as e:
+            call['error'] = str(e)
+            raise
+        finally:
+            # Time to response headers, body download is not included
+            call['latency'] = time.time() - start
+        call['status'] = response.status
+        response._trace = call
+        return response
+    return traced_getresponse
+
+
+def _traced_read(read):
+    def traced_read(self, *args, **kwargs):
+        data = read(self, *args, **kwargs)
+        call = getattr(self, '_trace', None)
+        if call is not None and data:
+            call['bytes_received'] += len(data)
+        return data
+    return traced_read
+
+
+def install(name):
+    """Starts recording requests in-process, returns the Tracer.
+
+    Wraps the httplib methods in place when first called, rate limiting
+    or other wrappers installed before included; later calls return the
+    same Tracer.
+    """
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(name)
+        connection = httplib.HTTPConnection
+        connection.putrequest = _traced_putrequest(connection.putrequest)
+        connection.send = _traced_send(connection.send)
+        connection.getresponse = _traced_getresponse(connection.getresponse)
+        httplib.HTTPResponse.read = _traced_read(httplib.HTTPResponse.read)
+    return _tracer
+
+
+def setup(name, target):
+    """Enables tracing to target (a file or 'syslog') if it's set."""
+    if not target:
+        return None
+    tracer = install(name)
+    atexit.register(tracer.write, target)
+    return tracer
+
+
+def add_argument(parser):
+    parser.add_argument('--trace', metavar='FILE', type=str,
+                        action=EnvDefault, envvar=TRACE_ENVVAR,
+                        help='Append a json summary of every HTTP request '
+                        'made to FILE (or "syslog")')
@@ -0,0 +1,286 @@
+#
+# Local, incrementally refreshed store of the nova inventory.
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Servers, flavors, hypervisors and server groups are kept in SQLite,
+# indexed by id, host and group membership. Only the first refresh lists
+# every server: later ones ask nova for the servers changed since the last
+# one (changes-since, which also returns deleted servers). Flavors,
+# hypervisors and server groups are small and listed in full.
+#
+# Rows are returned as Records, with the attribute names of the novaclient
+# resources they stand for, so they can be used in their place.
+#
+# A store holds either every tenant's servers or a single tenant's. Sharing
+# one between an admin and a tenant scoped user would relist every server
+# on each refresh, so a refresh in the other scope is refused unless full.
+#
+
+import sqlite3
+import time
+from datetime import datetime
+
+import placement
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS servers (
+    id TEXT PRIMARY KEY, name TEXT, status TEXT, tenant_id TEXT,
+    host TEXT, hypervisor TEXT, flavor_id TEXT, updated TEXT);
+CREATE INDEX IF NOT EXISTS servers_host ON servers (host);
+CREATE INDEX IF NOT EXISTS servers_hypervisor ON servers (hypervisor);
+CREATE TABLE IF NOT EXISTS flavors (
+    id TEXT PRIMARY KEY, name TEXT, vcpus INTEGER, ram INTEGER,
+    disk INTEGER);
+CREATE TABLE IF NOT EXISTS hypervisors (
+    hypervisor_hostname TEXT PRIMARY KEY, state TEXT, status TEXT,
+    vcpus INTEGER, vcpus_used INTEGER, memory_mb INTEGER,
+    memory_mb_used INTEGER, running_vms INTEGER);
+CREATE TABLE IF NOT EXISTS server_groups (
+    id TEXT PRIMARY KEY, name TEXT, policy TEXT);
+CREATE TABLE IF NOT EXISTS group_members (
+    group_id TEXT, server_id TEXT, PRIMARY KEY (group_id, server_id));
+CREATE INDEX IF NOT EXISTS group_members_server ON group_members (server_id);
+"""
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+SERVICE_HOST_ATTR = 'OS-EXT-SRV-ATTR:host'
+
+SCOPES = {'all': "every tenant's", 'tenant': "a single tenant's"}
+
+
+class ScopeError(Exception):
+    """The store was refreshed in another scope."""
+
+
+class Record(object):
+    """A stored row, with the attributes of the novaclient resource."""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __repr__(self):
+        return '<Record %s>' % self.__dict__
+
+
+def _server_record(row):
+    record = Record(id=row['id'], name=row['name'], status=row['status'],
+                    tenant_id=row['tenant_id'], updated=row['updated'],
+                    flavor={'id': row['flavor_id']})
+    setattr(record, SERVICE_HOST_ATTR, row['host'])
+    setattr(record, placement.HOST_ATTR, row['hypervisor'])
+    return record
+
+
+class InventoryStore(object):
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=timeout)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def _meta(self, key):
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?',
+                              (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                        (key, str(value)))
+
+    @property
+    def refreshed(self):
+        """Time of the last successful refresh (epoch), None if never."""
+        value = self._meta('refreshed')
+        return float(value) if value is not None else None
+
+    def refresh(self, nova, all_tenants=True, overlap=60, full=False):
+        """Brings the store up to date, returns the number of changed servers.
+
+        all_tenants needs an admin user, and is also when hypervisors and
+        server groups (admin only APIs) are refreshed. overlap seconds are
+        asked for twice, to allow for clock skew between us and nova.
+
+        Raises ScopeError if the store holds the other scope, unless full
+        is given to start it over in this one.
+        """
+        started = time.time()
+        scope = 'all' if all_tenants else 'tenant'
+        since = self._meta('servers_since')
+        stored = self._meta('scope')
+        if stored is not None and stored != scope and not full:
+            raise ScopeError("%s holds %s servers, not %s; give each "
+                             "scope its own store" % (
+                                 self.path, SCOPES[stored], SCOPES[scope]))
+        if full:
+            since = None
+
+        # Talk to nova before taking the write lock
+        opts = {}
+        if all_tenants:
+            opts['all_tenants'] = 1
+        if since is not None:
+            opts['changes-since'] = datetime.utcfromtimestamp(
+                float(since)).strftime(TIME_FORMAT)
+        servers = list(placement.list_servers(nova, opts))
+        flavors = nova.flavors.list()
+        if all_tenants:
+            hypervisors = nova.hypervisors.list()
+            groups = placement.list_server_groups(nova)
+
+        with self.db:
+            if since is None:
+                self.db.execute('DELETE FROM servers')
+            for server in servers:
+                if server.status == 'DELETED':
+                    self.db.execute('DELETE FROM servers WHERE id = ?',
+                                    (server.id,))
+                    self.db.execute('DELETE FROM group_members '
+                                    'WHERE server_id = ?', (server.id,))
+                    continue
+                self.db.execute(
+                    'INSERT OR REPLACE INTO servers VALUES '
+                    '(?, ?, ?, ?, ?, ?, ?, ?)',
+                    (server.id, server.name, server.status,
+                     getattr(server, 'tenant_id', None),
+                     getattr(server, SERVICE_HOST_ATTR, None),
+                     getattr(server, placement.HOST_ATTR, None),
+                     server.flavor['id'], getattr(server, 'updated', None)))
+
+            # Deleted flavors aren't listed, but servers may still use them,
+            # so flavors are only ever added or updated
+            for flavor in flavors:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO flavors VALUES (?, ?, ?, ?, ?)',
+                    (flavor.id, flavor.name, flavor.vcpus, flavor.ram,
+                     getattr(flavor, 'disk', 0)))
+
+            if all_tenants:
+                self.db.execute('DELETE FROM hypervisors')
+                for hyp in hypervisors:
+                    self.db.execute(
+                        'INSERT INTO hypervisors VALUES '
+                        '(?, ?, ?, ?, ?, ?, ?, ?)',
+                        (hyp.hypervisor_hostname,
+                         getattr(hyp, 'state', 'up'),
+                         getattr(hyp, 'status', 'enabled'), hyp.vcpus,
+                         hyp.vcpus_used, hyp.memory_mb, hyp.memory_mb_used,
+                         getattr(hyp, 'running_vms', None)))
+                self.db.execute('DELETE FROM server_groups')
+                self.db.execute('DELETE FROM group_members')
+                for group in groups:
+                    policy = group.policies[0] if group.policies else None
+                    self.db.execute(
+                        'INSERT INTO server_groups VALUES (?, ?, ?)',
+                        (group.id, getattr(group, 'name', None), policy))
+                    for member in group.members:
+                        self.db.execute(
+                            'INSERT OR IGNORE INTO group_members '
+                            'VALUES (?, ?)', (group.id, member))
+
+            self._set_meta('scope', scope)
+            self._set_meta('servers_since', started - overlap)
+            self._set_meta('refreshed', time.time())
+        return len(servers)
+
+    def count(self, table):
+        return self.db.execute('SELECT count(*) FROM %s' % table).fetchone()[0]
+
+    def server(self, server_id):
+        row = self.db.execute('SELECT * FROM servers WHERE id = ?',
+                              (server_id,)).fetchone()
+        return _server_record(row) if row else None
+
+    def __getitem__(self, server_id):
+        server = self.server(server_id)
+        if server is None:
+            raise KeyError(server_id)
+        return server
+
+    def servers(self):
+        """Every server, as a {id: Record} dict."""
+        return dict((row['id'], _server_record(row)) for row in
+                    self.db.execute('SELECT * FROM servers'))
+
+    def servers_on_host(self, host):
+        """Servers whose compute service or hypervisor is host."""
+        return [_server_record(row) for row in self.db.execute(
+            'SELECT * FROM servers WHERE host = ? UNION '
+            'SELECT * FROM servers WHERE hypervisor = ?', (host, host))]
+
+    def move_server(self, server_id, host):
+        """Records a server was moved (e.g. evacuated) to host.
+
+        Only call it once the move is known to have succeeded: a wrong
+        host is only corrected when the server changes again.
+        """
+        with self.db:
+            self.db.execute('UPDATE servers SET host = ?, hypervisor = ? '
+                            'WHERE id = ?', (host, host, server_id))
+
+    def flavors(self):
+        """Every flavor, as a {id: Record} dict."""
+        return dict((row['id'], Record(**dict(zip(row.keys(), row))))
+                    for row in self.db.execute('SELECT * FROM flavors'))
+
+    def hypervisors(self):
+        return [Record(**dict(zip(row.keys(), row))) for row in
+                self.db.execute('SELECT * FROM hypervisors')]
+
+    def _group_record(self, row):
+        members = [r[0] for r in self.db.execute(
+            'SELECT server_id FROM group_members WHERE group_id = ?',
+            (row['id'],))]
+        return Record(id=row['id'], name=row['name'],
+                      policies=[row['policy']] if row['policy'] else [],
+                      members=members)
+
+    def server_groups(self):
+        return [self._group_record(row) for row in
+                self.db.execute('SELECT * FROM server_groups')]
+
+    def server_groups_of(self, server_id):
+        """The groups server_id is a member of."""
+        return [self._group_record(row) for row in self.db.execute(
+            'SELECT g.* FROM server_groups g JOIN group_members m '
+            'ON m.group_id = g.id WHERE m.server_id = ?', (server_id,))]
+
+    def load_cloud(self, cpu_ratio=1.0, ram_ratio=1.0):
+        """Builds a placement.Cloud from the store, as placement.load_cloud."""
+        cloud = placement.Cloud()
+        for hyp in self.hypervisors():
+            cloud.add_host(hyp.hypervisor_hostname,
+                           hyp.vcpus * cpu_ratio - hyp.vcpus_used,
+                           hyp.memory_mb * ram_ratio - hyp.memory_mb_used,
+                           hyp.state == 'up' and hyp.status == 'enabled')
+        flavors = self.flavors()
+        for row in self.db.execute('SELECT id, name, hypervisor, flavor_id '
+                                   'FROM servers'):
+            flavor = flavors.get(row['flavor_id'])
+            if flavor is None:
+                continue
+            cloud.add_vm(row['id'], row['name'], row['hypervisor'],
+                         flavor.vcpus, flavor.ram)
+        for group in self.server_groups():
+            policy = group.policies[0] if group.policies else None
+            cloud.add_group(group.id, policy, group.members)
+        return cloud
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,150 @@
+#
+# Keystone token issuance load test, for check_keystone --load-test.
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# A number of threads authenticate in a loop (and optionally validate the
+# token they got) for a fixed duration, starting one after the other over
+# the ramp up. Whatever the concurrency, requests are paced to at most
+# max_rate per second, and the test stops early when too many of them
+# fail, so it can be pointed at a production keystone off-peak.
+#
+
+import threading
+import time
+
+# Errors are only judged after this many requests
+MIN_REQUESTS = 20
+
+
+def percentile(values, q):
+    """The q (0-1) percentile of sorted values, None if there are none."""
+    if not values:
+        return None
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+class Pacer(object):
+    """Spaces calls out to at most rate per second, across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.time()
+            slot = max(self.next, now)
+            self.next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class LoadTest(object):
+    """Runs authenticate() (and validate(token)) from concurrent threads.
+
+    authenticate returns a token, both raise on failure.
+    """
+
+    def __init__(self, authenticate, validate=None, concurrency=10,
+                 duration=60, ramp_up=10, max_rate=10, max_error_rate=0.5):
+        self.authenticate = authenticate
+        self.validate = validate
+        self.concurrency = concurrency
+        self.duration = duration
+        self.ramp_up = min(ramp_up, duration)
+        self.max_error_rate = max_error_rate
+        self.pacer = Pacer(max_rate)
+        self.lock = threading.Lock()
+        self.auths = []
+        self.validations = []
+        self.errors = []
+        self.aborted = None
+
+    def record(self, results, start, error=None):
+        with self.lock:
+            if error is not None:
+                self.errors.append(str(error) or error.__class__.__name__)
+            else:
+                results.append((time.time(), time.time() - start))
+            requests = len(self.auths) + len(self.validations) + \
+                len(self.errors)
+            if requests >= MIN_REQUESTS and self.aborted is None and \
+                    len(self.errors) > self.max_error_rate * requests:
+                self.aborted = "%d of %d requests failed" % (
+                    len(self.errors), requests)
+
+    def call(self, results, function, *args):
+        self.pacer.wait()
+        start = time.time()
+        if start >= self.deadline:
+            return None
+        try:
+            value = function(*args)
+        except Exception as e:
+            self.record(results, start, e)
+            return None
+        self.record(results, start)
+        return value
+
+    def worker(self, delay):
+        time.sleep(delay)
+        while time.time() < self.deadline and self.aborted is None:
+            token = self.call(self.auths, self.authenticate)
+            if token and self.validate:
+                self.call(self.validations, self.validate, token)
+
+    def run(self):
+        self.started = time.time()
+        self.deadline = self.started + self.duration
+        threads = []
+        for i in range(self.concurrency):
+            thread = threading.Thread(
+                target=self.worker,
+                args=(self.ramp_up * i / float(self.concurrency),))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        self.finished = time.time()
+        return self.results()
+
+    def results(self):
+        # The rate is measured once every thread is running
+        ramped = self.started + self.ramp_up
+        if self.finished - ramped < 1:
+            ramped = self.started
+        steady = [t for t, latency in self.auths if t >= ramped]
+        auth = sorted(latency for t, latency in self.auths)
+        validation = sorted(latency for t, latency in self.validations)
+        requests = len(self.auths) + len(self.validations) + len(self.errors)
+        return {'elapsed': self.finished - self.started,
+                'tokens': len(self.auths),
+                'validations': len(self.validations),
+                'errors': len(self.errors),
+                'requests': requests,
+                'error_rate': len(self.errors) / float(requests or 1),
+                'tokens_per_s': len(steady) / (self.finished - ramped),
+                'p50': percentile(auth, 0.5),
+                'p95': percentile(auth, 0.95),
+                'p99': percentile(auth, 0.99),
+                'validate_p95': percentile(validation, 0.95),
+                'first_error': self.errors[0] if self.errors else None,
+                'aborted': self.aborted}
@@ -0,0 +1,281 @@
+#
+# Array-backed model of nova hypervisor capacity, for evacuation planning.
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Hosts, VMs and server groups are numbered, and their attributes kept in
+# parallel arrays, so a plan for thousands of hypervisors is cheap to
+# compute. Like nova_evacuate_vms.py, hosts are identified by their
+# hypervisor_hostname.
+#
+
+import heapq
+from array import array
+
+HOST_ATTR = 'OS-EXT-SRV-ATTR:hypervisor_hostname'
+
+AFFINITY = 'affinity'
+ANTI_AFFINITY = 'anti-affinity'
+
+
+class Cloud(object):
+    """Free capacity of each hypervisor, and the VMs running on them."""
+
+    def __init__(self):
+        self.hosts = []
+        self.host_index = {}
+        self.usable = array('b')
+        self.free_vcpus = array('l')
+        self.free_ram = array('l')
+        self.host_vms = []
+
+        self.vms = []
+        self.vm_index = {}
+        self.vm_names = []
+        self.vm_host = array('l')
+        self.vm_vcpus = array('l')
+        self.vm_ram = array('l')
+        self.vm_group = array('l')
+
+        self.groups = []
+        self.group_policy = []
+        self.group_members = []
+
+    def add_host(self, name, free_vcpus, free_ram, usable=True):
+        self.host_index[name] = len(self.hosts)
+        self.hosts.append(name)
+        self.usable.append(1 if usable else 0)
+        self.free_vcpus.append(int(free_vcpus))
+        self.free_ram.append(int(free_ram))
+        self.host_vms.append([])
+
+    def add_vm(self, vm_id, name, host, vcpus, ram):
+        """Adds a VM, host being a hypervisor_hostname (or None)."""
+        index = len(self.vms)
+        host = self.host_index.get(host, -1)
+        self.vm_index[vm_id] = index
+        self.vms.append(vm_id)
+        self.vm_names.append(name)
+        self.vm_host.append(host)
+        self.vm_vcpus.append(int(vcpus))
+        self.vm_ram.append(int(ram))
+        self.vm_group.append(-1)
+        if host >= 0:
+            self.host_vms[host].append(index)
+
+    def add_group(self, group_id, policy, members):
+        """Adds a server group, members being VM ids."""
+        index = len(self.groups)
+        self.groups.append(group_id)
+        self.group_policy.append(policy)
+        indices = []
+        for member in members:
+            vm = self.vm_index.get(member)
+            if vm is not None:
+                self.vm_group[vm] = index
+                indices.append(vm)
+        self.group_members.append(indices)
+
+    def host_load(self, host):
+        """RAM allocated to the VMs on a host."""
+        return sum(self.vm_ram[vm] for vm in self.host_vms[host])
+
+
+def list_servers(nova, search_opts=None, page_size=1000):
+    """Yields every server, paging with markers.
+
+    nova caps a single listing at osapi_max_limit (1000 by default), so a
+    plain servers.list() silently misses servers on a big cloud.
+    """
+    opts = dict(search_opts or {})
+    opts['limit'] = page_size
+    while True:
+        page = nova.servers.list(search_opts=opts)
+        for server in page:
+            yield server
+        if len(page) < page_size:
+            break
+        opts['marker'] = page[-1].id
+
+
+def list_server_groups(nova):
+    """Server groups of every project, if the client supports it."""
+    try:
+        return nova.server_groups.list(all_projects=True)
+    except TypeError:
+        return nova.server_groups.list()
+
+
+def load_cloud(nova, cpu_ratio=1.0, ram_ratio=1.0):
+    """Builds a Cloud from bulk nova listings.
+
+    Free capacity accounts for the given overcommit ratios, as the nova
+    scheduler does with cpu_allocation_ratio and ram_allocation_ratio.
+    """
+    cloud = Cloud()
+    for hyp in nova.hypervisors.list():
+        usable = getattr(hyp, 'state', 'up') == 'up' and \
+            getattr(hyp, 'status', 'enabled') == 'enabled'
+        cloud.add_host(hyp.hypervisor_hostname,
+                       hyp.vcpus * cpu_ratio - hyp.vcpus_used,
+                       hyp.memory_mb * ram_ratio - hyp.memory_mb_used,
+                       usable)
+
+    flavors = {}
+    for flavor in nova.flavors.list():
+        flavors[flavor.id] = flavor
+    for vm in list_servers(nova, {'all_tenants': 1}):
+        flavor_id = vm.flavor['id']
+        if flavor_id not in flavors:
+            # Deleted flavors aren't listed, but can still be fetched
+            flavors[flavor_id] = nova.flavors.get(flavor_id)
+        flavor = flavors[flavor_id]
+        cloud.add_vm(vm.id, vm.name, getattr(vm, HOST_ATTR, None),
+                     flavor.vcpus, flavor.ram)
+
+    for group in list_server_groups(nova):
+        # Until now (Juno) a group has a single policy
+        policy = group.policies[0] if group.policies else None
+        cloud.add_group(group.id, policy, group.members)
+    return cloud
+
+
+def host_heap(cloud):
+    """Usable hosts keyed on -free_ram, most free RAM first.
+
+    A sorted list is a valid heap, so it can be built once and copied for
+    each plan_evacuation() call.
+    """
+    return sorted((-cloud.free_ram[host], host)
+                  for host in xrange(len(cloud.hosts)) if cloud.usable[host])
+
+
+def _find_host(heap, free_vcpus, free_ram, vcpus, ram, avoid, failed):
+    """Pops the host with the most free RAM that fits, and isn't avoided.
+
+    The heap is keyed on -free_ram; stale entries are refreshed lazily, and
+    failed hosts dropped.
+    """
+    skipped = []
+    target = None
+    while heap:
+        key, host = heapq.heappop(heap)
+        if host in failed:
+            continue
+        if -key != free_ram[host]:
+            heapq.heappush(heap, (-free_ram[host], host))
+            continue
+        if free_ram[host] < ram:
+            # Every other host has even less free RAM
+            skipped.append((key, host))
+            break
+        if free_vcpus[host] >= vcpus and host not in avoid:
+            target = host
+            break
+        skipped.append((key, host))
+    for item in skipped:
+        heapq.heappush(heap, item)
+    return target
+
+
+def plan_evacuation(cloud, failed, free_vcpus=None, free_ram=None,
+                    heap=None):
+    """Finds a new host for every VM on the failed hosts.
+
+    failed is a collection of host indices. Affinity groups move as a
+    whole (joining any member left on a live host), and anti-affinity
+    members never share a host. The cloud is not modified; free_vcpus and
+    free_ram default to copies of its own arrays and are updated in place,
+    as is heap (from host_heap()) when given.
+
+    Returns (placements, stranded): placements maps VM index to host index,
+    and stranded lists the VMs no host could take.
+    """
+    failed = set(failed)
+    if free_vcpus is None:
+        free_vcpus = cloud.free_vcpus[:]
+    if free_ram is None:
+        free_ram = cloud.free_ram[:]
+
+    # Units of VMs that have to land on the same host
+    units = []
+    seen = set()
+    for host in failed:
+        for vm in cloud.host_vms[host]:
+            group = cloud.vm_group[vm]
+            if group >= 0 and cloud.group_policy[group] == AFFINITY:
+                if group in seen:
+                    continue
+                seen.add(group)
+                units.append([m for m in cloud.group_members[group]
+                              if cloud.vm_host[m] in failed])
+            else:
+                units.append([vm])
+    # Biggest first, they are the hardest to fit
+    units.sort(key=lambda unit: (sum(cloud.vm_ram[vm] for vm in unit),
+                                 sum(cloud.vm_vcpus[vm] for vm in unit)),
+               reverse=True)
+
+    # Hosts of the live members of each group, filled in as needed
+    group_hosts = {}
+
+    def hosts_of(group):
+        if group not in group_hosts:
+            group_hosts[group] = set(
+                cloud.vm_host[vm] for vm in cloud.group_members[group]
+                if cloud.vm_host[vm] >= 0 and cloud.vm_host[vm] not in failed)
+        return group_hosts[group]
+
+    if heap is None:
+        heap = host_heap(cloud)
+
+    placements = {}
+    stranded = []
+    for unit in units:
+        vcpus = sum(cloud.vm_vcpus[vm] for vm in unit)
+        ram = sum(cloud.vm_ram[vm] for vm in unit)
+        group = cloud.vm_group[unit[0]]
+        policy = cloud.group_policy[group] if group >= 0 else None
+
+        if policy == AFFINITY and hosts_of(group):
+            # Some members survived, the rest have to join them
+            target = iter(hosts_of(group)).next()
+            if not cloud.usable[target] or free_vcpus[target] < vcpus or \
+                    free_ram[target] < ram:
+                target = None
+        else:
+            avoid = hosts_of(group) if policy == ANTI_AFFINITY else ()
+            target = _find_host(heap, free_vcpus, free_ram, vcpus, ram,
+                                avoid, failed)
+
+        if target is None:
+            stranded.extend(unit)
+            continue
+        free_vcpus[target] -= vcpus
+        free_ram[target] -= ram
+        heapq.heappush(heap, (-free_ram[target], target))
+        for vm in unit:
+            placements[vm] = target
+        if group >= 0:
+            hosts_of(group).add(target)
+    return placements, stranded
+
+
+def largest_hosts(cloud, count, exclude=()):
+    """The count usable hosts carrying the most VM RAM."""
+    candidates = [host for host in xrange(len(cloud.hosts))
+                  if cloud.usable[host] and host not in exclude]
+    return heapq.nlargest(count, candidates, key=cloud.host_load)
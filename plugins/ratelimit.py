@@ -0,0 +1,183 @@
+#
+# API rate limiting shared by concurrent plugin processes.
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# When nagios (re)starts every check fires at once, and all of them
+# authenticate against keystone in the same second. With --rate-limit, each
+# request goes through a token bucket per endpoint (host:port) kept in a
+# small file under --rate-dir, updated under a lockf lock, so all the plugin
+# processes of a poller share it. Token requests get a bucket of their own
+# (--auth-rate-limit). A request finding the bucket empty takes a token in
+# advance and sleeps until it is due, so waiting processes are served in
+# order and never poll.
+#
+# Like httptrace, requests are intercepted in httplib. The time spent
+# waiting, --rate-jitter included, is added to the plugin's perfdata as
+# "queued" and isn't counted in traced latencies.
+#
+
+import fcntl
+import httplib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+from utils import EnvDefault
+from utils import ensure_dir
+from utils import plugin_output
+
+RATE_ENVVAR = 'OS_PLUGIN_RATE_LIMIT'
+RATE_DIR_ENVVAR = 'OS_PLUGIN_RATE_DIR'
+
+# Keystone v2/v3 and swift v1 authentication requests
+_AUTH_RE = re.compile(r'(/tokens|/auth/v1\.0)/?$')
+
+_limiter = None
+_installed = False
+
+
+class RateLimiter(object):
+    """Token buckets, one file each, shared through a directory."""
+
+    def __init__(self, directory, rate, burst=10, auth_rate=None, jitter=0):
+        self.directory = directory
+        self.rate = rate
+        self.burst = burst
+        self.auth_rate = auth_rate or rate
+        self.jitter = jitter
+        self.queued = 0.0
+        self.requests = 0
+        self.local = threading.local()
+
+    def bucket_path(self, key):
+        return os.path.join(self.directory,
+                            re.sub(r'[^\w.-]', '_', key) + '.bucket')
+
+    def reserve(self, key, rate):
+        """Takes a token from the bucket key, returns the seconds until it
+        is due (0 if one was available)."""
+        fd = os.open(self.bucket_path(key), os.O_RDWR | os.O_CREAT, 0644)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            now = time.time()
+            try:
+                tokens, updated = json.loads(os.read(fd, 4096))
+            except ValueError:
+                tokens, updated = self.burst, now
+            # Tokens go negative while requests are queued for them
+            tokens += max(now - updated, 0) * rate
+            tokens = min(tokens, self.burst) - 1
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, json.dumps([tokens, now]))
+        finally:
+            os.close(fd)
+        return -tokens / rate if tokens < 0 else 0
+
+    def wait(self, endpoint, path):
+        """Blocks until a request to endpoint may be sent."""
+        delay = 0
+        if self.jitter and not self.requests:
+            delay = random.uniform(0, self.jitter)
+            time.sleep(delay)
+        self.requests += 1
+        key, rate = endpoint, self.rate
+        if _AUTH_RE.search(path.split('?', 1)[0]):
+            key, rate = 'auth-' + endpoint, self.auth_rate
+        due = self.reserve(key, rate)
+        if due:
+            time.sleep(due)
+        self.queued += delay + due
+        self.local.queued = getattr(self.local, 'queued', 0) + delay + due
+        return delay + due
+
+    def perfdata(self):
+        return "queued=%.3fs;;;0;" % self.queued
+
+    def annotate(self, line):
+        """Adds the queued time to the perfdata of a line of output."""
+        if '|' in line:
+            return "%s %s" % (line, self.perfdata())
+        return "%s | %s" % (line, self.perfdata())
+
+
+def _limited_putrequest(putrequest):
+    def limited_putrequest(self, method, url, *args, **kwargs):
+        if _limiter is not None:
+            _limiter.wait('%s:%s' % (self.host, self.port), url)
+        return putrequest(self, method, url, *args, **kwargs)
+    return limited_putrequest
+
+
+def queued():
+    """Seconds this thread's requests have waited so far, for plugins
+    timing their own requests."""
+    if _limiter is None:
+        return 0
+    return getattr(_limiter.local, 'queued', 0)
+
+
+def install(limiter):
+    """Sends this process' requests through limiter."""
+    global _limiter, _installed
+    if not _installed:
+        httplib.HTTPConnection.putrequest = _limited_putrequest(
+            httplib.HTTPConnection.putrequest)
+        _installed = True
+    _limiter = limiter
+    return limiter
+
+
+def setup(args):
+    """Enables rate limiting if args.rate_limit is set."""
+    if not args.rate_limit:
+        return None
+    ensure_dir(args.rate_dir)
+    limiter = install(RateLimiter(args.rate_dir, args.rate_limit,
+                                  args.rate_burst, args.auth_rate_limit,
+                                  args.rate_jitter))
+    plugin_output().add_line_hook(limiter.annotate)
+    return limiter
+
+
+def add_argument(parser):
+    parser.add_argument('--rate-limit', metavar='requests', type=float,
+                        action=EnvDefault, envvar=RATE_ENVVAR,
+                        help='Requests per second allowed to each endpoint, '
+                        'by all the plugins sharing --rate-dir')
+    parser.add_argument('--auth-rate-limit', metavar='requests', type=float,
+                        help='Authentications per second allowed to each '
+                        'endpoint (default --rate-limit)')
+    parser.add_argument('--rate-burst', metavar='requests', type=int,
+                        default=10,
+                        help='Requests sent without waiting after a quiet '
+                        'period (default %(default)s)')
+    parser.add_argument('--rate-jitter', metavar='seconds', type=float,
+                        default=0,
+                        help='Wait a random time, up to this, before the '
+                        'first request')
+    parser.add_argument('--rate-dir', metavar='path', type=str,
+                        default=os.environ.get(RATE_DIR_ENVVAR,
+                                               os.path.join(
+                                                   tempfile.gettempdir(),
+                                                   'nagios-plugin-ratelimit')),
+                        help='Where the buckets are kept '
+                        '(default %(default)s)')
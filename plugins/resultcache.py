@@ -0,0 +1,160 @@
+#
+# Result cache shared by redundant nagios pollers.
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# With --cache-ttl, a plugin's result (exit code and output, perfdata
+# included) is kept in --cache-dir, keyed on the plugin and its arguments.
+# A run finding a result younger than the TTL prints it and exits without
+# touching the APIs. Point the pollers of an active/active pair at the same
+# (e.g. NFS) directory and only one of them checks each interval.
+#
+# Entries are refreshed under a POSIX lock (lockf, which NFS honours), so
+# when one expires a single process runs the check; the others wait for it
+# and serve its result. They wait --cache-wait seconds at most: past that
+# (a check hung on an API, a lock NFS failed to release) they run the check
+# themselves, without the cache, rather than be killed by nagios.
+#
+
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from utils import ensure_dir
+from utils import plugin_output
+from utils import write_atomic
+
+CACHE_DIR_ENVVAR = 'OS_PLUGIN_CACHE_DIR'
+
+# Arguments which don't change a plugin's result
+IGNORED_ARGS = ('cache_ttl', 'cache_dir', 'cache_wait', 'trace',
+                'rate_limit', 'auth_rate_limit', 'rate_burst', 'rate_jitter',
+                'rate_dir', 'baseline_dir', 'baseline_warning',
+                'baseline_critical', 'baseline_min_samples',
+                'baseline_min_latency', 'baseline_half_life',
+                'baseline_periods')
+
+# Seconds between attempts at the lock of an entry being refreshed
+LOCK_POLL = 0.1
+
+
+def cache_key(name, args):
+    """A digest of the plugin name and its normalized arguments."""
+    values = dict((key, value) for key, value in vars(args).iteritems()
+                  if key not in IGNORED_ARGS)
+    return hashlib.sha1(json.dumps([name, values], sort_keys=True)) \
+        .hexdigest()
+
+
+def read_entry(path, ttl):
+    """The cached result at path, None if missing or older than ttl."""
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if time.time() - entry['created'] > ttl:
+        return None
+    return entry
+
+
+def serve(entry):
+    plugin_output().replay(entry['output'], entry['code'])
+
+
+def lock_entry(path, ttl, wait):
+    """Locks the entry at path for refreshing, and returns the lock.
+
+    Serves the entry instead if another process refreshes it meanwhile.
+    Returns None if it is still locked after wait seconds.
+    """
+    lock = open(path + '.lock', 'a')
+    deadline = time.time() + wait
+    while True:
+        try:
+            fcntl.lockf(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except IOError as e:
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                lock.close()
+                raise
+        entry = read_entry(path, ttl)
+        if entry or time.time() >= deadline:
+            lock.close()
+            if entry:
+                serve(entry)
+            return None
+        time.sleep(LOCK_POLL)
+    # It may have been refreshed while we waited
+    entry = read_entry(path, ttl)
+    if entry:
+        lock.close()
+        serve(entry)
+    return lock
+
+
+def setup(name, args):
+    """Serves a fresh cached result and exits, if args.cache_ttl is set.
+
+    Otherwise this run's result, as amended by ratelimit and baseline, is
+    cached when it calls sys.exit(). Runs ending with an exception, or
+    which gave up waiting for another process to refresh the entry, are
+    not cached.
+    """
+    if not args.cache_ttl:
+        return
+    ensure_dir(args.cache_dir)
+    path = os.path.join(args.cache_dir, cache_key(name, args))
+    entry = read_entry(path, args.cache_ttl)
+    if entry:
+        serve(entry)
+
+    # Only one process refreshes, the others wait and serve its result
+    lock = lock_entry(path, args.cache_ttl, args.cache_wait)
+    if lock is None:
+        return
+
+    def store(output, code):
+        try:
+            write_atomic(path, json.dumps({'created': time.time(),
+                                           'code': code, 'output': output}))
+        finally:
+            lock.close()
+
+    plugin_output().add_result_hook(store)
+
+
+def add_argument(parser):
+    parser.add_argument('--cache-ttl', metavar='seconds', type=int,
+                        default=0,
+                        help='Serve results younger than this from '
+                        '--cache-dir, instead of checking again')
+    parser.add_argument('--cache-dir', metavar='path', type=str,
+                        default=os.environ.get(CACHE_DIR_ENVVAR,
+                                               os.path.join(
+                                                   tempfile.gettempdir(),
+                                                   'nagios-plugin-cache')),
+                        help='Where results are cached, shared by the '
+                        'pollers (default %(default)s)')
+    parser.add_argument('--cache-wait', metavar='seconds', type=float,
+                        default=10,
+                        help='Check without the cache when another poller '
+                        'has been refreshing the result this long '
+                        '(default %(default)s)')
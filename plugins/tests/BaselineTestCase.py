@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+myPath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
+from baseline import *
+from fakestack import FakeCloud, FakeStackServer
+
+
+# A plugin printing its status, then hanging
+PLUGIN = """
+import argparse
+import sys
+import time
+sys.path.insert(0, %(path)r)
+import baseline
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--broken', action='store_true')
+baseline.add_argument(parser)
+args = parser.parse_args()
+baseline.setup('hanging', args)
+if args.broken:
+    def annotate(*args):
+        raise Exception('broken')
+    baseline.annotate = annotate
+print "OK: fine | a=1"
+time.sleep(30)
+"""
+
+
+def parse_args(*args):
+    parser = argparse.ArgumentParser()
+    add_argument(parser)
+    return parser.parse_args(['--baseline-dir', 'unused'] + list(args))
+
+
+def call(latency, path='/v2.0/tokens'):
+    return {'endpoint': 'keystone:5000', 'method': 'POST', 'path': path,
+            'status': 200, 'latency': latency}
+
+
+class BaselineTestCase(unittest.TestCase):
+
+    def setUp(self):
+      self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+      shutil.rmtree(self.dir)
+
+    def test_histogram(self):
+      histogram = LatencyHistogram()
+      for i in range(100):
+        histogram.add(0.01 * (i + 1), 1000, 3600)
+      self.assertEqual(histogram.weight, 100)
+      # Within a bucket (20%) of the exact quantiles
+      self.assertTrue(0.5 <= histogram.quantile(0.5) <= 0.6)
+      self.assertTrue(0.95 <= histogram.quantile(0.95) <= 1.14)
+      self.assertEqual(histogram.bucket(0), 0)
+      self.assertEqual(histogram.bucket(10000), BUCKETS - 1)
+      self.assertTrue(len(histogram.buckets) < 30)
+
+      histogram.decay(1000 + 3600, 3600)
+      self.assertAlmostEqual(histogram.weight, 50)
+      # Round trips through json
+      histogram = LatencyHistogram.from_dict(
+        json.loads(json.dumps(histogram.to_dict())))
+      self.assertAlmostEqual(histogram.weight, 50)
+      self.assertTrue(0.95 <= histogram.quantile(0.95) <= 1.14)
+
+    def test_evaluate(self):
+      args = parse_args('--baseline-min-samples', '20')
+      histograms = {}
+      for i in range(19):
+        self.assertEqual(evaluate([call(0.2)], histograms, args, 1000),
+                         (STATE_OK, [], None))
+      # Learning, even a slow call isn't an alert yet
+      self.assertEqual(evaluate([call(5)], histograms, args, 1000)[0],
+                       STATE_OK)
+      state, slow, worst = evaluate([call(0.2)], histograms, args, 1000)
+      self.assertEqual(state, STATE_OK)
+      self.assertTrue(0.8 < worst <= 1)
+
+      state, slow, worst = evaluate([call(0.5)], histograms, args, 1000)
+      self.assertEqual(state, STATE_WARNING)
+      self.assertTrue(slow[0].startswith('POST /v2.0/tokens took 0.500s'))
+      self.assertEqual(evaluate([call(30)], histograms, args, 1000)[0],
+                       STATE_CRITICAL)
+      # Other calls have a baseline of their own
+      self.assertEqual(evaluate([call(30, '/v2.0/tenants')], histograms, args,
+                                1000), (STATE_OK, [], None))
+      self.assertEqual(len(histograms), 2)
+
+    def test_min_latency(self):
+      args = parse_args('--baseline-min-samples', '5')
+      histograms = {}
+      for i in range(5):
+        evaluate([call(0.002)], histograms, args, 1000)
+      self.assertEqual(evaluate([call(0.05)], dict(histograms), args,
+                                1000)[0], STATE_OK)
+      self.assertEqual(evaluate([call(0.15)], dict(histograms), args,
+                                1000)[0], STATE_CRITICAL)
+
+    def test_annotate(self):
+      args = parse_args()
+      self.assertEqual(annotate("OK: fine | a=1\nmore\n", [], None, args),
+                       "OK: fine | a=1\nmore\n")
+      self.assertEqual(annotate("OK: fine | a=1\nmore\n", ['GET / took 1s'],
+                                2.5, args),
+                       "OK: fine, slower than usual: GET / took 1s | a=1 "
+                       "latency_ratio=2.50;2.0;;0;\nmore\n")
+      self.assertEqual(annotate("OK\n", [], 1.0, args),
+                       "OK | latency_ratio=1.00;2.0;;0;\n")
+
+    def test_plugin(self):
+      cloud = FakeCloud(latency=0.01)
+      server = FakeStackServer(cloud).start()
+      host, port = server.server_address[:2]
+      command = [sys.executable,
+                 os.path.join(myPath, '..', 'check_graphite.py'),
+                 '-H', host, '-P', str(port), '-t', 'x', '--from=-10minutes',
+                 '--baseline-dir', self.dir, '--baseline-min-samples', '3']
+
+      def run():
+        process = subprocess.Popen(command, stdout=subprocess.PIPE)
+        return process.communicate()[0], process.returncode
+
+      try:
+        # Samples decay, 3 runs weigh a little less than 3
+        for i in range(5):
+          output, code = run()
+          self.assertEqual(code, STATE_OK)
+        self.assertTrue('latency_ratio=' in output)
+        cloud.latency = 0.3
+        output, code = run()
+      finally:
+        server.shutdown()
+        server.server_close()
+      self.assertEqual(code, STATE_CRITICAL)
+      self.assertTrue(output.startswith('OK: query'))
+      self.assertTrue(', slower than usual: GET /render/ took 0.3' in output)
+      self.assertEqual(os.listdir(self.dir).count('check_graphite.baseline'),
+                       1)
+
+    def test_rate_limited(self):
+      cloud = FakeCloud(latency=0.01)
+      server = FakeStackServer(cloud).start()
+      host, port = server.server_address[:2]
+      command = [sys.executable,
+                 os.path.join(myPath, '..', 'check_graphite.py'),
+                 '-H', host, '-P', str(port), '-t', 'x', '--from=-10minutes',
+                 '--baseline-dir', self.dir, '--baseline-min-samples', '2',
+                 '--rate-limit', '2', '--rate-burst', '1',
+                 '--rate-dir', os.path.join(self.dir, 'rate')]
+      outputs = []
+      try:
+        # Back to back, each run waits for the one before
+        for i in range(4):
+          process = subprocess.Popen(command, stdout=subprocess.PIPE)
+          outputs.append((process.communicate()[0], process.returncode))
+      finally:
+        server.shutdown()
+        server.server_close()
+      queued = [float(re.search(r' queued=([0-9.]+)s', output).group(1))
+                for output, code in outputs]
+      self.assertTrue(sum(queued) > 0.5, outputs)
+      self.assertEqual([code for output, code in outputs], [STATE_OK] * 4)
+      self.assertTrue('latency_ratio=' in outputs[-1][0])
+
+    def test_killed(self):
+      plugin = os.path.join(self.dir, 'plugin.py')
+      with open(plugin, 'w') as f:
+        f.write(PLUGIN % {'path': os.path.join(myPath, '..')})
+      for options, line in (([], "OK: fine | a=1\n"),
+                            # The plugin's own line when annotating fails
+                            (['--broken'], "OK: fine | a=1\n")):
+        process = subprocess.Popen(
+          [sys.executable, plugin, '--baseline-dir', self.dir] + options,
+          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Killed, e.g. by nagios timing it out, after printing its status
+        self.assertEqual(process.stdout.readline(), line)
+        process.kill()
+        errors = process.communicate()[1]
+        self.assertEqual('broken' in errors, '--broken' in options)
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.makeSuite(BaselineTestCase))
+unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+
+myPath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
+from evacuation_journal import *
+
+
+class EvacuationJournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+      self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+      shutil.rmtree(self.dir)
+
+    def test_replay(self):
+      journal = EvacuationJournal.open(self.dir, 'compute-1', 3600)
+      journal.record('vm1', name='one', target='compute-2')
+      journal.record('vm2', name='two', target='compute-3')
+      journal.record('vm1', issued=time.time())
+      journal.record('vm1', status='ACTIVE')
+      journal.record('vm2', issued=time.time())
+      journal.close()
+
+      journal = EvacuationJournal.open(self.dir, 'compute-1', 3600)
+      self.assertEqual(journal.vms['vm1']['target'], 'compute-2')
+      self.assertTrue(journal.done('vm1'))
+      self.assertFalse(journal.in_flight('vm1'))
+      self.assertTrue(journal.in_flight('vm2'))
+      self.assertEqual(journal.pending(), ['vm2'])
+      self.assertFalse(journal.complete())
+      journal.record('vm2', status='ACTIVE')
+      self.assertTrue(journal.complete())
+
+    def test_lock(self):
+      journal = EvacuationJournal.open(self.dir, 'compute-1', 3600)
+      self.assertRaises(JournalBusy, EvacuationJournal.open, self.dir,
+                        'compute-1', 3600)
+      # Other hosts aren't held up
+      EvacuationJournal.open(self.dir, 'compute-2', 3600).close()
+      journal.close()
+      EvacuationJournal.open(self.dir, 'compute-1', 3600).close()
+
+    def test_torn_line(self):
+      journal = EvacuationJournal.open(self.dir, 'compute-1', 3600)
+      journal.record('vm1', name='one', target='compute-2')
+      journal.close()
+      with open(journal_path(self.dir, 'compute-1'), 'a') as f:
+        f.write('{"id": "vm1", "iss')
+      journal = EvacuationJournal.read(journal_path(self.dir, 'compute-1'))
+      self.assertEqual(journal.vms, {'vm1': {'name': 'one',
+                                             'target': 'compute-2'}})
+
+    def test_stale(self):
+      journal = EvacuationJournal.open(self.dir, 'compute-1', 3600)
+      journal.record('vm1', name='one', status='ACTIVE')
+      journal.close()
+      journal = EvacuationJournal.open(self.dir, 'compute-1', -1)
+      self.assertEqual(journal.vms, {})
+      self.assertEqual(EvacuationJournal.read(journal.path).vms, {})
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.makeSuite(EvacuationJournalTestCase))
+
+unittest.TextTestRunner(verbosity=2).run(suite)
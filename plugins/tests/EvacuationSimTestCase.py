@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+
+myPath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
+from evacuation_sim import *
+from evacuation_sim import _Log
+from evacuation_journal import status_path
+from fakenova import FakeNova, generate_cloud
+from inventory import InventoryStore
+from inventory import Record
+
+
+class EvacuationSimTestCase(unittest.TestCase):
+
+    def setUp(self):
+      self.args = collect_args().parse_args(['--hypervisors', '50',
+                                             '--vms', '400',
+                                             '--hosts-per-rack', '5'])
+      self.cloud = generate_cloud(50, 400, 0.2, 5, seed=1)
+
+    def test_generate_cloud(self):
+      self.assertEqual(self.cloud, generate_cloud(50, 400, 0.2, 5, seed=1))
+      self.assertEqual(len(self.cloud['hosts']), 50)
+      self.assertEqual(len(self.cloud['servers']), 400)
+      policies = set(policy for _, policy, _ in self.cloud['groups'])
+      self.assertEqual(policies, set(['affinity', 'anti-affinity']))
+      # The cloud starts out breaking no constraint
+      nova = FakeNova(self.cloud)
+      self.assertEqual(sum(nova.violations().values()), 0)
+
+    def test_paging(self):
+      nova = FakeNova(self.cloud, max_limit=100)
+      self.assertEqual(len(nova.servers.list()), 100)
+      page = nova.servers.list(search_opts={'limit': 1000})
+      self.assertEqual(len(page), 100)
+      page = nova.servers.list(search_opts={'marker': page[-1].id})
+      self.assertEqual(page[0].id, 'vm-000100')
+      self.assertEqual(nova.calls, {'servers.list': 3})
+
+    def test_rack_coalesced(self):
+      failed = failed_hosts(self.cloud, 'rack', 0)
+      self.assertEqual(len(failed), 5)
+      sample = replay(self.cloud, failed, 'coalesced', self.args)
+      self.assertTrue(sample['vms'] > 0)
+      self.assertEqual(sample['placed'], sample['vms'])
+      self.assertEqual(sample['stranded'], 0)
+      self.assertEqual(sample['violations'], 0)
+      self.assertEqual(sample['calls']['servers.evacuate'], sample['vms'])
+      self.assertEqual(sample['calls']['hypervisors.list'], 1)
+
+    def test_rack_handler(self):
+      failed = failed_hosts(self.cloud, 'rack', 0)
+      for mode in ('handler', 'inventory'):
+        sample = replay(self.cloud, failed, mode, self.args)
+        self.assertEqual(sample['placed'] + sample['stranded'],
+                         sample['vms'])
+        self.assertEqual(sample['calls']['services.list'], 5)
+        self.assertTrue(sample['api_calls'] > sample['vms'])
+        self.assertTrue(sample['planning_time'] > 0)
+
+    def test_validate_plan(self):
+      nova = FakeNova(self.cloud)
+      vm_id, name, host, flavor_id = self.cloud['servers'][0]
+      vms = nova.servers.list(search_opts={'host': host})
+      others = [h[0] for h in self.cloud['hosts'] if h[0] != host]
+      targets = dict((vm.id, others[0]) for vm in vms)
+      # Precomputed when others[0] had room, which is now taken
+      nova.used_vcpus[others[0]] = 32 * 16
+      nova.fail([others[1]])
+      targets[vm_id] = others[1]
+      self.assertEqual(handler.validate_plan(nova, targets, vms, 16, 1.5),
+                       {})
+      targets = dict((vm.id, others[2]) for vm in vms)
+      self.assertEqual(handler.validate_plan(nova, targets, vms, 16, 1.5),
+                       targets)
+      # VMs resumed from the journal come without a flavor, and may have
+      # been deleted since; planned VMs no longer on the host are left out
+      resumed = [Record(id=vm_id, name=name), Record(id='vm-gone', name='')]
+      targets = {vm_id: others[2], 'vm-gone': others[2],
+                 'vm-moved': others[2]}
+      self.assertEqual(handler.validate_plan(nova, targets, resumed, 16,
+                                             1.5), {vm_id: others[2]})
+      self.assertEqual(nova.calls['servers.get'], 2)
+
+    def test_inventory_follows_evacuations(self):
+      nova = FakeNova(self.cloud)
+      vm_id, name, host, flavor_id = self.cloud['servers'][0]
+      nova.fail([host])
+      evacuate = nova.servers.evacuate
+      def refused(server, host=None, on_shared_storage=True):
+        if server.id == vm_id:
+          raise Exception('No valid host was found')
+        evacuate(server, host, on_shared_storage)
+      nova.servers.evacuate = refused
+      workdir = tempfile.mkdtemp()
+      syslog = handler.syslog
+      handler.syslog = _Log()
+      try:
+        options = handler_args('inventory', workdir, self.args)
+        handler.evacuate_host(nova, host, options)
+        store = InventoryStore(options.inventory)
+        on_host = [vm.id for vm in store.servers_on_host(host)]
+      finally:
+        handler.syslog = syslog
+        shutil.rmtree(workdir)
+      # Only the VM nova refused is still there, moved ones are recorded
+      self.assertEqual(on_host, [vm_id])
+      self.assertEqual(len(nova.evacuations),
+                       len([s for s in self.cloud['servers']
+                            if s[2] == host]) - 1)
+
+    def test_concurrent_runs(self):
+      # Two runs for one host, e.g. nagios notifying again, at once
+      nova = FakeNova(self.cloud)
+      host = self.cloud['servers'][0][2]
+      nova.fail([host])
+      evacuate = nova.servers.evacuate
+      def slow(server, host=None, on_shared_storage=True):
+        time.sleep(0.02)
+        evacuate(server, host, on_shared_storage)
+      nova.servers.evacuate = slow
+      workdir = tempfile.mkdtemp()
+      syslog = handler.syslog
+      handler.syslog = _Log()
+      try:
+        options = handler_args('handler', workdir, self.args)
+        options.journal_dir = workdir
+        runs = [threading.Thread(target=handler.evacuate_host,
+                                 args=(nova, host, options))
+                for _ in range(2)]
+        for run in runs:
+          run.start()
+        for run in runs:
+          run.join()
+        log = handler.syslog.messages
+      finally:
+        handler.syslog = syslog
+        shutil.rmtree(workdir)
+      evacuated = [vm_id for vm_id, old, new in nova.evacuations]
+      self.assertEqual(sorted(evacuated),
+                       [s[0] for s in self.cloud['servers'] if s[2] == host])
+      self.assertEqual(len([m for m in log if 'another run' in m]), 1)
+
+    def test_journal_follows_host(self):
+      nova = FakeNova(self.cloud)
+      vm_id, name, host, flavor_id = self.cloud['servers'][0]
+      nova.fail([host])
+      evacuate = nova.servers.evacuate
+      def refused(server, host=None, on_shared_storage=True):
+        if server.id == vm_id:
+          raise Exception('No valid host was found')
+        evacuate(server, host, on_shared_storage)
+      nova.servers.evacuate = refused
+      workdir = tempfile.mkdtemp()
+      syslog = handler.syslog
+      handler.syslog = _Log()
+      try:
+        options = handler_args('handler', workdir, self.args)
+        options.journal_dir = workdir
+        handler.evacuate_host(nova, host, options)
+        moved = [vm for vm, old, new in nova.evacuations]
+        # Resuming, with a VM that landed on the host meanwhile
+        nova.servers.evacuate = evacuate
+        landed = [s[0] for s in self.cloud['servers'] if s[2] != host][0]
+        nova.move(landed, host)
+        del nova.evacuations[:]
+        handler.evacuate_host(nova, host, options)
+        resumed = sorted(vm for vm, old, new in nova.evacuations)
+        # The journal is complete, but the host failed again with VMs
+        # moved back onto it
+        nova.move(moved[0], host)
+        del nova.evacuations[:]
+        handler.evacuate_host(nova, host, options)
+        again = [vm for vm, old, new in nova.evacuations]
+      finally:
+        handler.syslog = syslog
+        shutil.rmtree(workdir)
+      self.assertEqual(resumed, sorted([vm_id, landed]))
+      self.assertEqual(again, [moved[0]])
+
+    def test_unlisted_host(self):
+      nova = FakeNova(self.cloud)
+      failed = sorted(set(s[2] for s in self.cloud['servers']))[:2]
+      nova.fail(failed)
+      # The hypervisor listing lags behind, and lacks the second host
+      listing = nova.hypervisors.list
+      nova.hypervisors.list = lambda detailed=True: [
+        h for h in listing(detailed) if h.hypervisor_hostname != failed[1]]
+      syslog = handler.syslog
+      handler.syslog = _Log()
+      try:
+        options = handler_args('handler', None, self.args)
+        self.assertTrue(handler.evacuate_hosts(nova, failed, options))
+        log = handler.syslog.messages
+      finally:
+        handler.syslog = syslog
+      evacuated = [vm_id for vm_id, old, new in nova.evacuations]
+      self.assertEqual(sorted(evacuated),
+                       [s[0] for s in self.cloud['servers']
+                        if s[2] in failed])
+      self.assertEqual(len([m for m in log
+                            if 'not in the hypervisor listing' in m]), 1)
+
+    def test_status_up_front(self):
+      nova = FakeNova(self.cloud)
+      failed = self.cloud['servers'][0][2]
+      nova.fail([failed])
+      workdir = tempfile.mkdtemp()
+      seen = []
+      evacuate = nova.servers.evacuate
+      def peek(server, host=None, on_shared_storage=True):
+        if not seen:
+          with open(status_path(workdir, failed)) as f:
+            seen.append(json.load(f))
+        evacuate(server, host, on_shared_storage)
+      nova.servers.evacuate = peek
+      syslog = handler.syslog
+      handler.syslog = _Log()
+      try:
+        options = handler_args('handler', workdir, self.args)
+        options.journal_dir = workdir
+        handler.evacuate_host(nova, failed, options)
+      finally:
+        handler.syslog = syslog
+        shutil.rmtree(workdir)
+      # Before the first VM was evacuated, all of them were listed
+      on_host = [s for s in self.cloud['servers'] if s[2] == failed]
+      self.assertEqual(seen[0]['total'], len(on_host))
+      self.assertEqual(seen[0]['counts']['pending'], len(on_host))
+
+    def test_absolute_paths(self):
+      options = handler_args('inventory', 'state', self.args)
+      options.trace = 'syslog'
+      handler.absolute_paths(options)
+      self.assertEqual(options.inventory,
+                       os.path.join(os.getcwd(), 'state', 'inventory.db'))
+      self.assertEqual(options.trace, 'syslog')
+      self.assertEqual(options.journal_dir, None)
+
+    def test_compare(self):
+      baseline = {'rack': {'coalesced': {'planning_time': 0.002,
+                                         'api_calls': 100}}}
+      results = {'rack': {'coalesced': {'planning_time': 0.004,
+                                        'api_calls': 200}}}
+      self.assertEqual(compare(results, baseline, 0.2, METRICS, 0.05),
+                       [('rack', 'coalesced', 'api_calls', 100, 200)])
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.makeSuite(EvacuationSimTestCase))
+
+unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import sys
+import unittest
+from datetime import datetime
+from datetime import timedelta
+
+import glanceclient
+
+
+myPath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
+from check_glance_catalog import *
+from fakestack import FakeCloud, FakeStackServer
+
+
+###### Test Object ######
+
+def updated_at(age):
+    return (datetime.utcnow() - timedelta(seconds=age)) \
+        .strftime('%Y-%m-%dT%H:%M:%S')
+
+class Image(object):
+    def __init__(self, n, status='active', age=60, size=1024 ** 3):
+        self.id = 'id-%d' % n
+        self.name = 'image-%d' % n
+        self.status = status
+        self.size = size
+        self.updated_at = updated_at(age)
+
+class Args(object):
+    public_only = False
+    owner = None
+    page_size = 1000
+    stuck_age = 3600
+    stuck_warning = 1
+    stuck_critical = None
+    killed_warning = None
+    killed_critical = None
+    size_warning = None
+    size_critical = None
+
+
+class GlanceCatalogTestCase(unittest.TestCase):
+
+    def serve(self, images, max_limit=1000):
+      self.cloud = FakeCloud(images=images, image_size=16,
+                             max_limit=max_limit)
+      self.server = FakeStackServer(self.cloud).start()
+      return glanceclient.Client('1', self.server.url + '/image',
+                                 token=self.cloud.new_token())
+
+    def tearDown(self):
+      if hasattr(self, 'server'):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def requests(self):
+      return self.cloud.stats['services']['image']['requests']
+
+    def test_healthy(self):
+      glance = self.serve(2500)
+      self.assertEqual(check_catalog(glance, Args()), STATE_OK)
+      # The last page is short, and ends the listing
+      self.assertEqual(self.requests(), 3)
+
+    def test_capped_pages(self):
+      # glance serves fewer than --page-size, which isn't the last page
+      glance = self.serve(250, max_limit=100)
+      stats = catalog_stats(list_images(glance, Args()), 3600)
+      self.assertEqual(stats['images'], 250)
+      self.assertEqual(self.requests(), 3)
+
+    def test_capped_pages_multiple(self):
+      # With a multiple of the page size, the last page is empty
+      glance = self.serve(200, max_limit=100)
+      stats = catalog_stats(list_images(glance, Args()), 3600)
+      self.assertEqual(stats['images'], 200)
+      self.assertEqual(self.requests(), 3)
+
+    def test_stats(self):
+      images = [Image(n) for n in range(10)]
+      images[1] = Image(1, 'queued', age=7200)
+      images[2] = Image(2, 'saving', age=60)
+      images[3] = Image(3, 'killed')
+      images[4] = Image(4, 'saving', age=86400)
+      stats = catalog_stats(iter(images), 3600)
+      self.assertEqual(stats['images'], 10)
+      self.assertEqual(stats['statuses']['active'], 6)
+      self.assertEqual(stats['statuses']['saving'], 2)
+      self.assertEqual(stats['size'], 6 * 1024 ** 3)
+      self.assertEqual(stats['stuck'], 2)
+      self.assertEqual(stats['stuck_names'], ['image-1', 'image-4'])
+      self.assertTrue(stats['oldest_stuck'] >= 86400)
+
+    def test_thresholds(self):
+      glance = self.serve(10)
+      for image in self.cloud.images:
+        image['size'] = 1024 ** 3
+      self.cloud.images[1].update(status='queued', updated_at=updated_at(7200))
+      self.cloud.images[3]['status'] = 'killed'
+      self.assertEqual(check_catalog(glance, Args()), STATE_WARNING)
+      args = Args()
+      args.stuck_critical = 1
+      self.assertEqual(check_catalog(glance, args), STATE_CRITICAL)
+      args = Args()
+      args.stuck_warning = None
+      args.killed_warning = 1
+      self.assertEqual(check_catalog(glance, args), STATE_WARNING)
+      args.killed_warning = None
+      args.size_critical = 5
+      self.assertEqual(check_catalog(glance, args), STATE_CRITICAL)
+
+    def test_filters(self):
+      glance = self.serve(30)
+      owner = self.cloud.tenants[1]['id']
+      args = Args()
+      args.owner = owner
+      stats = catalog_stats(list_images(glance, args), 3600)
+      self.assertEqual(stats['images'], len([i for i in self.cloud.images
+                                             if i['owner'] == owner]))
+      # Not lost along with the owner
+      args.public_only = True
+      stats = catalog_stats(list_images(glance, args), 3600)
+      self.assertEqual(stats['images'], len([i for i in self.cloud.images
+                                             if i['owner'] == owner and
+                                             i['is_public']]))
+      self.assertTrue(0 < stats['images'] < 6)
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.makeSuite(GlanceCatalogTestCase))
+
+unittest.TextTestRunner(verbosity=2).run(suite)
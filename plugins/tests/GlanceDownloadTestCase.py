@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import sys
+import unittest
+
+
+myPath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
+from check_glance_download import *
+from fakestack import FakeCloud, FakeStackServer
+
+
+class Args(object):
+    def __init__(self, image, **kwargs):
+        self.image = image
+        self.ca_cert = None
+        self.insecure = False
+        self.chunk_size = 65536
+        self.max_bytes = 0
+        self.timeout = 10
+        self.ttfb_warning = self.ttfb_critical = None
+        self.rate_warning = self.rate_critical = None
+        self.__dict__.update(kwargs)
+
+
+class GlanceDownloadTestCase(unittest.TestCase):
+
+    def setUp(self):
+      self.cloud = FakeCloud(images=3, image_size=256 * 1024)
+      self.server = FakeStackServer(self.cloud).start()
+      self.endpoint = self.server.url + '/image'
+
+    def tearDown(self):
+      self.server.shutdown()
+      self.server.server_close()
+
+    def check(self, image, **kwargs):
+      return check_download(Args(image, **kwargs), self.cloud.new_token(),
+                            self.endpoint)
+
+    def test_images_url(self):
+      self.assertEqual(images_url('http://glance:9292/'),
+                       'http://glance:9292/v1/images')
+      self.assertEqual(images_url('http://glance:9292/v1'),
+                       'http://glance:9292/v1/images')
+
+    def test_download_by_name(self):
+      self.assertEqual(self.check('image-1'), STATE_OK)
+
+    def test_download_by_id(self):
+      self.assertEqual(self.check(self.cloud.images[2]['id'], chunk_size=4096),
+                       STATE_OK)
+
+    def test_bad_checksum(self):
+      self.cloud.images[0]['checksum'] = 'bad'
+      self.assertEqual(self.check('image-0'), STATE_CRITICAL)
+      # Not checked when sampling
+      self.assertEqual(self.check('image-0', max_bytes=100000), STATE_OK)
+
+    def test_sampled(self):
+      url = images_url(self.endpoint) + '/' + self.cloud.images[0]['id']
+      headers, size, md5, ttfb, elapsed = download(
+        url, self.cloud.new_token(), 4096, 100000, 10, None)
+      self.assertEqual(size, 100000)
+      self.assertEqual(md5, hashlib.md5(self.cloud.image_data[:100000])
+                       .hexdigest())
+
+    def test_thresholds(self):
+      self.assertEqual(self.check('image-0', rate_warning=1e6), STATE_WARNING)
+      self.assertEqual(self.check('image-0', rate_critical=1e6),
+                       STATE_CRITICAL)
+      self.assertEqual(self.check('image-0', ttfb_warning=0), STATE_WARNING)
+
+    def test_missing_image(self):
+      self.assertRaises(Exception, self.check, 'nothing')
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.makeSuite(GlanceDownloadTestCase))
+
+unittest.TextTestRunner(verbosity=2).run(suite)
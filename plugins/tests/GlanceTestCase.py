@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+# -*- encoding: utf-8 -*-
 #
 # Copyright © 2012 eNovance <licensing@enovance.com>
 #
@@ -25,47 +26,59 @@ import unittest
 
 
 myPath = os.path.abspath(os.path.dirname(__file__))
-sys.path.append(os.path.abspath(os.path.dirname(__file__)+'/../'))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
 from check_glance import *
 
 
 ###### Test Object ######
 
 ######### Success ##########
+class ImagesTestSuccess(object):
+    def __init__(self):
+        pass
+
+    def list(self, **parameters):
+        try:
+          if(parameters["filters"]["name"]):
+            return [parameters["filters"]["name"]]
+        except :
+          pass
+        images = ("Debian GNU/Linux 6.0.4 amd64","images2","turnkey-wordpress-11.3-lucid-x86")
+        return images[:parameters.get("limit")]
+
 class GlanceClientTestSuccess(object):
-    def __init__(self, host, username, password, tenant, auth_url, region="default"):
+    def __init__(self, username, password, tenant, auth_url, region="default"):
         self.username = username
         self.password = password
         self.tenant = tenant
         self.auth_url = auth_url
         self.region = region
 
-    def get_images(self,**parameters):
+    images=ImagesTestSuccess()
+
+######### Images fail ##########
+class ImagesTestFail(object):
+    def __init__(self):
+        pass
+
+    def list(self, **parameters):
         try:
           if(parameters["filters"]["name"]):
-            return [parameters["filters"]["name"]]
+            return ()
         except :
           pass
-        return ("Debian GNU/Linux 6.0.4 amd64","images2","turnkey-wordpress-11.3-lucid-x86")
+        images = ("Debian GNU/Linux 6.0.4 amd64","images2","turnkey-wordpress-11.3-lucid-x86")
+        return images[:parameters.get("limit")]
 
-######### Images fail ##########
-
-######### Success ##########
 class GlanceClientTestImagesFail(object):
-    def __init__(self, host, username, password, tenant, auth_url, region="default"):
+    def __init__(self, username, password, tenant, auth_url, region="default"):
         self.username = username
         self.password = password
         self.tenant = tenant
         self.auth_url = auth_url
         self.region = region
 
-    def get_images(self,**parameters):
-        try:
-          if(parameters["filters"]["name"]):
-            return ()
-        except :
-          pass
-        return ("Debian GNU/Linux 6.0.4 amd64","images2","turnkey-wordpress-11.3-lucid-x86")
+    images=ImagesTestFail()
 
 
 
@@ -83,9 +96,8 @@ class GlanceTestCase(unittest.TestCase):
       pass
 
     def test_connection_success(self):
-      args = collect_args().parse_args(['--host','beta.enocloud.com','--auth_url', 'http://beta.enocloud.com:5000/v2.0/', '--username', 'admin', '--password', 'p4st0uch3', '--tenant', 'admin'])
-      c = GlanceClientTestSuccess(args.host,
-              args.username,
+      args = collect_args().parse_args(['--auth_url', 'http://beta.enocloud.com:5000/v2.0/', '--username', 'admin', '--password', 'p4st0uch3', '--tenant', 'admin'])
+      c = GlanceClientTestSuccess(args.username,
               args.password,
               args.tenant,
               args.auth_url,
@@ -93,9 +105,8 @@ class GlanceTestCase(unittest.TestCase):
       check_glance(c,args)
 
     def test_limit_success(self):
-      args = collect_args().parse_args(['--host','beta.enocloud.com','--auth_url', 'http://beta.enocloud.com:5000/v2.0/', '--username', 'admin', '--password', 'p4st0uch3', '--tenant', 'admin', '--req_count', '2'])
-      c = GlanceClientTestSuccess(args.host,
-              args.username,
+      args = collect_args().parse_args(['--auth_url', 'http://beta.enocloud.com:5000/v2.0/', '--username', 'admin', '--password', 'p4st0uch3', '--tenant', 'admin', '--req_count', '2'])
+      c = GlanceClientTestSuccess(args.username,
               args.password,
               args.tenant,
               args.auth_url,
@@ -103,9 +114,8 @@ class GlanceTestCase(unittest.TestCase):
       check_glance(c,args)
 
     def test_limit_fail(self):
-      args = collect_args().parse_args(['--host','beta.enocloud.com','--auth_url', 'http://beta.enocloud.com:5000/v2.0/', '--username', 'admin', '--password', 'p4st0uch3', '--tenant', 'admin', '--req_count', '10'])
-      c = GlanceClientTestSuccess(args.host,
-              args.username,
+      args = collect_args().parse_args(['--auth_url', 'http://beta.enocloud.com:5000/v2.0/', '--username', 'admin', '--password', 'p4st0uch3', '--tenant', 'admin', '--req_count', '10'])
+      c = GlanceClientTestSuccess(args.username,
               args.password,
               args.tenant,
               args.auth_url,
@@ -116,9 +126,8 @@ class GlanceTestCase(unittest.TestCase):
         self.assertTrue("not enough images")
 
     def test_images_success(self):
-      args = collect_args().parse_args(['--host','beta.enocloud.com','--auth_url', 'http://beta.enocloud.com:5000/v2.0/', '--username', 'admin', '--password', 'p4st0uch3', '--tenant', 'admin', '--req_images','Debian GNU/Linux 6.0.4 amd64','turnkey-wordpress-11.3-lucid-x86'])
-      c = GlanceClientTestSuccess(args.host,
-              args.username,
+      args = collect_args().parse_args(['--auth_url', 'http://beta.enocloud.com:5000/v2.0/', '--username', 'admin', '--password', 'p4st0uch3', '--tenant', 'admin', '--req_images','Debian GNU/Linux 6.0.4 amd64','turnkey-wordpress-11.3-lucid-x86'])
+      c = GlanceClientTestSuccess(args.username,
               args.password,
               args.tenant,
               args.auth_url,
@@ -126,9 +135,8 @@ class GlanceTestCase(unittest.TestCase):
       check_glance(c,args)
 
     def test_images_fail(self):
-      args = collect_args().parse_args(['--host','beta.enocloud.com','--auth_url', 'http://beta.enocloud.com:5000/v2.0/', '--username', 'admin', '--password', 'p4st0uch3', '--tenant', 'admin', '--req_images','Debian GNU/Linux 6.0.4 amd64','turnkey-wordpress-11.3-lucid-x86'])
-      c = GlanceClientTestImagesFail(args.host,
-              args.username,
+      args = collect_args().parse_args(['--auth_url', 'http://beta.enocloud.com:5000/v2.0/', '--username', 'admin', '--password', 'p4st0uch3', '--tenant', 'admin', '--req_images','Debian GNU/Linux 6.0.4 amd64','turnkey-wordpress-11.3-lucid-x86'])
+      c = GlanceClientTestImagesFail(args.username,
               args.password,
               args.tenant,
               args.auth_url,
@@ -140,9 +148,8 @@ class GlanceTestCase(unittest.TestCase):
 
 
     def test_images_limit_fail(self):
-      args = collect_args().parse_args(['--host','beta.enocloud.com','--auth_url', 'http://beta.enocloud.com:5000/v2.0/', '--username', 'admin', '--password', 'p4st0uch3', '--tenant', 'admin', '--req_count', '10','--req_images','Debian GNU/Linux 6.0.4 amd64','turnkey-wordpress-11.3-lucid-x86'])
-      c = GlanceClientTestImagesFail(args.host,
-              args.username,
+      args = collect_args().parse_args(['--auth_url', 'http://beta.enocloud.com:5000/v2.0/', '--username', 'admin', '--password', 'p4st0uch3', '--tenant', 'admin', '--req_count', '10','--req_images','Debian GNU/Linux 6.0.4 amd64','turnkey-wordpress-11.3-lucid-x86'])
+      c = GlanceClientTestImagesFail(args.username,
               args.password,
               args.tenant,
               args.auth_url,
@@ -153,9 +160,8 @@ class GlanceTestCase(unittest.TestCase):
         self.assertTrue("images not found")
 
     def test_images_limit_success(self):
-      args = collect_args().parse_args(['--host','beta.enocloud.com','--auth_url', 'http://beta.enocloud.com:5000/v2.0/', '--username', 'admin', '--password', 'p4st0uch3', '--tenant', 'admin', '--req_count', '2', '--req_images','Debian GNU/Linux 6.0.4 amd64','turnkey-wordpress-11.3-lucid-x86'])
-      c = GlanceClientTestSuccess(args.host,
-              args.username,
+      args = collect_args().parse_args(['--auth_url', 'http://beta.enocloud.com:5000/v2.0/', '--username', 'admin', '--password', 'p4st0uch3', '--tenant', 'admin', '--req_count', '2', '--req_images','Debian GNU/Linux 6.0.4 amd64','turnkey-wordpress-11.3-lucid-x86'])
+      c = GlanceClientTestSuccess(args.username,
               args.password,
               args.tenant,
               args.auth_url,
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+import urllib2
+
+
+myPath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
+import httptrace
+from fakestack import FakeCloud, FakeStackServer
+
+
+class HttpTraceTestCase(unittest.TestCase):
+
+    def setUp(self):
+      self.server = FakeStackServer(FakeCloud()).start()
+      self.tracer = httptrace.install('test')
+      del self.tracer.calls[:]
+
+    def tearDown(self):
+      self.server.shutdown()
+      self.server.server_close()
+
+    def test_template(self):
+      self.assertEqual(httptrace.template(
+          '/v2/4cb2f6a8-91f2-4a5d-8f5e-0c8c8f0e6e8d/servers/detail?host=x'),
+          '/v2/*/servers/detail')
+      self.assertEqual(httptrace.template('/v2.0/tokens/%s' % ('a' * 32)),
+                       '/v2.0/tokens/*')
+      self.assertEqual(httptrace.template('/object/v1/AUTH_admin/bench'),
+                       '/object/v1/*/bench')
+
+    def test_records_requests(self):
+      body = urllib2.urlopen(self.server.url + '/render/?target=x').read()
+      try:
+        urllib2.urlopen(self.server.url + '/nothing')
+      except urllib2.HTTPError:
+        pass
+      summary = self.tracer.summary()
+      self.assertEqual(summary['requests'], 2)
+      self.assertEqual(summary['calls'][0]['status'], 200)
+      self.assertEqual(summary['calls'][0]['bytes_received'], len(body))
+      self.assertEqual(summary['calls'][1]['status'], 404)
+      endpoint = '%s:%d' % self.server.server_address[:2]
+      self.assertEqual(summary['endpoints'][endpoint]['errors'], 1)
+
+    def test_write(self):
+      urllib2.urlopen(self.server.url + '/render/?target=x').read()
+      fd, path = tempfile.mkstemp()
+      os.close(fd)
+      try:
+        self.tracer.write(path)
+        self.tracer.write(path)
+        lines = open(path).readlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])['plugin'], 'test')
+      finally:
+        os.unlink(path)
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.makeSuite(HttpTraceTestCase))
+
+unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+
+myPath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
+from inventory import *
+from placement import HOST_ATTR, plan_evacuation
+
+
+###### Test Object ######
+
+class Resource(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class Manager(object):
+    def __init__(self, items):
+        self.items = items
+        self.searches = []
+    def list(self, search_opts=None, **kwargs):
+        search_opts = search_opts or {}
+        self.searches.append(dict(search_opts))
+        items = self.items
+        if 'changes-since' in search_opts:
+            items = [i for i in items
+                     if i.updated >= search_opts['changes-since']]
+        if search_opts.get('marker'):
+            ids = [i.id for i in items]
+            items = items[ids.index(search_opts['marker']) + 1:]
+        if search_opts.get('limit'):
+            items = items[:search_opts['limit']]
+        return items
+
+def server(vm_id, host, flavor='1', status='ACTIVE',
+           updated='2014-01-01T00:00:00Z'):
+    s = Resource(id=vm_id, name=vm_id, status=status, tenant_id='t',
+                 flavor={'id': flavor}, updated=updated)
+    setattr(s, 'OS-EXT-SRV-ATTR:host', host)
+    setattr(s, HOST_ATTR, host)
+    return s
+
+class NovaTest(object):
+    def __init__(self):
+        self.hypervisors = Manager([
+          Resource(hypervisor_hostname=name, state='up', status='enabled',
+                   vcpus=8, vcpus_used=2, memory_mb=16384,
+                   memory_mb_used=5120, running_vms=2)
+          for name in ('a', 'b', 'c')])
+        self.flavors = Manager([Resource(id='1', name='small', vcpus=1,
+                                         ram=1024, disk=10),
+                                Resource(id='2', name='big', vcpus=2,
+                                         ram=4096, disk=20)])
+        self.servers = Manager([server('vm1', 'a'), server('vm2', 'a', '2'),
+                                server('vm3', 'b'), server('vm4', 'c')])
+        self.server_groups = Manager([
+          Resource(id='g1', name='web', policies=['anti-affinity'],
+                   members=['vm1', 'vm3'])])
+
+
+class InventoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+      self.dir = tempfile.mkdtemp()
+      self.path = os.path.join(self.dir, 'inventory.db')
+      self.nova = NovaTest()
+
+    def tearDown(self):
+      shutil.rmtree(self.dir)
+
+    def test_full_refresh(self):
+      store = InventoryStore(self.path)
+      self.assertEqual(store.refreshed, None)
+      self.assertEqual(store.refresh(self.nova), 4)
+      self.assertTrue(store.refreshed is not None)
+      self.assertTrue('changes-since' not in self.nova.servers.searches[0])
+      self.assertEqual(store.count('servers'), 4)
+      self.assertEqual(store.server('vm2').flavor, {'id': '2'})
+      self.assertEqual(getattr(store['vm2'], HOST_ATTR), 'a')
+      self.assertRaises(KeyError, store.__getitem__, 'vm9')
+      self.assertEqual(sorted(s.id for s in store.servers_on_host('a')),
+                       ['vm1', 'vm2'])
+      self.assertEqual(store.flavors()['2'].ram, 4096)
+      self.assertEqual(len(store.hypervisors()), 3)
+      groups = store.server_groups_of('vm3')
+      self.assertEqual(len(groups), 1)
+      self.assertEqual(groups[0].policies, ['anti-affinity'])
+      self.assertEqual(sorted(groups[0].members), ['vm1', 'vm3'])
+      self.assertEqual(store.server_groups_of('vm2'), [])
+
+    def test_incremental_refresh(self):
+      InventoryStore(self.path).refresh(self.nova)
+      # Changes since the last refresh are all that's listed
+      self.nova.servers.items = [
+        server('vm1', 'b', updated='2038-01-01T00:00:00Z'),
+        server('vm2', 'a', status='DELETED', updated='2038-01-01T00:00:00Z'),
+        server('vm5', 'c', updated='2038-01-01T00:00:00Z')]
+      self.nova.server_groups.items[0].members = ['vm1', 'vm3', 'vm5']
+      store = InventoryStore(self.path)
+      self.assertEqual(store.refresh(self.nova), 3)
+      self.assertTrue('changes-since' in self.nova.servers.searches[-1])
+      self.assertEqual(sorted(store.servers()),
+                       ['vm1', 'vm3', 'vm4', 'vm5'])
+      self.assertEqual(store.servers_on_host('a'), [])
+      self.assertEqual(len(store.server_groups_of('vm5')), 1)
+
+    def test_scope_change(self):
+      store = InventoryStore(self.path)
+      store.refresh(self.nova, all_tenants=False)
+      searches = len(self.nova.servers.searches)
+      self.assertRaises(ScopeError, store.refresh, self.nova)
+      self.assertEqual(len(self.nova.servers.searches), searches)
+      # Unless asked to start over
+      store.refresh(self.nova, full=True)
+      self.assertTrue('changes-since' not in self.nova.servers.searches[-1])
+      self.assertEqual(self.nova.servers.searches[-1]['all_tenants'], 1)
+      self.assertRaises(ScopeError, store.refresh, self.nova,
+                        all_tenants=False)
+
+    def test_move_server(self):
+      store = InventoryStore(self.path)
+      store.refresh(self.nova)
+      store.move_server('vm1', 'c')
+      self.assertEqual(getattr(store['vm1'], HOST_ATTR), 'c')
+
+    def test_load_cloud(self):
+      store = InventoryStore(self.path)
+      store.refresh(self.nova)
+      cloud = store.load_cloud()
+      self.assertEqual(len(cloud.hosts), 3)
+      self.assertEqual(len(cloud.vms), 4)
+      placements, stranded = plan_evacuation(cloud, [cloud.host_index['a']])
+      self.assertEqual(stranded, [])
+      # vm1 can't join vm3 on b
+      self.assertEqual(cloud.hosts[placements[cloud.vm_index['vm1']]], 'c')
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.makeSuite(InventoryTestCase))
+
+unittest.TextTestRunner(verbosity=2).run(suite)
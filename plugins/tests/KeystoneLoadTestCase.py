@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import itertools
+import json
+import os
+import re
+import subprocess
+import sys
+import unittest
+import urllib2
+
+
+myPath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
+from keystone_load import *
+from fakestack import FakeCloud, FakeStackServer
+
+
+class KeystoneLoadTestCase(unittest.TestCase):
+
+    def setUp(self):
+      self.server = None
+
+    def start(self, **kwargs):
+      self.cloud = FakeCloud(**kwargs)
+      self.server = FakeStackServer(self.cloud).start()
+
+    def tearDown(self):
+      if self.server:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def authenticate(self):
+      body = json.dumps({'auth': {'tenantName': 'tenant-0',
+                                  'passwordCredentials': {
+                                    'username': 'admin',
+                                    'password': 'secret'}}})
+      request = urllib2.Request(self.server.auth_url + '/tokens', body,
+                                {'Content-Type': 'application/json'})
+      return json.load(urllib2.urlopen(request))['access']['token']['id']
+
+    def validate(self, token):
+      urllib2.urlopen(self.server.auth_url + '/tokens/' + token).read()
+
+    def check(self, *options):
+      """Runs check_keystone --load-test against the fake cloud."""
+      process = subprocess.Popen(
+        [sys.executable, os.path.join(myPath, '..', 'check_keystone'),
+         '--auth_url', self.server.auth_url, '--username', 'admin',
+         '--password', 'secret', '--tenant', 'tenant-0', '--no-admin',
+         '--load-test', '--load-duration', '1', '--load-ramp-up', '0.2',
+         '--load-concurrency', '3', '--load-max-rate', '0'] + list(options),
+        stdout=subprocess.PIPE)
+      return process.communicate()[0], process.returncode
+
+    def fail_requests(self, failing):
+      # With --no-admin, creating the client is the plugin's only request
+      # before the load test
+      count = itertools.count(1)
+      self.cloud.inject = lambda: failing(next(count))
+
+    def perfdata(self, output, label):
+      return float(re.search(r' %s=([0-9.]+)' % label, output).group(1))
+
+    def test_percentile(self):
+      values = range(1, 101)
+      self.assertEqual(percentile(values, 0.5), 51)
+      self.assertEqual(percentile(values, 0.99), 100)
+      self.assertEqual(percentile([3], 0.95), 3)
+      self.assertEqual(percentile([], 0.95), None)
+
+    def test_load(self):
+      self.start(latency=0.01)
+      results = LoadTest(self.authenticate, self.validate, concurrency=4,
+                         duration=1.5, ramp_up=0.4, max_rate=0).run()
+      self.assertEqual(results['errors'], 0)
+      self.assertEqual(results['aborted'], None)
+      self.assertTrue(results['tokens'] > 20)
+      self.assertTrue(abs(results['validations'] - results['tokens']) <= 4)
+      self.assertTrue(results['tokens_per_s'] > 10)
+      self.assertTrue(0.01 <= results['p50'] <= results['p95'] <=
+                      results['p99'])
+      self.assertTrue(results['validate_p95'] >= 0.01)
+      self.assertTrue(1.5 <= results['elapsed'] < 2)
+
+    def test_max_rate(self):
+      self.start()
+      results = LoadTest(self.authenticate, concurrency=8, duration=1,
+                         ramp_up=0, max_rate=20).run()
+      self.assertTrue(results['tokens'] <= 22)
+      self.assertTrue(results['tokens_per_s'] <= 22)
+
+    def test_abort(self):
+      self.start(error_rate=0.8)
+      results = LoadTest(self.authenticate, concurrency=4, duration=10,
+                         ramp_up=0, max_rate=0).run()
+      self.assertTrue(results['elapsed'] < 5)
+      self.assertTrue(results['aborted'].endswith('requests failed'))
+      self.assertTrue(results['error_rate'] > 0.5)
+      self.assertTrue('503' in results['first_error'])
+
+    def test_plugin_ok(self):
+      self.start(latency=0.01)
+      output, code = self.check('--load-validate', '--load-p95-warning', '1')
+      self.assertEqual(code, 0)
+      self.assertTrue(output.startswith('OK: '))
+      self.assertTrue('tokens/s at concurrency 3, p95 0.0' in output)
+      for perfdata in ('errors=0.00%;1;5;0;100', 'p95=0.0',
+                       's;1.0;;0;', 'validations=', 'validate_p95=0.0'):
+        self.assertTrue(perfdata in output, perfdata)
+      self.assertEqual(len(output.splitlines()), 1)
+
+    def test_plugin_p95(self):
+      self.start(latency=0.05)
+      output, code = self.check('--load-p95-warning', '0.02')
+      self.assertEqual(code, 1)
+      self.assertTrue(', p95 above 0.02s |' in output)
+      self.assertTrue(self.perfdata(output, 'p95') >= 0.05)
+      self.assertTrue('s;0.02;;0;' in output)
+      output, code = self.check('--load-p95-warning', '0.02',
+                                '--load-p95-critical', '0.03')
+      self.assertEqual(code, 2)
+      self.assertTrue(', p95 above 0.03s |' in output)
+
+    def test_plugin_errors(self):
+      # One request in ten fails
+      self.start()
+      self.fail_requests(lambda n: n % 10 == 0)
+      output, code = self.check('--load-error-warning', '5',
+                                '--load-error-critical', '20')
+      self.assertEqual(code, 1)
+      self.assertTrue(output.startswith('Failed: '))
+      self.assertTrue(5 <= self.perfdata(output, 'errors') < 20)
+      self.assertTrue(';5.0;20.0;0;100' in output)
+      self.assertFalse('aborted' in output)
+      # Every request but the plugin's own is a token, or an error
+      stats = self.cloud.stats
+      self.assertEqual(stats['requests'] - stats['errors'] - 1,
+                       self.perfdata(output, 'tokens'))
+
+    def test_plugin_abort(self):
+      # Keystone breaks once the plugin has authenticated
+      self.start()
+      self.fail_requests(lambda n: n > 1)
+      output, code = self.check('--load-duration', '10')
+      self.assertEqual(code, 2)
+      self.assertTrue(', aborted, 20 of 20 requests failed, 100.0% errors ('
+                      in output)
+      self.assertTrue(', no token issued |' in output)
+      for perfdata in ('tokens=0;', 'errors=100.00%', 'p50=U', 'p95=U',
+                       'p99=U'):
+        self.assertTrue(perfdata in output, perfdata)
+      self.assertEqual((self.cloud.stats['requests'],
+                        self.cloud.stats['errors']), (21, 20))
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.makeSuite(KeystoneLoadTestCase))
+unittest.TextTestRunner(verbosity=2).run(suite)
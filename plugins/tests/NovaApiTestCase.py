@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+# -*- encoding: utf-8 -*-
 #
 # Copyright © 2012 eNovance <licensing@enovance.com>
 #
@@ -25,7 +26,7 @@ import unittest
 
 
 myPath = os.path.abspath(os.path.dirname(__file__))
-sys.path.append(os.path.abspath(os.path.dirname(__file__)+'/../'))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
 from check_novaapi import *
 
 
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+
+myPath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
+from check_nova_evacuation import *
+from evacuation_journal import EvacuationJournal
+
+
+class Args(object):
+    def __init__(self, journal_dir, hosts=(), max_age=86400):
+        self.journal_dir = journal_dir
+        self.hosts = list(hosts)
+        self.max_age = max_age
+
+
+class NovaEvacuationTestCase(unittest.TestCase):
+
+    def setUp(self):
+      self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+      shutil.rmtree(self.dir)
+
+    def journal(self, host, active, rebuilding=0, failed=0):
+      journal = EvacuationJournal.open(self.dir, host, 3600)
+      journal.started = issued = time.time() - 10
+      for i in range(active):
+        journal.record('a%d' % i, name='a%d' % i, target='t', issued=issued,
+                       status='ACTIVE')
+      for i in range(rebuilding):
+        journal.record('r%d' % i, name='r%d' % i, target='t', issued=issued,
+                       status='REBUILD')
+      for i in range(failed):
+        journal.record('f%d' % i, name='f%d' % i,
+                       error='Failed to get a host.')
+      return journal
+
+    def test_no_evacuation(self):
+      self.assertEqual(check_evacuation(Args(self.dir)), STATE_OK)
+
+    def test_in_progress(self):
+      journal = self.journal('compute-1', 5, rebuilding=5)
+      status = journal.status()
+      self.assertEqual(status['counts']['active'], 5)
+      self.assertTrue(0.4 < status['rate'] < 0.6)
+      self.assertTrue(8 < status['eta'] < 12)
+      journal.write_status()
+      self.assertEqual(check_evacuation(Args(self.dir)), STATE_WARNING)
+
+    def test_worker_died(self):
+      journal = self.journal('compute-1', 5, rebuilding=5)
+      pid = os.fork()
+      if pid == 0:
+        journal.write_status()
+        os._exit(0)
+      os.waitpid(pid, 0)
+      self.assertEqual(check_evacuation(Args(self.dir)), STATE_CRITICAL)
+
+    def test_finished(self):
+      self.journal('compute-1', 5).write_status(finished=True)
+      self.assertEqual(check_evacuation(Args(self.dir)), STATE_OK)
+      self.journal('compute-2', 5, failed=1).write_status(finished=True)
+      self.assertEqual(check_evacuation(Args(self.dir)), STATE_CRITICAL)
+      self.assertEqual(check_evacuation(Args(self.dir, ['compute-1'])),
+                       STATE_OK)
+      self.assertEqual(check_evacuation(Args(self.dir, max_age=-1)),
+                       STATE_OK)
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.makeSuite(NovaEvacuationTestCase))
+
+unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+from datetime import datetime
+from datetime import timedelta
+
+
+myPath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
+from check_nova_services import *
+
+
+###### Test Object ######
+
+class Service(object):
+    def __init__(self, host, binary, state='up', status='enabled', age=5):
+        self.host = host
+        self.binary = binary
+        self.state = state
+        self.status = status
+        self.disabled_reason = None
+        self.updated_at = (datetime.utcnow() - timedelta(seconds=age)) \
+            .strftime('%Y-%m-%dT%H:%M:%S.%f')
+
+class Services(object):
+    def __init__(self, services):
+        self.services = services
+        self.calls = 0
+    def list(self, **kwargs):
+        self.calls += 1
+        return self.services
+
+class NovaTest(object):
+    def __init__(self, services):
+        self.services = Services(services)
+
+class Args(object):
+    binaries = []
+    heartbeat_warning = 30
+    heartbeat_critical = 60
+    disabled_is_warn = False
+    warning = 1
+    critical = 2
+    command_file = None
+    service_description = 'nova-services'
+
+
+class NovaServicesTestCase(unittest.TestCase):
+
+    def test_all_up(self):
+      nova = NovaTest([Service('controller', 'nova-scheduler')] +
+                      [Service('compute-%d' % i, 'nova-compute')
+                       for i in range(1000)])
+      self.assertEqual(check_services(nova, Args()), STATE_OK)
+      self.assertEqual(nova.services.calls, 1)
+
+    def test_host_states(self):
+      services = [Service('a', 'nova-compute'),
+                  Service('b', 'nova-compute', state='down', age=600),
+                  Service('c', 'nova-compute', age=45),
+                  Service('d', 'nova-compute', status='disabled')]
+      hosts = evaluate(services, Args())
+      self.assertEqual(hosts['a'][0], STATE_OK)
+      self.assertEqual(hosts['b'][0], STATE_CRITICAL)
+      self.assertEqual(hosts['c'][0], STATE_WARNING)
+      self.assertEqual(hosts['d'], (STATE_OK, ['nova-compute disabled'], 1))
+      args = Args()
+      args.disabled_is_warn = True
+      self.assertEqual(evaluate(services, args)['d'][0], STATE_WARNING)
+
+    def test_heartbeat(self):
+      service = Service('a', 'nova-compute', age=600)
+      self.assertEqual(service_state(service, 600, Args()),
+                       (STATE_CRITICAL, "nova-compute last seen 600s ago"))
+      service.updated_at = None
+      self.assertEqual(heartbeat_age(service, datetime.utcnow()), None)
+      self.assertEqual(service_state(service, None, Args()),
+                       (STATE_CRITICAL,
+                        "nova-compute has never reported a heartbeat"))
+
+    def test_summary(self):
+      nova = NovaTest([Service('a', 'nova-compute'),
+                       Service('b', 'nova-compute', state='down')])
+      self.assertEqual(check_services(nova, Args()), STATE_WARNING)
+      nova.services.services.append(Service('c', 'nova-compute', age=90))
+      self.assertEqual(check_services(nova, Args()), STATE_CRITICAL)
+
+    def test_binaries(self):
+      nova = NovaTest([Service('a', 'nova-compute'),
+                       Service('a', 'nova-network', state='down'),
+                       Service('b', 'nova-compute', age=45),
+                       Service('b', 'nova-network', status='disabled')])
+      args = Args()
+      args.binaries = ['nova-compute']
+      stdout = sys.stdout
+      sys.stdout = StringIO()
+      try:
+        self.assertEqual(check_services(nova, args), STATE_WARNING)
+        output = sys.stdout.getvalue()
+      finally:
+        sys.stdout = stdout
+      self.assertTrue(output.startswith('WARNING: 1 of 2 hosts failing | '
+                                        'services=2 hosts=2 up=2 down=0 '
+                                        'disabled=0 '), output)
+      self.assertTrue('max_heartbeat_age=45s;' in output, output)
+      nova.services.services[2].updated_at = \
+        nova.services.services[0].updated_at
+      sys.stdout = StringIO()
+      try:
+        check_services(nova, args)
+        output = sys.stdout.getvalue()
+      finally:
+        sys.stdout = stdout
+      self.assertTrue(output.startswith('OK: 2 services up on 2 hosts'),
+                      output)
+
+    def test_passive_results(self):
+      fd, path = tempfile.mkstemp()
+      os.close(fd)
+      args = Args()
+      args.command_file = path
+      nova = NovaTest([Service('a', 'nova-compute'),
+                       Service('a', 'nova-network', state='down'),
+                       Service('b', 'nova-compute')])
+      check_services(nova, args)
+      with open(path) as f:
+        lines = f.read().splitlines()
+      os.unlink(path)
+      self.assertEqual(len(lines), 2)
+      self.assertTrue(lines[0].endswith(
+        'PROCESS_SERVICE_CHECK_RESULT;a;nova-services;2;'
+        'CRITICAL: nova-network is down'))
+      self.assertTrue(lines[1].endswith(
+        'PROCESS_SERVICE_CHECK_RESULT;b;nova-services;0;OK: 1 services up'))
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.makeSuite(NovaServicesTestCase))
+
+unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import sys
+import time
+import unittest
+
+
+myPath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
+from placement import *
+
+
+###### Test Object ######
+
+class Resource(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class Manager(object):
+    def __init__(self, items):
+        self.items = items
+        self.calls = 0
+    def list(self, search_opts=None, **kwargs):
+        self.calls += 1
+        items = self.items
+        search_opts = search_opts or {}
+        if search_opts.get('marker'):
+            ids = [i.id for i in items]
+            items = items[ids.index(search_opts['marker']) + 1:]
+        if search_opts.get('limit'):
+            items = items[:search_opts['limit']]
+        return items
+
+class NovaTest(object):
+    def __init__(self, hosts, vms, groups=()):
+        self.hypervisors = Manager([
+          Resource(hypervisor_hostname=name, state='up', status='enabled',
+                   vcpus=vcpus, vcpus_used=0, memory_mb=ram,
+                   memory_mb_used=0) for name, vcpus, ram in hosts])
+        self.flavors = Manager([Resource(id='1', vcpus=1, ram=1024),
+                                Resource(id='2', vcpus=2, ram=4096)])
+        servers = []
+        for vm_id, host, flavor in vms:
+          server = Resource(id=vm_id, name=vm_id, flavor={'id': flavor})
+          setattr(server, HOST_ATTR, host)
+          servers.append(server)
+        self.servers = Manager(servers)
+        self.server_groups = Manager([
+          Resource(id=gid, policies=[policy], members=members)
+          for gid, policy, members in groups])
+        # Hypervisor stats account for their VMs
+        for hyp in self.hypervisors.items:
+          for server in servers:
+            if getattr(server, HOST_ATTR) == hyp.hypervisor_hostname:
+              flavor = [f for f in self.flavors.items
+                        if f.id == server.flavor['id']][0]
+              hyp.vcpus_used += flavor.vcpus
+              hyp.memory_mb_used += flavor.ram
+
+
+class PlacementTestCase(unittest.TestCase):
+
+    def plan(self, nova, failed):
+      cloud = load_cloud(nova)
+      placements, stranded = plan_evacuation(
+          cloud, [cloud.host_index[h] for h in failed])
+      return (dict((cloud.vms[vm], cloud.hosts[host])
+                   for vm, host in placements.iteritems()),
+              [cloud.vms[vm] for vm in stranded])
+
+    def test_all_placed(self):
+      nova = NovaTest([('a', 4, 8192), ('b', 4, 8192), ('c', 4, 8192)],
+                      [('vm1', 'a', '2'), ('vm2', 'a', '1'), ('vm3', 'b', '1')])
+      placements, stranded = self.plan(nova, ['a'])
+      self.assertEqual(stranded, [])
+      self.assertEqual(sorted(placements), ['vm1', 'vm2'])
+      self.assertTrue('a' not in placements.values())
+
+    def test_stranded(self):
+      nova = NovaTest([('a', 4, 8192), ('b', 2, 4096)],
+                      [('vm1', 'a', '2'), ('vm2', 'a', '2'), ('vm3', 'b', '1')])
+      placements, stranded = self.plan(nova, ['a'])
+      self.assertEqual(len(placements), 0)
+      self.assertEqual(sorted(stranded), ['vm1', 'vm2'])
+
+    def test_affinity_moves_together(self):
+      nova = NovaTest([('a', 8, 16384), ('b', 8, 8192), ('c', 8, 6144)],
+                      [('vm1', 'a', '2'), ('vm2', 'a', '2')],
+                      [('g', 'affinity', ['vm1', 'vm2'])])
+      placements, stranded = self.plan(nova, ['a'])
+      self.assertEqual(placements, {'vm1': 'b', 'vm2': 'b'})
+
+    def test_affinity_joins_survivors(self):
+      nova = NovaTest([('a', 8, 16384), ('b', 8, 16384), ('c', 8, 16384)],
+                      [('vm1', 'a', '1'), ('vm2', 'c', '1')],
+                      [('g', 'affinity', ['vm1', 'vm2'])])
+      placements, stranded = self.plan(nova, ['a'])
+      self.assertEqual(placements, {'vm1': 'c'})
+
+    def test_anti_affinity(self):
+      nova = NovaTest([('a', 8, 16384), ('b', 8, 16384), ('c', 8, 16384),
+                       ('d', 8, 4096)],
+                      [('vm1', 'a', '1'), ('vm2', 'a', '1'), ('vm3', 'b', '1')],
+                      [('g', 'anti-affinity', ['vm1', 'vm2', 'vm3'])])
+      placements, stranded = self.plan(nova, ['a'])
+      self.assertEqual(stranded, [])
+      self.assertEqual(sorted(placements.values()), ['c', 'd'])
+
+    def test_paged_listing(self):
+      nova = NovaTest([('a', 8, 16384)],
+                      [('vm%d' % i, 'a', '1') for i in range(25)])
+      servers = list(list_servers(nova, page_size=10))
+      self.assertEqual(len(servers), 25)
+      self.assertEqual(nova.servers.calls, 3)
+
+    def test_largest_hosts(self):
+      nova = NovaTest([('a', 8, 16384), ('b', 8, 16384), ('c', 8, 16384)],
+                      [('vm1', 'a', '1'), ('vm2', 'b', '2'), ('vm3', 'c', '1'),
+                       ('vm4', 'c', '1')])
+      cloud = load_cloud(nova)
+      self.assertEqual([cloud.hosts[h] for h in largest_hosts(cloud, 2)],
+                       ['b', 'c'])
+
+    def test_scale(self):
+      cloud = Cloud()
+      for h in range(3000):
+        cloud.add_host('host%d' % h, 64, 65536)
+      for v in range(30000):
+        cloud.add_vm('vm%d' % v, 'vm%d' % v, 'host%d' % (v % 3000),
+                     1 + v % 4, 2048 * (1 + v % 4))
+      for g in range(1000):
+        cloud.add_group('g%d' % g, 'anti-affinity' if g % 2 else 'affinity',
+                        ['vm%d' % (g * 30 + i) for i in range(3)])
+      start = time.time()
+      placements, stranded = plan_evacuation(cloud, largest_hosts(cloud, 10))
+      self.assertTrue(time.time() - start < 1)
+      self.assertEqual(len(placements), 100)
+      self.assertEqual(stranded, [])
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.makeSuite(PlacementTestCase))
+
+unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import StringIO
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import urllib2
+
+
+myPath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
+import httptrace
+import ratelimit
+from fakestack import FakeCloud, FakeStackServer
+from utils import PluginOutput
+
+# Three requests from a separate process
+CLIENT = """
+import sys
+sys.path.insert(0, %(path)r)
+import ratelimit
+limiter = ratelimit.RateLimiter(%(dir)r, 10, burst=1)
+for i in range(3):
+    limiter.wait('keystone:5000', '/v2.0/tenants')
+"""
+
+
+class RateLimitTestCase(unittest.TestCase):
+
+    def setUp(self):
+      self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+      ratelimit._limiter = None
+      shutil.rmtree(self.dir)
+
+    def test_bucket(self):
+      limiter = ratelimit.RateLimiter(self.dir, 20, burst=2)
+      dues = [limiter.reserve('keystone:5000', 20) for i in range(4)]
+      self.assertEqual(dues[:2], [0, 0])
+      self.assertAlmostEqual(dues[2], 0.05, places=2)
+      self.assertAlmostEqual(dues[3], 0.1, places=2)
+      # Refilled while idle, up to the burst
+      time.sleep(0.25)
+      self.assertEqual(limiter.reserve('keystone:5000', 20), 0)
+      self.assertEqual(limiter.reserve('keystone:5000', 20), 0)
+      self.assertTrue(limiter.reserve('keystone:5000', 20) > 0)
+
+    def test_auth_bucket(self):
+      limiter = ratelimit.RateLimiter(self.dir, 1, burst=1, auth_rate=100)
+      self.assertEqual(limiter.wait('keystone:5000', '/v2.0/tokens'), 0)
+      self.assertEqual(limiter.wait('keystone:5000', '/v2.0/tenants?limit=1'),
+                       0)
+      self.assertTrue(limiter.wait('keystone:5000', '/v2.0/tokens') <= 0.01)
+      self.assertEqual(sorted(os.listdir(self.dir)),
+                       ['auth-keystone_5000.bucket', 'keystone_5000.bucket'])
+
+    def test_shared_between_processes(self):
+      script = os.path.join(self.dir, 'client.py')
+      with open(script, 'w') as f:
+        f.write(CLIENT % {'path': os.path.join(myPath, '..'),
+                          'dir': self.dir})
+      start = time.time()
+      processes = [subprocess.Popen([sys.executable, script])
+                   for i in range(3)]
+      for process in processes:
+        self.assertEqual(process.wait(), 0)
+      # 9 requests at 10/s, the first one without waiting
+      self.assertTrue(time.time() - start >= 0.75)
+
+    def test_requests(self):
+      server = FakeStackServer(FakeCloud()).start()
+      try:
+        tracer = httptrace.install('test')
+        del tracer.calls[:]
+        limiter = ratelimit.install(
+          ratelimit.RateLimiter(self.dir, 10, burst=1))
+        for i in range(3):
+          urllib2.urlopen(server.url + '/render/?target=x').read()
+      finally:
+        server.shutdown()
+        server.server_close()
+      self.assertTrue(limiter.queued >= 0.15)
+      self.assertEqual(ratelimit.queued(), limiter.queued)
+      # Traced latencies don't include the time queued
+      self.assertTrue(sum(c['latency'] for c in tracer.calls[-3:]) < 0.15)
+
+    def test_perfdata(self):
+      limiter = ratelimit.RateLimiter(self.dir, 10)
+      limiter.queued = 1.5
+      stream = StringIO.StringIO()
+      out = PluginOutput(stream, sys.exit)
+      out.add_line_hook(limiter.annotate)
+      out.write("OK: fine")
+      out.write(" | a=1\n")
+      out.write("long output\n")
+      self.assertEqual(stream.getvalue(),
+                       "OK: fine | a=1 queued=1.500s;;;0;\nlong output\n")
+      stream = StringIO.StringIO()
+      out = PluginOutput(stream, sys.exit)
+      out.add_line_hook(limiter.annotate)
+      out.write("OK")
+      out.close_line()
+      self.assertEqual(stream.getvalue(), "OK | queued=1.500s;;;0;")
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.makeSuite(RateLimitTestCase))
+unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+
+myPath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
+from resultcache import *
+
+# A plugin counting its runs (not the cached ones) in a file
+PLUGIN = """
+import argparse
+import json
+import sys
+import time
+sys.path.insert(0, %(path)r)
+import ratelimit
+import resultcache
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--state', type=int, default=0)
+parser.add_argument('--sleep', type=float, default=0)
+resultcache.add_argument(parser)
+ratelimit.add_argument(parser)
+args = parser.parse_args()
+resultcache.setup('counter', args)
+ratelimit.setup(args)
+with open(%(runs)r, 'a') as f:
+    f.write('x')
+time.sleep(args.sleep)
+print "State %%d | state=%%d" %% (args.state, args.state)
+sys.exit(args.state)
+"""
+
+
+class ResultCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+      self.dir = tempfile.mkdtemp()
+      self.runs = os.path.join(self.dir, 'runs')
+      self.plugin = os.path.join(self.dir, 'plugin.py')
+      with open(self.plugin, 'w') as f:
+        f.write(PLUGIN % {'path': os.path.join(myPath, '..'),
+                          'runs': self.runs})
+
+    def tearDown(self):
+      shutil.rmtree(self.dir)
+
+    def start(self, *args):
+      return subprocess.Popen(
+        [sys.executable, self.plugin,
+         '--cache-dir', os.path.join(self.dir, 'cache')] + list(args),
+        stdout=subprocess.PIPE)
+
+    def run_plugin(self, *args):
+      process = self.start(*args)
+      output = process.communicate()[0]
+      return process.returncode, output
+
+    def count_runs(self):
+      if not os.path.exists(self.runs):
+        return 0
+      with open(self.runs) as f:
+        return len(f.read())
+
+    def test_key(self):
+      parser = argparse.ArgumentParser()
+      parser.add_argument('--host')
+      parser.add_argument('--trace')
+      parser.add_argument('--baseline-dir')
+      add_argument(parser)
+      key = cache_key('check', parser.parse_args(['--host', 'a']))
+      self.assertEqual(key, cache_key('check', parser.parse_args(
+        ['--host', 'a', '--cache-ttl', '60', '--trace', 'x',
+         '--baseline-dir', '/var/lib/baseline'])))
+      self.assertNotEqual(key, cache_key('check', parser.parse_args(
+        ['--host', 'b'])))
+      self.assertNotEqual(key, cache_key('other', parser.parse_args(
+        ['--host', 'a'])))
+
+    def test_hit(self):
+      first = self.run_plugin('--state', '1', '--cache-ttl', '60')
+      self.assertEqual(first, (1, "State 1 | state=1\n"))
+      self.assertEqual(self.run_plugin('--state', '1', '--cache-ttl', '60'),
+                       first)
+      self.assertEqual(self.count_runs(), 1)
+      # Different arguments, different entry
+      self.assertEqual(self.run_plugin('--state', '2', '--cache-ttl', '60'),
+                       (2, "State 2 | state=2\n"))
+      self.assertEqual(self.count_runs(), 2)
+
+    def test_amended_output(self):
+      # Cached as amended by ratelimit, and served without amending again
+      options = ('--cache-ttl', '60', '--rate-limit', '100', '--rate-dir',
+                 os.path.join(self.dir, 'rate'))
+      first = self.run_plugin(*options)
+      self.assertEqual(first, (0, "State 0 | state=0 queued=0.000s;;;0;\n"))
+      self.assertEqual(self.run_plugin(*options), first)
+      self.assertEqual(self.count_runs(), 1)
+
+    def test_disabled_and_expired(self):
+      self.run_plugin()
+      self.run_plugin()
+      self.assertEqual(self.count_runs(), 2)
+      self.run_plugin('--cache-ttl', '60')
+      path = os.path.join(self.dir, 'cache', os.listdir(
+        os.path.join(self.dir, 'cache'))[0].replace('.lock', ''))
+      with open(path) as f:
+        entry = json.load(f)
+      entry['created'] -= 120
+      with open(path, 'w') as f:
+        json.dump(entry, f)
+      self.run_plugin('--cache-ttl', '60')
+      self.assertEqual(self.count_runs(), 4)
+
+    def test_single_refresh(self):
+      processes = [self.start('--sleep', '0.5', '--cache-ttl', '60')
+                   for i in range(4)]
+      for process in processes:
+        self.assertEqual(process.communicate()[0], "State 0 | state=0\n")
+        self.assertEqual(process.returncode, 0)
+      self.assertEqual(self.count_runs(), 1)
+
+    def test_wait_bounded(self):
+      # A poller stuck refreshing doesn't hold the others up for long
+      stuck = self.start('--sleep', '3', '--cache-ttl', '60')
+      while not self.count_runs():
+        time.sleep(0.05)
+      start = time.time()
+      self.assertEqual(self.run_plugin('--cache-ttl', '60', '--cache-wait',
+                                       '0.5'), (0, "State 0 | state=0\n"))
+      self.assertTrue(time.time() - start < 2.5)
+      self.assertEqual(self.count_runs(), 2)
+      # Only the run holding the lock stored its result
+      self.assertEqual(stuck.communicate()[0], "State 0 | state=0\n")
+      self.run_plugin('--cache-ttl', '60')
+      self.assertEqual(self.count_runs(), 2)
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.makeSuite(ResultCacheTestCase))
+unittest.TextTestRunner(verbosity=2).run(suite)
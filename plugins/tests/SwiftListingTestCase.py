@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import StringIO
+import sys
+import unittest
+
+
+myPath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
+from check_swift_listing import *
+from fakestack import FakeCloud, FakeStackServer
+
+
+class SwiftListingTestCase(unittest.TestCase):
+
+    def setUp(self):
+      # 2500 objects, named dir00/ to dir09/
+      self.cloud = FakeCloud(objects=2500)
+      self.server = FakeStackServer(self.cloud).start()
+      self.conn = swift_client.Connection(
+        authurl=self.server.url + '/auth/v1.0', user='test:tester',
+        key='testing', auth_version='1.0', retries=0)
+
+    def tearDown(self):
+      self.server.shutdown()
+      self.server.server_close()
+
+    def args(self, *options):
+      return collect_args().parse_args(
+        ['--auth_url', self.server.url + '/auth/v1.0', '--username',
+         'test:tester', '--password', 'testing', '--container', 'bench'] +
+        list(options))
+
+    def check(self, args):
+      stdout = sys.stdout
+      sys.stdout = StringIO.StringIO()
+      try:
+        state = check_listing(self.conn, args)
+        return state, sys.stdout.getvalue()
+      finally:
+        sys.stdout = stdout
+
+    def test_walk(self):
+      stats = walk(self.conn, 'bench', 1000, 10)
+      self.assertEqual(stats['pages'], 3)
+      self.assertEqual(stats['objects'], 2500)
+      self.assertEqual(len(stats['latencies']), 3)
+      self.assertTrue(stats['complete'])
+
+    def test_page_cap(self):
+      stats = walk(self.conn, 'bench', 1000, 2)
+      self.assertEqual(stats['pages'], 2)
+      self.assertEqual(stats['objects'], 2000)
+      self.assertFalse(stats['complete'])
+
+    def test_delimiter(self):
+      # Pages ending on a pseudo directory resume after it
+      stats = walk(self.conn, 'bench', 3, 10, delimiter='/')
+      self.assertEqual(stats['subdirs'], 10)
+      self.assertEqual(stats['objects'], 0)
+      self.assertEqual(stats['pages'], 4)
+      stats = walk(self.conn, 'bench', 1000, 1, prefix='dir03/')
+      self.assertEqual(stats['objects'], 250)
+
+    def test_check(self):
+      state, output = self.check(self.args('--prefix', 'dir01/'))
+      self.assertEqual(state, STATE_OK)
+      self.assertTrue(output.startswith("OK: container bench, 2500 objects "
+                                        "listed in 3 pages"))
+      for perfdata in ('container_objects=2500;', 'count_difference=0;;;',
+                       'objects_per_s=', 'page_max=', 'delimiter_query=',
+                       'prefix_query='):
+        self.assertTrue(perfdata in output, perfdata)
+
+    def test_count_mismatch(self):
+      # A container server behind on its updates
+      head_container = self.conn.head_container
+      def behind(container):
+        headers = head_container(container)
+        headers['x-container-object-count'] = '2400'
+        return headers
+      self.conn.head_container = behind
+      state, output = self.check(self.args('--count-critical', '50'))
+      self.assertEqual(state, STATE_CRITICAL)
+      self.assertTrue("HEAD counts 2400 objects, listing found 2500" in output)
+      # Only reported as perfdata by default
+      state, output = self.check(self.args())
+      self.assertEqual(state, STATE_OK)
+      self.assertTrue("count_difference=100;;;0;" in output)
+      # Listing only the first pages can't tell
+      state, output = self.check(self.args('--max-pages', '2'))
+      self.assertEqual(state, STATE_OK)
+      self.assertTrue("page cap reached" in output)
+
+    def test_no_count(self):
+      head_container = self.conn.head_container
+      def no_count(container):
+        headers = head_container(container)
+        del headers['x-container-object-count']
+        return headers
+      self.conn.head_container = no_count
+      state, output = self.check(self.args('--count-warning', '1'))
+      self.assertEqual(state, STATE_OK)
+      self.assertTrue("container_objects=U;;;0;" in output)
+      self.assertTrue("count_difference=U;1;;0;" in output)
+
+    def test_slow_listing(self):
+      self.cloud.latency = 0.05
+      state, output = self.check(self.args('--page-warning', '0.04',
+                                           '--page-critical', '10'))
+      self.assertEqual(state, STATE_WARNING)
+      self.assertTrue("slowest listing took" in output)
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.makeSuite(SwiftListingTestCase))
+
+unittest.TextTestRunner(verbosity=2).run(suite)
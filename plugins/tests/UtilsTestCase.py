@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+
+
+myPath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(myPath, '..')))
+from utils import *
+
+
+class UtilsTestCase(unittest.TestCase):
+
+    def setUp(self):
+      self.stream = StringIO.StringIO()
+      self.exits = []
+      self.output = PluginOutput(self.stream, self.exits.append)
+
+    def test_ensure_dir(self):
+      path = os.path.join(tempfile.mkdtemp(), 'a', 'b')
+      try:
+        ensure_dir(path)
+        ensure_dir(path)
+        self.assertTrue(os.path.isdir(path))
+        with open(os.path.join(path, 'file'), 'w'):
+          pass
+        self.assertRaises(OSError, ensure_dir, os.path.join(path, 'file'))
+      finally:
+        shutil.rmtree(os.path.dirname(os.path.dirname(path)))
+
+    def test_hooks(self):
+      results = []
+      self.output.add_line_hook(lambda line: line + ' | a=1')
+      self.output.add_line_hook(lambda line: line + ' b=2')
+      self.output.add_exit_hook(lambda code: max(code, 1))
+      self.output.add_result_hook(lambda output, code:
+                                  results.append((output, code)))
+      self.output.write("OK: fine")
+      # Only the first line is held back
+      self.assertEqual(self.stream.getvalue(), "")
+      self.output.write("\nmore")
+      self.assertEqual(self.stream.getvalue(), "OK: fine | a=1 b=2\nmore")
+      self.output.write(" output\n")
+      self.output.exit(0)
+      self.assertEqual(self.exits, [1])
+      self.assertEqual(results, [("OK: fine | a=1 b=2\nmore output\n", 1)])
+
+    def test_failing_hooks(self):
+      def fail(*args):
+        raise Exception('broken')
+      self.output.add_line_hook(fail)
+      self.output.add_exit_hook(fail)
+      self.output.add_result_hook(fail)
+      stderr = sys.stderr
+      sys.stderr = StringIO.StringIO()
+      try:
+        self.output.write("OK: fine")
+        self.output.exit(0)
+        errors = sys.stderr.getvalue()
+      finally:
+        sys.stderr = stderr
+      # The plugin's own output and code get out regardless
+      self.assertEqual(self.stream.getvalue(), "OK: fine")
+      self.assertEqual(self.exits, [0])
+      self.assertEqual(errors.count('broken'), 3)
+
+    def test_replay(self):
+      self.output.add_line_hook(lambda line: line + ' | a=1')
+      self.output.replay("OK: cached\n", 2)
+      self.assertEqual(self.stream.getvalue(), "OK: cached\n")
+      self.assertEqual(self.exits, [2])
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.makeSuite(UtilsTestCase))
+
+unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Benchmark every plugin end-to-end against the local fakestack server.
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# For each scenario a fresh fake cloud is started, and each plugin is run
+# as a child process against it. We record wall time, number of requests and
+# payload bytes seen by the server, and the peak RSS of the child.
+#
+# Example usage:
+#   ./benchmark.py --output results.json
+#   ./benchmark.py --baseline baseline.json --tolerance 0.2
+#   ./benchmark.py --scenario large --plugin check_glance --save-baseline b.json
+#
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib2
+
+from fakestack import FakeCloud, FakeStackServer
+
+PLUGINS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+EVENTHANDLERS_DIR = os.path.abspath(os.path.join(PLUGINS_DIR, '..',
+                                                 'eventhandlers'))
+
+# name -> keyword arguments for FakeCloud
+SCENARIOS = {
+    'small': {},
+    'large': {'servers': 50000, 'images': 10000, 'tenants': 10000,
+              'hypervisors': 500, 'server_groups': 100, 'objects': 100000},
+    'slow': {'latency': 0.05, 'jitter': 0.05},
+    'flaky': {'error_rate': 0.05},
+}
+
+PLUGINS = ['check_glance', 'check_glance_catalog', 'check_glance_download',
+           'check_graphite', 'check_keystone', 'check_novaapi',
+           'check_nova_services', 'check_swift', 'nova_evacuate_vms']
+
+# Only metrics where bigger is worse are compared against the baseline
+METRICS = ['wall_time', 'requests', 'bytes_in', 'bytes_out', 'max_rss_kb']
+
+
+def _openstack_args(server):
+    return ['--auth_url', server.auth_url, '--username', 'admin',
+            '--password', 'secret', '--tenant', 'tenant-0']
+
+
+def plugin_commands(server):
+    """Command line for each plugin, against the given fake server."""
+    python = sys.executable
+    host, port = server.server_address[:2]
+    return {
+        'check_keystone': [python, os.path.join(PLUGINS_DIR,
+                                                'check_keystone')] +
+        _openstack_args(server),
+        'check_glance': [python, os.path.join(PLUGINS_DIR, 'check_glance.py'),
+                         '--req_count', '5', '--req_images', 'image-1',
+                         'image-2'] + _openstack_args(server),
+        'check_glance_catalog': [python,
+                                 os.path.join(PLUGINS_DIR,
+                                              'check_glance_catalog.py'),
+                                 '--page-size', '500'] +
+        _openstack_args(server),
+        'check_glance_download': [python,
+                                  os.path.join(PLUGINS_DIR,
+                                               'check_glance_download.py'),
+                                  '--image', 'image-1'] +
+        _openstack_args(server),
+        'check_novaapi': [python, os.path.join(PLUGINS_DIR,
+                                               'check_novaapi.py')] +
+        _openstack_args(server),
+        'check_nova_services': [python,
+                                os.path.join(PLUGINS_DIR,
+                                             'check_nova_services.py')] +
+        _openstack_args(server),
+        'check_graphite': [python, os.path.join(PLUGINS_DIR,
+                                                'check_graphite.py'),
+                           '-H', host, '-P', str(port),
+                           '-t', 'collectd.*.load', '--from=-10minutes'],
+        'check_swift': [os.path.join(PLUGINS_DIR, 'check_swift'),
+                        '-A', server.url + '/auth/v1.0', '-U', 'test:tester',
+                        '-K', 'testing', '-V', '1', '-s', '16'],
+        'nova_evacuate_vms': [python, os.path.join(EVENTHANDLERS_DIR,
+                                                   'nova_evacuate_vms.py'),
+                              '--region_name', 'RegionOne',
+                              '--wait-timeout', '5'] +
+        _openstack_args(server) + ['compute-0', '1', 'HARD'],
+    }
+
+
+def run_plugin(command):
+    """Runs a plugin to completion, returning its output and resources."""
+    start = time.time()
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT)
+    output = proc.stdout.read()
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.WEXITSTATUS(status)
+    return {'wall_time': time.time() - start,
+            'exit_code': proc.returncode,
+            'output': output.strip().split('\n')[0],
+            'max_rss_kb': rusage.ru_maxrss}
+
+
+def server_stats(server, reset=False):
+    request = urllib2.Request(server.url + '/__stats__')
+    if reset:
+        request.get_method = lambda: 'DELETE'
+    return json.loads(urllib2.urlopen(request).read())
+
+
+def run_scenario(name, plugins, repeat):
+    """Runs the selected plugins against a fresh fake cloud."""
+    options = dict(SCENARIOS[name])
+    options.setdefault('down_hosts', ['compute-0'])
+    server = FakeStackServer(FakeCloud(**options)).start()
+    results = {}
+    try:
+        commands = plugin_commands(server)
+        for plugin in plugins:
+            samples = []
+            for _ in range(repeat):
+                server_stats(server, reset=True)
+                sample = run_plugin(commands[plugin])
+                stats = server_stats(server)
+                sample.update(requests=stats['requests'],
+                              errors=stats['errors'],
+                              bytes_in=stats['bytes_in'],
+                              bytes_out=stats['bytes_out'])
+                samples.append(sample)
+            # Keep the best run, it is the least noisy
+            results[plugin] = min(samples, key=lambda s: s['wall_time'])
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def compare(results, baseline, tolerance, metrics=METRICS, min_change=0):
+    """Returns a list of regressions of results against baseline.
+
+    Increases of min_change or less are never regressions.
+    """
+    regressions = []
+    for scenario, plugins in sorted(results.iteritems()):
+        for plugin, sample in sorted(plugins.iteritems()):
+            reference = baseline.get(scenario, {}).get(plugin)
+            if not reference:
+                continue
+            for metric in metrics:
+                old, new = reference.get(metric), sample.get(metric)
+                if old is None or new is None:
+                    continue
+                if new > old * (1 + tolerance) and new - old > min_change:
+                    regressions.append((scenario, plugin, metric, old, new))
+    return regressions
+
+
+def collect_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the plugins against a fake OpenStack cloud')
+    parser.add_argument('--scenario', action='append',
+                        choices=sorted(SCENARIOS),
+                        help='Scenario to run (default: all, repeatable)')
+    parser.add_argument('--plugin', action='append', choices=PLUGINS,
+                        help='Plugin to run (default: all, repeatable)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per plugin and scenario, best is kept')
+    parser.add_argument('--output', metavar='FILE',
+                        help='Write the results as json to FILE')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='Compare the results against this baseline')
+    parser.add_argument('--save-baseline', metavar='FILE',
+                        help='Store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative increase before a metric is '
+                        'flagged as a regression (default 0.2)')
+    return parser
+
+
+def main(args):
+    scenarios = args.scenario or sorted(SCENARIOS)
+    plugins = args.plugin or PLUGINS
+
+    results = {}
+    for scenario in scenarios:
+        results[scenario] = run_scenario(scenario, plugins, args.repeat)
+        for plugin in plugins:
+            sample = results[scenario][plugin]
+            print "%-8s %-18s exit=%d wall=%.3fs requests=%d bytes=%d/%d " \
+                "rss=%dKB :: %s" % (scenario, plugin, sample['exit_code'],
+                                    sample['wall_time'], sample['requests'],
+                                    sample['bytes_in'], sample['bytes_out'],
+                                    sample['max_rss_kb'], sample['output'])
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for scenario, plugin, metric, old, new in regressions:
+            print "REGRESSION %s %s %s: %s -> %s" % (scenario, plugin,
+                                                     metric, old, new)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(collect_args().parse_args()))
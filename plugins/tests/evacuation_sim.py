@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Replay compute node failures through the evacuation handler, offline.
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# A synthetic cloud is drawn (see fakenova.py), then each failure (a single
+# host, or a whole rack) is replayed against a fresh copy of it, through
+# nova_evacuate_vms.py's own functions:
+#
+#   handler    each failed host evacuated on its own, as nagios runs it
+#   inventory  the same, with --inventory
+#   coalesced  all the failed hosts planned at once, as with --coalesce-dir
+#
+# For each we report the time spent choosing targets, the nova calls made,
+# the VMs placed and stranded, and the constraints broken (hosts over their
+# overcommit ratios, split affinity groups, anti-affinity members sharing a
+# host). Like benchmark.py, results can be compared against a baseline, so
+# placement regressions fail a CI run.
+#
+# Example usage:
+#   ./evacuation_sim.py --hypervisors 2000 --vms 20000
+#   ./evacuation_sim.py --failure rack --mode coalesced --baseline sim.json
+#
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmark import compare
+from benchmark import EVENTHANDLERS_DIR
+from fakenova import FakeNova
+from fakenova import generate_cloud
+
+sys.path.append(EVENTHANDLERS_DIR)
+import nova_evacuate_vms as handler
+
+FAILURES = ['host', 'rack']
+MODES = ['handler', 'inventory', 'coalesced']
+
+# Only metrics where bigger is worse are compared against the baseline
+METRICS = ['planning_time', 'api_calls', 'stranded', 'violations']
+
+
+class _Log(object):
+    """Stands in for syslog in the handler, keeping the messages."""
+
+    LOG_ERR = 3
+    LOG_WARNING = 4
+    LOG_INFO = 6
+
+    def __init__(self):
+        self.messages = []
+
+    def openlog(self, *args):
+        pass
+
+    def syslog(self, priority, message=None):
+        self.messages.append(message if message is not None else priority)
+
+
+class _Timer(object):
+    """Wraps a function, adding up the time spent in it."""
+
+    def __init__(self, function):
+        self.function = function
+        self.elapsed = 0.0
+
+    def __call__(self, *args, **kwargs):
+        start = time.time()
+        try:
+            return self.function(*args, **kwargs)
+        finally:
+            self.elapsed += time.time() - start
+
+
+def failed_hosts(cloud, failure, seed):
+    """The hosts a failure takes down."""
+    rng = random.Random(seed)
+    if failure == 'host':
+        return [rng.choice(cloud['hosts'])[0]]
+    rack = rng.choice(cloud['hosts'])[3]
+    return [host for host, vcpus, ram, host_rack in cloud['hosts']
+            if host_rack == rack]
+
+
+def handler_args(mode, workdir, args):
+    options = ['--auth_url', 'http://keystone:5000/v2.0', '--username',
+               'admin', '--password', 'secret', '--tenant', 'admin',
+               '--region_name', 'RegionOne', '--wait-timeout', '0',
+               '--cpu-ratio', str(args.cpu_ratio), '--ram-ratio',
+               str(args.ram_ratio)]
+    if mode == 'inventory':
+        options += ['--inventory', os.path.join(workdir, 'inventory.db')]
+    return handler.collect_args().parse_args(
+        options + ['compute-0000', 'DOWN', 'HARD'])
+
+
+def replay(cloud, failed, mode, args):
+    """Evacuates failed from a fresh FakeNova, returns the metrics."""
+    nova = FakeNova(cloud, args.max_limit)
+    nova.fail(failed)
+    down = set(failed)
+    on_failed = [vm_id for vm_id, name, host, flavor in cloud['servers']
+                 if host in down]
+
+    workdir = tempfile.mkdtemp()
+    log = _Log()
+    get_target = _Timer(handler._get_target_host)
+    plan = _Timer(handler.placement.plan_evacuation)
+    saved = (handler.syslog, handler._get_target_host,
+             handler.placement.plan_evacuation)
+    handler.syslog = log
+    handler._get_target_host = get_target
+    handler.placement.plan_evacuation = plan
+    start = time.time()
+    try:
+        options = handler_args(mode, workdir, args)
+        if mode == 'coalesced':
+            handler.evacuate_hosts(nova, failed, options)
+        else:
+            for host in failed:
+                handler.evacuate_host(nova, host, options)
+    finally:
+        elapsed = time.time() - start
+        (handler.syslog, handler._get_target_host,
+         handler.placement.plan_evacuation) = saved
+        shutil.rmtree(workdir)
+
+    stranded = len([vm_id for vm_id in on_failed
+                     if nova.host_of(vm_id) in down])
+    violations = nova.violations(args.cpu_ratio, args.ram_ratio)
+    return {'hosts_failed': len(failed),
+            'vms': len(on_failed),
+            'placed': len(on_failed) - stranded,
+            'stranded': stranded,
+            'violations': sum(violations.itervalues()),
+            'violated': violations,
+            'api_calls': nova.total_calls(),
+            'calls': nova.calls,
+            'planning_time': get_target.elapsed + plan.elapsed,
+            'elapsed': elapsed}
+
+
+def collect_args():
+    parser = argparse.ArgumentParser(
+        description='Replays compute node failures through the evacuation '
+        'handler, against a synthetic cloud')
+    parser.add_argument('--hypervisors', type=int, default=2000,
+                        help='Hypervisors in the cloud (default 2000)')
+    parser.add_argument('--vms', type=int, default=20000,
+                        help='VMs in the cloud (default 20000)')
+    parser.add_argument('--group-fraction', type=float, default=0.1,
+                        help='Share of the VMs in server groups '
+                        '(default 0.1)')
+    parser.add_argument('--hosts-per-rack', type=int, default=20,
+                        help='Hosts failing together in a rack failure '
+                        '(default 20)')
+    parser.add_argument('--cpu-ratio', type=float, default=16.0,
+                        help='vCPU overcommit ratio (default 16)')
+    parser.add_argument('--ram-ratio', type=float, default=1.5,
+                        help='RAM overcommit ratio (default 1.5)')
+    parser.add_argument('--max-limit', type=int, default=1000,
+                        help='nova\'s osapi_max_limit (default 1000)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the cloud and the failures drawn')
+    parser.add_argument('--failure', action='append', choices=FAILURES,
+                        help='Failure to replay (default: all, repeatable)')
+    parser.add_argument('--mode', action='append', choices=MODES,
+                        help='Handler mode (default: all, repeatable)')
+    parser.add_argument('--output', metavar='FILE',
+                        help='Write the results as json to FILE')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='Compare the results against this baseline')
+    parser.add_argument('--save-baseline', metavar='FILE',
+                        help='Store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative increase before a metric is '
+                        'flagged as a regression (default 0.2)')
+    parser.add_argument('--min-change', type=float, default=0.05,
+                        help='Ignore increases this small, so timings of a '
+                        'few milliseconds aren\'t flagged (default 0.05)')
+    return parser
+
+
+def main(args):
+    failures = args.failure or FAILURES
+    modes = args.mode or MODES
+
+    start = time.time()
+    cloud = generate_cloud(args.hypervisors, args.vms, args.group_fraction,
+                           args.hosts_per_rack, cpu_ratio=args.cpu_ratio,
+                           ram_ratio=args.ram_ratio, seed=args.seed)
+    print "cloud: %d hypervisors, %d VMs, %d server groups (%.1fs)" % (
+        len(cloud['hosts']), len(cloud['servers']), len(cloud['groups']),
+        time.time() - start)
+
+    results = {}
+    for failure in failures:
+        failed = failed_hosts(cloud, failure, args.seed)
+        results[failure] = {}
+        for mode in modes:
+            sample = replay(cloud, failed, mode, args)
+            results[failure][mode] = sample
+            print "%-5s %-10s hosts=%d vms=%d placed=%d stranded=%d " \
+                "violations=%d calls=%d planning=%.3fs elapsed=%.3fs" % (
+                    failure, mode, sample['hosts_failed'], sample['vms'],
+                    sample['placed'], sample['stranded'],
+                    sample['violations'], sample['api_calls'],
+                    sample['planning_time'], sample['elapsed'])
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance,
+                                  METRICS, args.min_change)
+        for failure, mode, metric, old, new in regressions:
+            print "REGRESSION %s %s %s: %s -> %s" % (failure, mode, metric,
+                                                     old, new)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(collect_args().parse_args()))
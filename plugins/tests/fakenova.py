@@ -0,0 +1,323 @@
+#
+# In-memory nova client over a synthetic cloud, for offline simulations.
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# generate_cloud() draws a cloud (hypervisors in racks, VMs of a realistic
+# flavor mix, affinity and anti-affinity groups) as plain data, and
+# FakeNova serves it through the subset of the novaclient API used by the
+# evacuation handler, counting every call. Unlike fakestack there is no
+# HTTP, so clouds of tens of thousands of VMs are cheap to replay.
+#
+# Like nova, listings without a limit are capped at max_limit
+# (osapi_max_limit), and evacuate moves a VM at once, so it is ACTIVE on
+# its new host the first time it is looked at.
+#
+
+import calendar
+import random
+import time
+from datetime import datetime
+
+from novaclient import exceptions
+
+HOST_ATTR = 'OS-EXT-SRV-ATTR:hypervisor_hostname'
+SERVICE_HOST_ATTR = 'OS-EXT-SRV-ATTR:host'
+
+# name, vcpus, ram (MB), weight
+FLAVORS = [('m1.tiny', 1, 512, 10),
+           ('m1.small', 1, 2048, 30),
+           ('m1.medium', 2, 4096, 30),
+           ('m1.large', 4, 8192, 20),
+           ('m1.xlarge', 8, 16384, 10)]
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def generate_cloud(hypervisors=100, vms=1000, group_fraction=0.1,
+                   hosts_per_rack=20, host_vcpus=32, host_ram=65536,
+                   cpu_ratio=16.0, ram_ratio=1.5, seed=0):
+    """Draws a cloud, returned as a dict of plain lists.
+
+    group_fraction of the VMs are in server groups of 2 to 4 members, half
+    of them affinity and half anti-affinity, placed as nova would have. VMs
+    which don't fit anywhere are left out, so the cloud may hold fewer than
+    asked for.
+    """
+    rng = random.Random(seed)
+    hosts = ['compute-%04d' % i for i in range(hypervisors)]
+    free_vcpus = dict((host, host_vcpus * cpu_ratio) for host in hosts)
+    free_ram = dict((host, host_ram * ram_ratio) for host in hosts)
+    flavors = [(str(i + 1), name, vcpus, ram)
+               for i, (name, vcpus, ram, weight) in enumerate(FLAVORS)]
+    weights = []
+    for flavor, (name, vcpus, ram, weight) in zip(flavors, FLAVORS):
+        weights.extend([flavor] * weight)
+
+    def fits(host, flavor):
+        return free_vcpus[host] >= flavor[2] and free_ram[host] >= flavor[3]
+
+    def random_host(flavor, avoid=()):
+        for _ in range(20):
+            host = rng.choice(hosts)
+            if host not in avoid and fits(host, flavor):
+                return host
+        return None
+
+    servers = []
+    groups = []
+
+    def add_server(host, flavor):
+        free_vcpus[host] -= flavor[2]
+        free_ram[host] -= flavor[3]
+        vm_id = 'vm-%06d' % len(servers)
+        servers.append((vm_id, 'server-%06d' % len(servers), host,
+                        flavor[0]))
+        return vm_id
+
+    grouped = int(vms * group_fraction)
+    while len(servers) < grouped:
+        size = rng.randint(2, 4)
+        policy = 'affinity' if len(groups) % 2 == 0 else 'anti-affinity'
+        members = []
+        used = []
+        for _ in range(size):
+            flavor = rng.choice(weights)
+            if policy == 'affinity' and used:
+                host = used[0] if fits(used[0], flavor) else None
+            else:
+                host = random_host(flavor, used)
+            if host is None:
+                continue
+            members.append(add_server(host, flavor))
+            used.append(host)
+        if len(members) < 2 and len(servers) < grouped:
+            # Couldn't place a real group, the cloud is full
+            break
+        groups.append(('group-%05d' % len(groups), policy, members))
+
+    while len(servers) < vms:
+        flavor = rng.choice(weights)
+        host = random_host(flavor)
+        if host is None:
+            break
+        add_server(host, flavor)
+
+    return {'hosts': [(host, host_vcpus, host_ram,
+                       'rack-%03d' % (i // hosts_per_rack))
+                      for i, host in enumerate(hosts)],
+            'flavors': flavors,
+            'servers': servers,
+            'groups': groups}
+
+
+class Resource(object):
+    """A novaclient resource: attributes, and an id."""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __repr__(self):
+        return '<%s>' % getattr(self, 'id', getattr(self, 'host', '?'))
+
+
+class _Manager(object):
+
+    def __init__(self, nova, name):
+        self.nova = nova
+        self.name = name
+
+    def _count(self, method):
+        key = '%s.%s' % (self.name, method)
+        self.nova.calls[key] = self.nova.calls.get(key, 0) + 1
+
+
+class _ServerManager(_Manager):
+
+    def list(self, detailed=True, search_opts=None):
+        self._count('list')
+        opts = search_opts or {}
+        nova = self.nova
+        if opts.get('name'):
+            servers = [nova.by_id[vm_id]
+                       for vm_id in nova.by_name.get(opts['name'], ())]
+        elif opts.get('host'):
+            servers = [s for s in nova.servers_list
+                       if getattr(s, SERVICE_HOST_ATTR) == opts['host']]
+        else:
+            servers = nova.servers_list
+        if opts.get('changes-since'):
+            since = calendar.timegm(datetime.strptime(
+                opts['changes-since'], TIME_FORMAT).timetuple())
+            servers = [s for s in servers if s.changed >= since]
+        if opts.get('marker'):
+            after = nova.position[opts['marker']]
+            servers = [s for s in servers if nova.position[s.id] > after]
+        limit = min(int(opts.get('limit') or nova.max_limit), nova.max_limit)
+        return list(servers[:limit])
+
+    def get(self, server):
+        self._count('get')
+        vm_id = getattr(server, 'id', server)
+        if vm_id not in self.nova.by_id:
+            raise exceptions.NotFound(404, "Instance %s could not be found."
+                                      % vm_id)
+        return self.nova.by_id[vm_id]
+
+    def evacuate(self, server, host=None, on_shared_storage=True):
+        self._count('evacuate')
+        self.nova.move(getattr(server, 'id', server), host)
+
+
+class _FlavorManager(_Manager):
+
+    def list(self, *args, **kwargs):
+        self._count('list')
+        return self.nova.flavors_list
+
+    def get(self, flavor_id):
+        self._count('get')
+        for flavor in self.nova.flavors_list:
+            if flavor.id == flavor_id:
+                return flavor
+        raise KeyError(flavor_id)
+
+
+class _HypervisorManager(_Manager):
+
+    def list(self, detailed=True):
+        self._count('list')
+        nova = self.nova
+        return [Resource(id=i, hypervisor_hostname=host,
+                         state='down' if host in nova.down else 'up',
+                         status='enabled', vcpus=vcpus, memory_mb=ram,
+                         vcpus_used=nova.used_vcpus[host],
+                         memory_mb_used=nova.used_ram[host],
+                         running_vms=nova.running[host])
+                for i, (host, vcpus, ram, rack) in enumerate(nova.hosts)]
+
+
+class _ServiceManager(_Manager):
+
+    def list(self, host=None, binary=None):
+        self._count('list')
+        return [Resource(host=name, binary='nova-compute',
+                         state='down' if name in self.nova.down else 'up',
+                         status='enabled')
+                for name, vcpus, ram, rack in self.nova.hosts
+                if (host is None or name == host) and
+                binary in (None, 'nova-compute')]
+
+
+class _ServerGroupManager(_Manager):
+
+    def list(self, all_projects=False):
+        self._count('list')
+        return [Resource(id=group_id, name=group_id, policies=[policy],
+                         members=list(members))
+                for group_id, policy, members in self.nova.groups]
+
+
+class FakeNova(object):
+    """Serves a generate_cloud() cloud through novaclient's API."""
+
+    def __init__(self, cloud, max_limit=1000):
+        self.max_limit = max_limit
+        self.calls = {}
+        self.evacuations = []
+        self.down = set()
+        self.hosts = cloud['hosts']
+        self.groups = cloud['groups']
+        self.flavors_list = [Resource(id=flavor_id, name=name, vcpus=vcpus,
+                                      ram=ram, disk=0)
+                             for flavor_id, name, vcpus, ram
+                             in cloud['flavors']]
+        self.flavor = dict((f.id, f) for f in self.flavors_list)
+
+        self.used_vcpus = dict((host[0], 0) for host in self.hosts)
+        self.used_ram = dict((host[0], 0) for host in self.hosts)
+        self.running = dict((host[0], 0) for host in self.hosts)
+        self.servers_list = []
+        self.by_id = {}
+        self.by_name = {}
+        self.position = {}
+        now = time.time()
+        for vm_id, name, host, flavor_id in cloud['servers']:
+            server = Resource(id=vm_id, name=name, status='ACTIVE',
+                              tenant_id='tenant', flavor={'id': flavor_id},
+                              updated=None, changed=now)
+            setattr(server, HOST_ATTR, host)
+            setattr(server, SERVICE_HOST_ATTR, host)
+            self.position[vm_id] = len(self.servers_list)
+            self.servers_list.append(server)
+            self.by_id[vm_id] = server
+            self.by_name.setdefault(name, []).append(vm_id)
+            self._account(host, flavor_id, 1)
+
+        self.servers = _ServerManager(self, 'servers')
+        self.flavors = _FlavorManager(self, 'flavors')
+        self.hypervisors = _HypervisorManager(self, 'hypervisors')
+        self.services = _ServiceManager(self, 'services')
+        self.server_groups = _ServerGroupManager(self, 'server_groups')
+
+    def _account(self, host, flavor_id, sign):
+        flavor = self.flavor[flavor_id]
+        self.used_vcpus[host] += sign * flavor.vcpus
+        self.used_ram[host] += sign * flavor.ram
+        self.running[host] += sign
+
+    def fail(self, hosts):
+        """Marks hosts (and their nova-compute) down."""
+        self.down.update(hosts)
+
+    def move(self, vm_id, host):
+        server = self.by_id[vm_id]
+        if host not in self.used_vcpus:
+            raise Exception("No such host %s" % host)
+        old = getattr(server, HOST_ATTR)
+        self._account(old, server.flavor['id'], -1)
+        self._account(host, server.flavor['id'], 1)
+        setattr(server, HOST_ATTR, host)
+        setattr(server, SERVICE_HOST_ATTR, host)
+        server.changed = time.time()
+        self.evacuations.append((vm_id, old, host))
+
+    def total_calls(self):
+        return sum(self.calls.itervalues())
+
+    def host_of(self, vm_id):
+        return getattr(self.by_id[vm_id], HOST_ATTR)
+
+    def violations(self, cpu_ratio=16.0, ram_ratio=1.5):
+        """Counts the broken constraints: hosts over capacity, affinity
+        groups split across hosts, anti-affinity members sharing one, and
+        VMs evacuated to a down host."""
+        counts = {'capacity': 0, 'affinity': 0, 'anti_affinity': 0,
+                  'down_target': 0}
+        for host, vcpus, ram, rack in self.hosts:
+            if self.used_vcpus[host] > vcpus * cpu_ratio or \
+                    self.used_ram[host] > ram * ram_ratio:
+                counts['capacity'] += 1
+        for group_id, policy, members in self.groups:
+            hosts = [self.host_of(vm_id) for vm_id in members]
+            if policy == 'affinity' and len(set(hosts)) > 1:
+                counts['affinity'] += 1
+            elif policy == 'anti-affinity' and len(set(hosts)) < len(hosts):
+                counts['anti_affinity'] += 1
+        for vm_id, old, host in self.evacuations:
+            if host in self.down:
+                counts['down_target'] += 1
+        return counts
@@ -0,0 +1,764 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Local stand-in for the OpenStack (Keystone v2, Nova, Glance v1, Swift) and
+# Graphite APIs used by the plugins, for end-to-end tests and benchmarks.
+#
+# Copyright 2014 Catalyst IT.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Example usage:
+#   ./fakestack.py --port 8080 --servers 50000 --images 10000 --latency 0.05
+#
+# Every service is served from the same port, under its own prefix:
+#
+#   /v2.0/...             keystone v2 (tokens, tenants)
+#   /compute/v2/<tenant>  nova
+#   /image/v1/...         glance v1
+#   /render/              graphite
+#   /auth/v1.0            swift tempauth
+#   /object/v1/<account>  swift
+#   /__stats__            request accounting (GET to read, DELETE to reset)
+#
+
+import argparse
+import BaseHTTPServer
+import bisect
+import hashlib
+import json
+import random
+import re
+import socket
+import SocketServer
+import sys
+import threading
+import time
+import urlparse
+from datetime import datetime
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+FLAVORS = [
+    # id, name, vcpus, ram, disk
+    ('1', 'm1.tiny', 1, 512, 1),
+    ('2', 'm1.small', 1, 2048, 20),
+    ('3', 'm1.medium', 2, 4096, 40),
+    ('4', 'm1.large', 4, 8192, 80),
+    ('5', 'm1.xlarge', 8, 16384, 160),
+]
+
+
+def _uuid(kind, n):
+    """Deterministic uuid-looking id, so runs are reproducible."""
+    digest = hashlib.md5('%s-%d' % (kind, n)).hexdigest()
+    return '%s-%s-%s-%s-%s' % (digest[:8], digest[8:12], digest[12:16],
+                               digest[16:20], digest[20:])
+
+
+def _timestamp(ts=None):
+    return datetime.utcfromtimestamp(ts or time.time()).strftime(TIME_FORMAT)
+
+
+def _parse_timestamp(value):
+    value = value.replace('Z', '').split('.')[0]
+    value = value.split('+')[0]
+    dt = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S')
+    return (dt - datetime(1970, 1, 1)).total_seconds()
+
+
+class FakeCloud(object):
+    """In-memory state of the fake cloud.
+
+    The dataset size is fixed at creation time, but servers can be
+    evacuated or deleted through the API, and swift objects created.
+    """
+
+    def __init__(self, servers=10, images=10, tenants=5, hypervisors=4,
+                 server_groups=2, objects=100, image_size=65536,
+                 graphite_points=10, down_hosts=None, latency=0.0,
+                 jitter=0.0, error_rate=0.0, max_limit=1000, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_limit = max_limit
+        self.graphite_points = graphite_points
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.down_hosts = set(down_hosts or [])
+
+        self.tenants = []
+        for i in range(max(tenants, 1)):
+            self.tenants.append({'id': _uuid('tenant', i),
+                                 'name': 'tenant-%d' % i,
+                                 'description': '', 'enabled': True})
+
+        self.flavors = {}
+        for fid, name, vcpus, ram, disk in FLAVORS:
+            self.flavors[fid] = {'id': fid, 'name': name, 'vcpus': vcpus,
+                                 'ram': ram, 'disk': disk, 'swap': '',
+                                 'OS-FLV-EXT-DATA:ephemeral': 0,
+                                 'os-flavor-access:is_public': True,
+                                 'rxtx_factor': 1.0, 'links': []}
+
+        self.hypervisors = []
+        for i in range(max(hypervisors, 1)):
+            name = 'compute-%d' % i
+            self.hypervisors.append({
+                'id': i + 1, 'hypervisor_hostname': name,
+                'hypervisor_type': 'QEMU', 'host_ip': '10.0.%d.%d' %
+                (i / 250, i % 250 + 1),
+                'state': 'down' if name in self.down_hosts else 'up',
+                'status': 'enabled', 'vcpus': 32, 'memory_mb': 131072,
+                'local_gb': 2000, 'service': {'host': name, 'id': i + 1}})
+
+        created = _timestamp(self.started)
+        self.servers = {}
+        self.server_order = []
+        flavor_ids = sorted(self.flavors.keys())
+        for i in range(servers):
+            host = self.hypervisors[i % len(self.hypervisors)]
+            sid = _uuid('server', i)
+            self.servers[sid] = {
+                'id': sid, 'name': 'server-%d' % i, 'status': 'ACTIVE',
+                'tenant_id': self.tenants[i % len(self.tenants)]['id'],
+                'user_id': 'user', 'created': created, 'updated': created,
+                'flavor': {'id': flavor_ids[i % len(flavor_ids)],
+                           'links': []},
+                'image': {'id': _uuid('image', 0), 'links': []},
+                'addresses': {}, 'metadata': {}, 'links': [],
+                'OS-EXT-SRV-ATTR:host': host['hypervisor_hostname'],
+                'OS-EXT-SRV-ATTR:hypervisor_hostname':
+                    host['hypervisor_hostname'],
+                'OS-EXT-STS:vm_state': 'active'}
+            self.server_order.append(sid)
+
+        self.server_groups = []
+        for i in range(server_groups):
+            # affinity members share a host, anti-affinity ones don't
+            policy = 'affinity' if i % 2 == 0 else 'anti-affinity'
+            step = len(self.hypervisors) if policy == 'affinity' else 1
+            members = [self.server_order[n] for n in
+                       range(i * 10, i * 10 + 3 * step, step) if n < servers]
+            self.server_groups.append({'id': _uuid('group', i),
+                                       'name': 'group-%d' % i,
+                                       'policies': [policy],
+                                       'members': members, 'metadata': {}})
+
+        self.image_data = ''.join(chr(i % 251) for i in range(image_size))
+        checksum = hashlib.md5(self.image_data).hexdigest()
+        self.images = []
+        for i in range(images):
+            self.images.append({
+                'id': _uuid('image', i), 'name': 'image-%d' % i,
+                'status': 'active', 'size': image_size, 'checksum': checksum,
+                'is_public': i % 4 != 0, 'owner': self.tenants[
+                    i % len(self.tenants)]['id'],
+                'disk_format': 'qcow2', 'container_format': 'bare',
+                'min_disk': 0, 'min_ram': 0, 'protected': False,
+                'deleted': False, 'deleted_at': None,
+                'created_at': created, 'updated_at': created,
+                'properties': {}})
+
+        # swift: container -> sorted object names, plus object bodies
+        self.containers = {'bench': []}
+        self.objects = {}
+        for i in range(objects):
+            self.containers['bench'].append('dir%02d/obj%07d' % (i % 10, i))
+        self.containers['bench'].sort()
+
+        self.tokens = set()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {'requests': 0, 'errors': 0, 'bytes_in': 0,
+                          'bytes_out': 0, 'services': {}}
+
+    def account(self, service, bytes_in, bytes_out, error):
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['bytes_in'] += bytes_in
+            self.stats['bytes_out'] += bytes_out
+            if error:
+                self.stats['errors'] += 1
+            per = self.stats['services'].setdefault(service, {'requests': 0})
+            per['requests'] += 1
+
+    def inject(self):
+        """Sleeps for the configured latency, returns True to fail."""
+        delay = self.latency
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        return self.error_rate and self.random.random() < self.error_rate
+
+    def new_token(self):
+        token = hashlib.md5('%s-%s' % (time.time(),
+                                       self.random.random())).hexdigest()
+        with self.lock:
+            self.tokens.add(token)
+        return token
+
+    def host_usage(self):
+        usage = {}
+        for server in self.servers.itervalues():
+            if server['status'] == 'DELETED':
+                continue
+            flavor = self.flavors[server['flavor']['id']]
+            used = usage.setdefault(server['OS-EXT-SRV-ATTR:host'],
+                                    [0, 0, 0])
+            used[0] += flavor['vcpus']
+            used[1] += flavor['ram']
+            used[2] += 1
+        return usage
+
+
+def _page(items, query, key='id'):
+    """Applies nova/glance style marker+limit pagination."""
+    marker = query.get('marker')
+    if marker:
+        for i, item in enumerate(items):
+            if item[key] == marker:
+                items = items[i + 1:]
+                break
+        else:
+            items = []
+    limit = query.get('limit')
+    if limit:
+        items = items[:int(limit)]
+    return items
+
+
+class FakeStackHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeStack/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def cloud(self):
+        return self.server.cloud
+
+    # Plumbing
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(';')[0].strip(), 16)
+                if not size:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return ''.join(chunks)
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else ''
+
+    def _dispatch(self, method):
+        url = urlparse.urlparse(self.path)
+        self.query = dict(urlparse.parse_qsl(url.query,
+                                             keep_blank_values=True))
+        self.body = self._read_body()
+        self.sent = 0
+        parts = [p for p in url.path.split('/') if p]
+        service = parts[0] if parts else 'root'
+        if service == '__stats__':
+            return self._stats(method)
+
+        error = self.cloud.inject()
+        if error:
+            self._error(503, 'injected failure')
+        else:
+            route = {'v2.0': self._identity, 'compute': self._compute,
+                     'image': self._image, 'render': self._graphite,
+                     'auth': self._swift_auth, 'object': self._swift,
+                     'root': self._versions}.get(service)
+            try:
+                if route is None:
+                    self._error(404, 'not found')
+                else:
+                    route(method, parts[1:])
+            except KeyError:
+                self._error(404, 'not found')
+        self.cloud.account(service, len(self.body), self.sent, error)
+
+    def _send(self, status, body='', headers=None, content_type=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).iteritems():
+            self.send_header(name, str(value))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+            self.sent += len(body)
+
+    def _json(self, status, data, headers=None):
+        self._send(status, json.dumps(data), headers, 'application/json')
+
+    def _error(self, status, message):
+        # The body keystone and nova send, which their clients parse
+        self._json(status, {'error': {'message': message, 'code': status,
+                                      'title': self.responses[status][0]}})
+
+    def _stats(self, method):
+        if method == 'DELETE':
+            self.cloud.reset_stats()
+        with self.cloud.lock:
+            stats = json.dumps(self.cloud.stats)
+        self._send(200, stats, content_type='application/json')
+
+    def _base_url(self):
+        return 'http://%s:%d' % self.server.server_address[:2]
+
+    def _versions(self, method, parts):
+        self._json(300, {'versions': {'values': [
+            {'id': 'v2.0', 'status': 'stable',
+             'links': [{'rel': 'self', 'href': self._base_url() + '/v2.0/'}]}
+        ]}})
+
+    # Keystone v2
+
+    def _catalog(self, tenant_id):
+        base = self._base_url()
+        entries = [('identity', 'keystone', base + '/v2.0'),
+                   ('compute', 'nova', base + '/compute/v2/' + tenant_id),
+                   ('image', 'glance', base + '/image'),
+                   ('object-store', 'swift',
+                    base + '/object/v1/AUTH_' + tenant_id)]
+        catalog = []
+        for stype, name, url in entries:
+            catalog.append({'type': stype, 'name': name, 'endpoints_links': [],
+                            'endpoints': [{'region': 'RegionOne',
+                                           'publicURL': url,
+                                           'internalURL': url,
+                                           'adminURL': url, 'id': name}]})
+        return catalog
+
+    def _identity(self, method, parts):
+        if parts == ['tokens'] and method == 'POST':
+            auth = json.loads(self.body or '{}').get('auth', {})
+            tenant_name = auth.get('tenantName')
+            tenant = self.cloud.tenants[0]
+            for t in self.cloud.tenants:
+                if t['name'] == tenant_name or t['id'] == auth.get('tenantId'):
+                    tenant = t
+            creds = auth.get('passwordCredentials', {})
+            token = self.cloud.new_token()
+            self._json(200, {'access': {
+                'token': {'id': token, 'issued_at': _timestamp(),
+                          'expires': _timestamp(time.time() + 3600),
+                          'tenant': tenant},
+                'serviceCatalog': self._catalog(tenant['id']),
+                'user': {'id': 'user', 'name': creds.get('username'),
+                         'username': creds.get('username'),
+                         'roles': [{'name': 'admin'}], 'roles_links': []},
+                'metadata': {'is_admin': 0, 'roles': []}}})
+        elif parts[:1] == ['tokens'] and len(parts) == 2:
+            if parts[1] not in self.cloud.tokens:
+                return self._error(404, 'token not found')
+            self._json(200, {'access': {'token': {'id': parts[1]},
+                                        'user': {'id': 'user'}}})
+        elif parts == ['tenants']:
+            self._json(200, {'tenants': _page(self.cloud.tenants, self.query),
+                             'tenants_links': []})
+        elif parts[:1] == ['tenants'] and len(parts) == 2:
+            for tenant in self.cloud.tenants:
+                if tenant['id'] == parts[1]:
+                    return self._json(200, {'tenant': tenant})
+            self._error(404, 'tenant not found')
+        else:
+            self._error(404, 'not found')
+
+    # Nova
+
+    def _list_servers(self, detailed):
+        cloud = self.cloud
+        query = self.query
+        since = query.get('changes-since')
+        since = _parse_timestamp(since) if since else None
+        name = re.compile(query['name']) if query.get('name') else None
+        result = []
+        for sid in cloud.server_order:
+            server = cloud.servers[sid]
+            if since is not None:
+                if _parse_timestamp(server['updated']) < since:
+                    continue
+            elif server['status'] == 'DELETED':
+                continue
+            if query.get('host') and \
+                    server['OS-EXT-SRV-ATTR:host'] != query['host']:
+                continue
+            if name and not name.search(server['name']):
+                continue
+            result.append(server)
+        result = _page(result, query)[:cloud.max_limit]
+        if not detailed:
+            result = [{'id': s['id'], 'name': s['name'], 'links': []}
+                      for s in result]
+        return result
+
+    def _compute(self, method, parts):
+        cloud = self.cloud
+        parts = parts[2:]  # strip v2/<tenant>
+        resource = parts[0] if parts else ''
+        if resource == 'servers':
+            if len(parts) == 1 or parts[1] == 'detail':
+                return self._json(200, {'servers': self._list_servers(
+                    len(parts) > 1)})
+            server = cloud.servers[parts[1]]
+            if method == 'DELETE':
+                server['status'] = 'DELETED'
+                server['updated'] = _timestamp()
+                return self._send(204)
+            if len(parts) == 3 and parts[2] == 'action':
+                action = json.loads(self.body or '{}')
+                if 'evacuate' in action:
+                    target = action['evacuate'].get('host')
+                    server['OS-EXT-SRV-ATTR:host'] = target
+                    server['OS-EXT-SRV-ATTR:hypervisor_hostname'] = target
+                    server['status'] = 'ACTIVE'
+                    server['updated'] = _timestamp()
+                    return self._json(200, {'adminPass': 'secret'})
+                return self._send(202)
+            return self._json(200, {'server': server})
+        if resource == 'flavors':
+            flavors = [cloud.flavors[k] for k in sorted(cloud.flavors)]
+            if len(parts) == 2 and parts[1] != 'detail':
+                return self._json(200, {'flavor': cloud.flavors[parts[1]]})
+            if len(parts) == 1:
+                flavors = [{'id': f['id'], 'name': f['name'], 'links': []}
+                           for f in flavors]
+            return self._json(200, {'flavors': flavors})
+        if resource == 'images':
+            images = _page(cloud.images, self.query)[:cloud.max_limit]
+            return self._json(200, {'images': [
+                {'id': i['id'], 'name': i['name'], 'status': 'ACTIVE',
+                 'links': []} for i in images]})
+        if resource == 'os-security-groups':
+            return self._json(200, {'security_groups': [
+                {'id': 1, 'name': 'default', 'description': 'default',
+                 'tenant_id': cloud.tenants[0]['id'], 'rules': []}]})
+        if resource == 'os-hypervisors':
+            usage = cloud.host_usage()
+            result = []
+            for hyp in cloud.hypervisors:
+                used = usage.get(hyp['hypervisor_hostname'], [0, 0, 0])
+                hyp = dict(hyp, vcpus_used=used[0], memory_mb_used=used[1],
+                           running_vms=used[2], local_gb_used=0,
+                           free_ram_mb=hyp['memory_mb'] - used[1])
+                result.append(hyp)
+            if len(parts) == 1:
+                result = [{'id': h['id'], 'state': h['state'],
+                           'status': h['status'],
+                           'hypervisor_hostname': h['hypervisor_hostname']}
+                          for h in result]
+            return self._json(200, {'hypervisors': result})
+        if resource == 'os-services':
+            return self._json(200, {'services': self._services()})
+        if resource == 'os-server-groups':
+            return self._json(200, {'server_groups': cloud.server_groups})
+        self._error(404, 'not found')
+
+    def _services(self):
+        cloud = self.cloud
+        now = _timestamp()
+        services = [{'id': 1, 'binary': 'nova-scheduler',
+                     'host': 'controller', 'zone': 'internal',
+                     'status': 'enabled', 'state': 'up', 'updated_at': now,
+                     'disabled_reason': None}]
+        for hyp in cloud.hypervisors:
+            services.append({'id': hyp['id'] + 1, 'binary': 'nova-compute',
+                             'host': hyp['hypervisor_hostname'],
+                             'zone': 'nova', 'status': 'enabled',
+                             'state': hyp['state'], 'disabled_reason': None,
+                             'updated_at': now if hyp['state'] == 'up' else
+                             _timestamp(cloud.started - 600)})
+        host = self.query.get('host')
+        binary = self.query.get('binary')
+        return [s for s in services if (not host or s['host'] == host) and
+                (not binary or s['binary'] == binary)]
+
+    # Glance v1
+
+    def _image_headers(self, image):
+        headers = {}
+        for key, value in image.iteritems():
+            if key == 'properties':
+                for pkey, pvalue in value.iteritems():
+                    headers['x-image-meta-property-%s' % pkey] = pvalue
+            elif value is not None:
+                headers['x-image-meta-%s' % key.replace('_', '-')] = value
+        return headers
+
+    def _image(self, method, parts):
+        cloud = self.cloud
+        parts = parts[1:]  # strip v1
+        if parts == ['images'] or parts == ['images', 'detail']:
+            images = cloud.images
+            # glance v1 doesn't filter on owner, glanceclient does
+            for key in ('name', 'status'):
+                if key in self.query:
+                    images = [i for i in images if i[key] == self.query[key]]
+            if self.query.get('is_public', 'none').lower() != 'none':
+                public = self.query['is_public'].lower() == 'true'
+                images = [i for i in images if i['is_public'] == public]
+            # Pages are capped like glance's api_limit_max
+            images = _page(images, self.query)[:cloud.max_limit]
+            return self._json(200, {'images': images})
+        if len(parts) == 2 and parts[0] == 'images':
+            for image in cloud.images:
+                if image['id'] == parts[1]:
+                    break
+            else:
+                return self._error(404, 'image not found')
+            headers = self._image_headers(image)
+            if method == 'HEAD':
+                return self._send(200, '', headers)
+            headers['Content-MD5'] = image['checksum']
+            return self._send(200, cloud.image_data, headers,
+                              'application/octet-stream')
+        self._error(404, 'not found')
+
+    # Graphite
+
+    def _graphite(self, method, parts):
+        now = int(time.time())
+        points = [[float(i), now - 60 * (self.cloud.graphite_points - i)]
+                  for i in range(self.cloud.graphite_points)]
+        self._json(200, [{'target': self.query.get('target', ''),
+                          'datapoints': points}])
+
+    # Swift
+
+    def _swift_auth(self, method, parts):
+        token = self.cloud.new_token()
+        url = '%s/object/v1/AUTH_%s' % (self._base_url(),
+                                        self.cloud.tenants[0]['id'])
+        self._send(200, '', {'X-Storage-Url': url, 'X-Auth-Token': token,
+                             'X-Storage-Token': token})
+
+    def _listing(self, names):
+        query = self.query
+        prefix = query.get('prefix', '')
+        delimiter = query.get('delimiter')
+        marker = query.get('marker')
+        end_marker = query.get('end_marker')
+        limit = min(int(query.get('limit') or 10000), 10000)
+        if marker and marker >= prefix:
+            i = bisect.bisect_right(names, marker)
+        else:
+            i = bisect.bisect_left(names, prefix)
+        listing = []
+        while i < len(names) and len(listing) < limit:
+            name = names[i]
+            if not name.startswith(prefix) or \
+                    (end_marker and name >= end_marker):
+                break
+            rest = name[len(prefix):]
+            if delimiter and delimiter in rest:
+                subdir = prefix + rest[:rest.index(delimiter) + 1]
+                # Like swift, the subdir the last page ended on isn't
+                # listed again
+                if subdir != marker:
+                    listing.append({'subdir': subdir})
+                i = bisect.bisect_left(names, subdir[:-1] +
+                                       chr(ord(delimiter) + 1))
+                continue
+            listing.append(name)
+            i += 1
+        return listing
+
+    def _object_entry(self, container, name):
+        body = self.cloud.objects.get((container, name))
+        size = len(body) if body is not None else 1024
+        modified = datetime.utcfromtimestamp(self.cloud.started)
+        return {'name': name, 'bytes': size, 'content_type':
+                'application/octet-stream', 'last_modified':
+                modified.strftime('%Y-%m-%dT%H:%M:%S.%f'),
+                'hash': hashlib.md5(body or name).hexdigest()}
+
+    def _swift(self, method, parts):
+        cloud = self.cloud
+        parts = parts[2:]  # strip v1/<account>
+        as_json = self.query.get('format') == 'json'
+        if not parts:
+            count = sum(len(v) for v in cloud.containers.itervalues())
+            headers = {'X-Account-Container-Count': len(cloud.containers),
+                       'X-Account-Object-Count': count,
+                       'X-Account-Bytes-Used': count * 1024}
+            names = self._listing(sorted(cloud.containers))
+            if as_json:
+                listing = [n if isinstance(n, dict) else
+                           {'name': n, 'count': len(cloud.containers[n]),
+                            'bytes': len(cloud.containers[n]) * 1024}
+                           for n in names]
+                return self._json(200, listing, headers)
+            return self._send(200, ''.join(n + '\n' for n in names), headers,
+                              'text/plain')
+        container = parts[0]
+        name = '/'.join(parts[1:])
+        if not name:
+            if method == 'PUT':
+                cloud.containers.setdefault(container, [])
+                return self._send(201)
+            names = cloud.containers[container]
+            if method == 'DELETE':
+                del cloud.containers[container]
+                return self._send(204)
+            headers = {'X-Container-Object-Count': len(names),
+                       'X-Container-Bytes-Used': len(names) * 1024}
+            if method == 'HEAD':
+                return self._send(204, '', headers)
+            listing = self._listing(names)
+            if as_json:
+                listing = [n if isinstance(n, dict) else
+                           self._object_entry(container, n) for n in listing]
+                return self._json(200, listing, headers)
+            listing = [n['subdir'] if isinstance(n, dict) else n
+                       for n in listing]
+            return self._send(200, ''.join(n + '\n' for n in listing),
+                              headers, 'text/plain')
+        names = cloud.containers[container]
+        if method == 'PUT':
+            with cloud.lock:
+                cloud.objects[(container, name)] = self.body
+                index = bisect.bisect_left(names, name)
+                if index == len(names) or names[index] != name:
+                    names.insert(index, name)
+            return self._send(201, '', {'Etag': hashlib.md5(
+                self.body).hexdigest()})
+        index = bisect.bisect_left(names, name)
+        if index == len(names) or names[index] != name:
+            return self._send(404, 'Not Found')
+        if method == 'DELETE':
+            with cloud.lock:
+                names.pop(index)
+                cloud.objects.pop((container, name), None)
+            return self._send(204)
+        body = cloud.objects.get((container, name))
+        if body is None:
+            body = 'x' * 1024
+        self._send(200, body, {'Etag': hashlib.md5(body).hexdigest(),
+                               'X-Timestamp': '%.5f' % cloud.started},
+                   'application/octet-stream')
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_HEAD(self):
+        self._dispatch('HEAD')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+class FakeStackServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, cloud, host='127.0.0.1', port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port),
+                                           FakeStackHandler)
+        self.cloud = cloud
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address[:2]
+
+    @property
+    def auth_url(self):
+        return self.url + '/v2.0'
+
+    def handle_error(self, request, client_address, exc_info=sys.exc_info,
+                     socket_error=socket.error):
+        # Clients hanging up early (e.g. sampling an image) are expected.
+        # Daemon handler threads can still be failing while the interpreter
+        # shuts down and sets module globals to None, hence the names bound
+        # at import, and nothing reported once sys is gone.
+        if sys is None or isinstance(exc_info()[1], socket_error):
+            return
+        BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+    def start(self):
+        """Serves requests from a daemon thread, returns self."""
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+def collect_args():
+    parser = argparse.ArgumentParser(
+        description='Serves a fake OpenStack/Graphite/Swift API locally')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8080,
+                        help='Port to listen on')
+    parser.add_argument('--servers', type=int, default=10,
+                        help='Number of nova servers')
+    parser.add_argument('--images', type=int, default=10,
+                        help='Number of glance images')
+    parser.add_argument('--tenants', type=int, default=5,
+                        help='Number of keystone tenants')
+    parser.add_argument('--hypervisors', type=int, default=4,
+                        help='Number of nova hypervisors')
+    parser.add_argument('--server-groups', type=int, default=2,
+                        help='Number of nova server groups')
+    parser.add_argument('--objects', type=int, default=100,
+                        help='Number of objects in the "bench" container')
+    parser.add_argument('--image-size', type=int, default=65536,
+                        help='Size in bytes of each image data')
+    parser.add_argument('--down-host', action='append', default=[],
+                        help='Hypervisor to report as down (repeatable)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Random extra seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of requests answered with a 503')
+    parser.add_argument('--max-limit', type=int, default=1000,
+                        help='Page size cap of nova and glance listings '
+                        '(osapi_max_limit, api_limit_max)')
+    return parser
+
+
+if __name__ == '__main__':
+    args = collect_args().parse_args()
+    cloud = FakeCloud(servers=args.servers, images=args.images,
+                      tenants=args.tenants, hypervisors=args.hypervisors,
+                      server_groups=args.server_groups, objects=args.objects,
+                      image_size=args.image_size, down_hosts=args.down_host,
+                      latency=args.latency, jitter=args.jitter,
+                      error_rate=args.error_rate, max_limit=args.max_limit)
+    server = FakeStackServer(cloud, args.host, args.port)
+    print "Serving on %s (auth_url %s)" % (server.url, server.auth_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
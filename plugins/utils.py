@@ -1,5 +1,9 @@
 import argparse
+import atexit
+import errno
 import os
+import sys
+import tempfile
 
 class EnvDefault(argparse.Action):
     def __init__(self, envvar, required=False, default=None, **kwargs):
@@ -13,3 +17,138 @@ class EnvDefault(argparse.Action):
 
     def __call__(self, parser, namespace, values, option_string=None):
         setattr(namespace, self.dest, values)
+
+
+def write_atomic(path, data):
+    """Writes data to path so readers never see a partial file."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                               prefix='.%s.' % os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.rename(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+def ensure_dir(path):
+    """Creates directory path, unless it exists or another process creates
+    it meanwhile."""
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+
+
+def _hook_failed(e):
+    sys.stderr.write("Plugin output hook failed :: %s\n" % e)
+
+
+class PluginOutput(object):
+    """Stands in for sys.stdout and sys.exit() in a plugin, so the modules
+    amending its output (ratelimit, baseline) or keeping it (resultcache)
+    each register hooks here instead of wrapping stdout in turn.
+
+    The first line, the status and its perfdata, is held until complete
+    and passed through the line hooks, hook(line) -> line; the rest of the
+    output is written straight through. sys.exit() passes the code through
+    the exit hooks, hook(code) -> code, then hands the final output and
+    code to the result hooks, hook(output, code). A failing hook is
+    skipped, so the plugin's own output and code always get out.
+    """
+
+    def __init__(self, stream, exit):
+        self.stream = stream
+        self.real_exit = exit
+        self.line_hooks = []
+        self.exit_hooks = []
+        self.result_hooks = []
+        self.pending = ''
+        self.done = False
+        self.written = []
+
+    def add_line_hook(self, hook):
+        self.line_hooks.append(hook)
+
+    def add_exit_hook(self, hook):
+        self.exit_hooks.append(hook)
+
+    def add_result_hook(self, hook):
+        self.result_hooks.append(hook)
+
+    def _write(self, data):
+        self.stream.write(data)
+        self.written.append(data)
+
+    def write(self, data):
+        if self.done:
+            return self._write(data)
+        self.pending += data
+        if '\n' in self.pending:
+            line, rest = self.pending.split('\n', 1)
+            self.pending = ''
+            self.done = True
+            self._write("%s\n%s" % (self.status_line(line), rest))
+            # So it gets out even if the plugin is killed later on
+            self.stream.flush()
+
+    def status_line(self, line):
+        for hook in self.line_hooks:
+            try:
+                line = hook(line)
+            except Exception as e:
+                _hook_failed(e)
+        return line
+
+    def close_line(self):
+        """Writes the first line out, even without its newline."""
+        if not self.done and self.pending:
+            self.done = True
+            self._write(self.status_line(self.pending))
+        self.stream.flush()
+
+    def exit(self, code=0):
+        self.close_line()
+        for hook in self.exit_hooks:
+            try:
+                code = hook(code)
+            except Exception as e:
+                _hook_failed(e)
+        self.stream.flush()
+        output = ''.join(self.written)
+        for hook in self.result_hooks:
+            try:
+                hook(output, code)
+            except Exception as e:
+                _hook_failed(e)
+        self.real_exit(code)
+
+    def replay(self, output, code):
+        """Writes output and exits with code, as they are: for results
+        kept from an earlier run."""
+        self.stream.write(output)
+        self.stream.flush()
+        self.real_exit(code)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+_output = None
+
+
+def plugin_output():
+    """The PluginOutput of this process, installed on first use."""
+    global _output
+    if _output is None:
+        _output = PluginOutput(sys.stdout, sys.exit)
+        sys.stdout = _output
+        sys.exit = _output.exit
+        # Plugins returning without sys.exit() still get their line out
+        atexit.register(_output.close_line)
+    return _output